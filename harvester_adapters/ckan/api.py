@@ -1,10 +1,85 @@
 import os
 import json
 import base64
-import requests
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from slugify import slugify
-from datapackage import Package, Resource
+from harvesters.errors import truncate
 from harvesters.logs import logger
+from harvesters.metrics import metrics
+from harvester_adapters.ckan.cache import TTLCache
+from harvester_adapters.ckan.package_diff import diff_package
+
+
+def solr_quote(value):
+    """ quoted Solr term """
+    value = str(value).replace('\\', '\\\\').replace('"', '\\"')
+    return f'"{value}"'
+
+
+def package_value(package, field):
+    """ value of a package field. "extras_*" fields are read from extras """
+    if field.startswith('extras_'):
+        key = field[len('extras_'):]
+        for extra in package.get('extras', []):
+            if extra['key'] == key:
+                return extra['value']
+        return None
+    return package.get(field)
+
+
+def solr_timestamp(value):
+    """ CKAN metadata_modified as Solr indexes it: milliseconds and Z
+        2019-10-01T12:34:56.123456 -> 2019-10-01T12:34:56.123Z """
+    value = value.rstrip('Z')
+    if '.' in value:
+        value, fraction = value.split('.', 1)
+        value = '{}.{}'.format(value, fraction[:3])
+    return value + 'Z'
+
+
+def keyset_filter(metadata_modified, package_id):
+    """ fq for packages after (metadata_modified, id) sorting by "metadata_modified asc, id asc" """
+    ts = solr_timestamp(metadata_modified)
+    return ('+(metadata_modified:{{{ts} TO *] OR '
+            '(metadata_modified:"{ts}" AND id:{{{package_id} TO *]))').format(ts=ts, package_id=solr_quote(package_id))
+
+
+def record_value(record, field):
+    """ value of a field from a full package, a "fl" result or a PackageRecord """
+    if isinstance(record, dict):
+        if field in record:
+            return record[field]
+        return package_value(record, field)
+    name = field[len('extras_'):] if field.startswith('extras_') else field
+    return getattr(record, name, None)
+
+
+@lru_cache(maxsize=64)
+def record_type(fields):
+    """ namedtuple for a tuple of fields.
+        "extras_*" fields are named without the prefix: extras_identifier -> identifier """
+    names = [f[len('extras_'):] if f.startswith('extras_') else f for f in fields]
+    return namedtuple('PackageRecord', names)
+
+
+def package_record(package, fields):
+    """ compact record with just the requested fields.
+        Works with "fl" results (extras at the first level) and with full packages """
+    values = [record_value(package, field) for field in fields]
+    return record_type(fields)(*values)
+
+
+def fields_params(fields):
+    """ "fl" param for package_search.
+        CKAN expects a list and splits single strings, so we always send more than one field """
+    fl = list(fields)
+    if 'id' not in fl:
+        fl.append('id')
+    if len(fl) == 1:
+        fl.append('name')
+    return fl
 
 
 class CKANPortalAPI:
@@ -18,8 +93,12 @@ class CKANPortalAPI:
     package_search_url = '/api/3/action/package_search'  # iterate with start and rows GET params
     package_create_url = '/api/3/action/package_create'
     package_update_url = '/api/3/action/package_update'
+    package_patch_url = '/api/3/action/package_patch'
+    package_revise_url = '/api/3/action/package_revise'  # CKAN >= 2.9
     package_delete_url = '/api/3/action/package_delete'
     package_show_url = '/api/3/action/package_show'
+    dataset_purge_url = '/api/3/action/dataset_purge'
+    bulk_update_delete_url = '/api/3/action/bulk_update_delete'
     organization_create_url = '/api/3/action/organization_create'
     organization_update_url = '/api/3/action/organization_update'
     organization_show_url = '/api/3/action/organization_show'
@@ -29,10 +108,13 @@ class CKANPortalAPI:
     user_show_url = '/api/3/action/user_show'
     package_list = []
     total_packages = 0
+    name_allocator = None  # NameAllocator for unique harvest source names
 
-    def __init__(self, base_url='https://catalog.data.gov', api_key=None):  # default data.gov
+    def __init__(self, base_url='https://catalog.data.gov', api_key=None,  # default data.gov
+                 cache=None):  # TTLCache for organizations, members and users
         self.base_url = base_url
         self.api_key = api_key
+        self.cache = TTLCache() if cache is None else cache
 
     def get_request_headers(self, include_api_key=False):
         headers = {'User-Agent': f'{self.user_agent} {self.version}'}
@@ -41,154 +123,236 @@ class CKANPortalAPI:
             headers['X-CKAN-API-Key'] = self.api_key
         return headers
 
+    def request(self, action, method, url, **kwargs):
+        """ HTTP request to the CKAN API.
+            Latency is measured by action and status code """
+        import requests
+
+        with metrics.timer('ckan_api_seconds', action=action) as labels:
+            if method == 'POST':
+                req = requests.post(url, **kwargs)
+            else:
+                req = requests.get(url, **kwargs)
+            labels['status'] = req.status_code
+        metrics.inc('ckan_api_requests', action=action, status=req.status_code)
+        return req
+
     def search_harvest_packages(self,
                                 rows=1000,
                                 method='POST',  # POST work in CKAN 2.8, fails in 2.3
                                 harvest_source_id=None,  # just one harvest source
                                 harvest_type=None,  # harvest for harvest sources
-                                source_type=None):
+                                source_type=None,
+                                fields=None,  # list of fields to get compact records instead of full packages
+                                pagination='offset'):  # 'offset' | 'keyset'
         """ search harvested packages or harvest sources
             "rows" is the page size.
-            You could search for an specific harvest_source_id """
-
-        start = 0
-        sort = "metadata_modified desc"
-
-        url = '{}{}'.format(self.base_url, self.package_search_url)
-        page = 0
-        # TODO check for a real paginated version
-        while url:
-            page += 1
-
-            params = {'start': start, 'rows': rows}  # , 'sort': sort}
-            if harvest_source_id is not None:
-                # our new extra is working
-                params['fq'] = f'+harvest_ng_source_id:"{harvest_source_id}"'
-
-            elif harvest_type is not None:
-                # at my local instance I need this.
-                # I not sure why, in another public instances is not needed
-                params['fq'] = f'+dataset_type:{harvest_type}'
-                if source_type is not None:
-                    params['q'] = f'(type:{harvest_type} source_type:{source_type})'
-                else:
-                    params['q'] = f'(type:{harvest_type})'
-
-            logger.info(f'Searching {url} PAGE:{page} start:{start}, rows:{rows} with params: {params}')
-
-            headers = self.get_request_headers()
-            try:
-                logger.info(f'Search harvest packages via {method}')
-                if method == 'POST':  # depend on CKAN version
-                    req = requests.post(url, data=params, headers=headers)
-                else:
-                    req = requests.get(url, params=params, headers=headers)
-
-            except Exception as e:
-                error = 'ERROR Donwloading package list: {} [{}]'.format(url, e)
-                raise ValueError('Failed to get package list at {}'.format(url))
-
-            content = req.content
-
-            if req.status_code >= 400:
-                error = ('ERROR searching CKAN package: {}'
-                         '\n\t Status code: {}'
-                         '\n\t Params: {}'
-                         '\n\t content:{}'.format(url, req.status_code, params, content))
-                logger.error(error)
-                raise Exception(error)
-
-            try:
-                json_content = json.loads(content)  # check for encoding errors
-            except Exception as e:
-                error = 'ERROR parsing JSON data: {} [{}]'.format(content, e)
-                raise ValueError(error)
-
-            if not json_content['success']:
-                error = 'API response failed: {}'.format(json_content.get('error', None))
-                raise ValueError(error)
-
-            result = json_content['result']
-            count_results = result['count']
-            sort_results = result['sort']
-            facet_results = result['facets']
-            results = result['results']
-            real_results_count = len(results)
-            self.total_packages += real_results_count
-            logger.info(f'{real_results_count} results')
-
-            if real_results_count == 0:
-                url = None
+            You could search for an specific harvest_source_id
+            With "fields" (e.g. ['id', 'name', 'metadata_modified', 'extras_identifier'])
+            each page is a list of PackageRecord namedtuples
+            See search_pages for pagination """
+
+        params = {}
+        if harvest_source_id is not None:
+            # our new extra is working
+            params['fq'] = f'+harvest_ng_source_id:"{harvest_source_id}"'
+
+        elif harvest_type is not None:
+            # at my local instance I need this.
+            # I not sure why, in another public instances is not needed
+            params['fq'] = f'+dataset_type:{harvest_type}'
+            if source_type is not None:
+                params['q'] = f'(type:{harvest_type} source_type:{source_type})'
             else:
-                start += rows
-                self.package_list += results
-                yield(results)
+                params['q'] = f'(type:{harvest_type})'
+
+        logger.info('Search harvest packages via %s', method)
+        return self.search_pages(params=params, rows=rows, method=method,
+                                 fields=fields, pagination=pagination)
 
     def search_packages(self,
                         rows=1000,
                         method='POST',  # POST work in CKAN 2.8, fails in 2.3
-                        search_params={}
+                        search_params={},
+                        fields=None,  # list of fields to get compact records instead of full packages
+                        pagination='offset'  # 'offset' | 'keyset'
                         ):  # datajson for
         """ search packages.
             "rows" is the page size.
+            With "fields" each page is a list of PackageRecord namedtuples
+            See search_pages for pagination
             """
-
-        start = 0
+        return self.search_pages(params=search_params, rows=rows, method=method,
+                                 fields=fields, pagination=pagination)
+
+    def search_pages(self, params, rows=1000, method='POST', fields=None, pagination='offset'):
+        """ iterate package_search pages.
+            pagination:
+             - offset: start += rows. Deep pages are slow in Solr and results
+               could shift (duplicated or missing) under concurrent writes
+             - keyset: sort by "metadata_modified asc, id asc" and continue
+               after the last (metadata_modified, id) seen. Flat page latency and
+               each package is returned once """
+
+        if pagination not in ['offset', 'keyset']:
+            raise ValueError(f'Unknown pagination "{pagination}"')
+        keyset = pagination == 'keyset'
 
         url = '{}{}'.format(self.base_url, self.package_search_url)
+        base_fq = params.get('fq', '')
+        start = 0
+        last = None  # last (metadata_modified, id) for keyset pagination
+        seen = set()  # packages modified during the scan move to the end, return them once
         page = 0
-        # TODO check for a real paginated version
-        while url:
+        while True:
             page += 1
 
-            params = {'start': start, 'rows': rows}
-            params.update(search_params)
-            logger.info(f'Searching packages {url} PAGE:{page} start:{start}, rows:{rows} with params: {params}')
-
-            headers = self.get_request_headers()
-            try:
-                if method == 'POST':  # depend on CKAN version
-                    req = requests.post(url, data=params, headers=headers)
-                else:
-                    req = requests.get(url, params=params, headers=headers)
-
-            except Exception as e:
-                error = 'ERROR Donwloading package list: {} [{}]'.format(url, e)
-                raise ValueError('Failed to get package list at {}'.format(url))
-
-            content = req.content
-
-            if req.status_code >= 400:
-                error = ('ERROR searching CKAN package: {}'
-                         '\n\t Status code: {}'
-                         '\n\t Params: {}'
-                         '\n\t content:{}'.format(url, req.status_code, params, content))
-                logger.error(error)
-                raise Exception(error)
-
-            try:
-                json_content = json.loads(content)  # check for encoding errors
-            except Exception as e:
-                error = 'ERROR parsing JSON data: {} [{}]'.format(content, e)
-                raise ValueError(error)
+            page_params = dict(params)
+            page_params['rows'] = rows
+            if keyset:
+                page_params['start'] = 0
+                page_params['sort'] = 'metadata_modified asc, id asc'
+                if last is not None:
+                    page_params['fq'] = '{} {}'.format(base_fq, keyset_filter(*last)).strip()
+            else:
+                page_params['start'] = start
 
-            if not json_content['success']:
-                error = 'API response failed: {}'.format(json_content.get('error', None))
-                raise ValueError(error)
+            if fields is not None:
+                key_fields = ['metadata_modified'] if keyset else []
+                page_params['fl'] = fields_params(list(fields) + [f for f in key_fields if f not in fields])
 
-            result = json_content['result']
+            logger.info('Searching packages %s PAGE:%s start:%s, rows:%s with params: %s', url, page, start, rows, page_params)
+            result = self.package_search(params=page_params, method=method)
             results = result['results']
             real_results_count = len(results)
             self.total_packages += real_results_count
-            logger.info(f'{real_results_count} results')
+            logger.info('%s results', real_results_count)
 
             if real_results_count == 0:
-                url = None
+                break
+
+            start += rows
+            if keyset:
+                last = (results[-1]['metadata_modified'], results[-1]['id'])
+                results = [package for package in results if package['id'] not in seen]
+                seen.update(package['id'] for package in results)
+                if len(results) == 0:
+                    continue
+
+            if fields is not None:
+                results = [package_record(package, tuple(fields)) for package in results]
+            self.package_list += results
+            logger.debug('datasets found: %s', results)
+            yield(results)
+
+    def package_search(self, params, method='POST'):
+        """ just one request to package_search.
+            Returns the "result" dict (count, results, ...) """
+        url = '{}{}'.format(self.base_url, self.package_search_url)
+        headers = self.get_request_headers()
+        try:
+            if method == 'POST':  # depend on CKAN version
+                req = self.request('package_search', 'POST', url, data=params, headers=headers)
             else:
-                start += rows
-                self.package_list += results
-                logger.debug(f'datasets found: {results}')
-                yield(results)
+                req = self.request('package_search', 'GET', url, params=params, headers=headers)
+        except Exception as e:
+            error = 'ERROR Donwloading package list: {} [{}]'.format(url, e)
+            raise ValueError('Failed to get package list at {}'.format(url))
+
+        content = req.content
+
+        if req.status_code >= 400:
+            error = ('ERROR searching CKAN package: {}'
+                     '\n\t Status code: {}'
+                     '\n\t Params: {}'
+                     '\n\t content:{}'.format(url, req.status_code, truncate(params), truncate(content)))
+            logger.error(error)
+            raise Exception(error)
+
+        try:
+            json_content = json.loads(content)  # check for encoding errors
+        except Exception as e:
+            error = 'ERROR parsing JSON data: {} [{}]'.format(truncate(content), e)
+            raise ValueError(error)
+
+        if not json_content['success']:
+            error = 'API response failed: {}'.format(json_content.get('error', None))
+            raise ValueError(error)
+
+        return json_content['result']
+
+    def build_bulk_queries(self, values, field='extras_identifier',
+                           max_fq_length=4000,  # keep GET URLs under common 8k limits
+                           max_values=500):
+        """ group values in OR'ed "fq" filters: field:("a" OR "b" ...).
+            Returns a list of (fq, values) """
+        prefix = f'{field}:('
+        queries = []
+        chunk = []
+        terms = []
+        length = len(prefix) + 1  # prefix + ")"
+        for value in values:
+            term = solr_quote(value)
+            if len(terms) > 0 and (length + 4 + len(term) > max_fq_length or len(terms) >= max_values):
+                queries.append((prefix + ' OR '.join(terms) + ')', chunk))
+                chunk = []
+                terms = []
+                length = len(prefix) + 1
+            length += len(term) if len(terms) == 0 else len(term) + 4  # " OR "
+            chunk.append(value)
+            terms.append(term)
+        if len(terms) > 0:
+            queries.append((prefix + ' OR '.join(terms) + ')', chunk))
+        return queries
+
+    def _bulk_query(self, fq, values, field, method, rows):
+        """ all the packages for one OR'ed query """
+        found = {}
+        wanted = set(values)
+        start = 0
+        while True:
+            # newest first, so we keep the last modified for duplicates
+            params = {'fq': fq, 'rows': rows, 'start': start,
+                      'sort': 'metadata_modified desc', 'include_private': True}
+            result = self.package_search(params=params, method=method)
+            results = result['results']
+            for package in results:
+                # text fields in Solr could match more than the exact value
+                value = package_value(package, field)
+                if value in wanted and value not in found:
+                    found[value] = package
+            start += len(results)
+            if len(results) == 0 or start >= result['count']:
+                break
+        return found
+
+    def show_packages_by_identifier(self, identifiers,
+                                    field='extras_identifier',  # or 'name'
+                                    method='POST',
+                                    max_workers=4,
+                                    max_fq_length=4000,
+                                    max_values=500):
+        """ get many packages in a few package_search requests.
+            Returns a dict {identifier: package}. Identifiers not found in CKAN are not included """
+        identifiers = list(dict.fromkeys(identifiers))  # unique, keep order
+        if len(identifiers) == 0:
+            return {}
+
+        queries = self.build_bulk_queries(identifiers, field=field,
+                                          max_fq_length=max_fq_length,
+                                          max_values=max_values)
+        logger.info('Looking for %s packages by %s in %s queries', len(identifiers), field, len(queries))
+        metrics.inc('ckan_bulk_lookups', len(identifiers), field=field)
+
+        packages = {}
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(self._bulk_query, fq, values, field, method, len(values))
+                       for fq, values in queries]
+            for future in futures:
+                packages.update(future.result())
+
+        logger.info('%s/%s packages found', len(packages), len(identifiers))
+        return packages
 
     def get_all_packages(self, harvest_source_id=None,  # just one harvest source
                                 harvest_type=None,  # 'harvest' for harvest sources
@@ -273,10 +437,11 @@ class CKANPortalAPI:
         headers['Content-Type'] = 'application/json'
         ckan_package_str = json.dumps(ckan_package)
 
-        logger.info(f'POST {url} headers:{headers} data:{ckan_package}')
+        logger.info('POST %s package %s', url, ckan_package.get('name'))
+        logger.debug('POST %s data:%s', url, ckan_package_str)
 
         try:
-            req = requests.post(url, data=ckan_package_str, headers=headers)
+            req = self.request('package_create', 'POST', url, data=ckan_package_str, headers=headers)
         except Exception as e:
             error = 'ERROR creating [POST] CKAN package: {} [{}]'.format(url, e)
             raise
@@ -285,12 +450,12 @@ class CKANPortalAPI:
         try:
             json_content = json.loads(content)
         except Exception as e:
-            error = 'ERROR parsing JSON data: {} [{}]'.format(content, e)
+            error = 'ERROR parsing JSON data: {} [{}]'.format(truncate(content), e)
             logger.error(error)
             raise
 
         if req.status_code == 409:
-            logger.info(f'409 json_content: {json_content}')
+            logger.info('409 json_content: %s', json_content)
             # another posible [error] = {'owner_org': ['Organization does not exist']}
 
             # Check for duplicates
@@ -302,13 +467,15 @@ class CKANPortalAPI:
 
             is_duplicated = dataset_exists or harvest_exists
             if is_duplicated:
-                logger.error(f'Already exists! ACTION: {on_duplicated}')
+                logger.error('Already exists! ACTION: %s', on_duplicated)
                 if on_duplicated == 'SKIP':
                     # returns {'success': True, 'result': {the package}}
                     res = self.show_package(ckan_package_id_or_name=ckan_package['name'])
-                    logger.info(f'Skipped: {res}')
+                    logger.info('Skipped %s', ckan_package['name'])
+                    logger.debug('Skipped: %s', res)
                     return res
                 elif on_duplicated == 'DELETE':
+                    metrics.inc('ckan_api_retries', action='package_create', reason='duplicated')
                     delr = self.delete_package(ckan_package_id_or_name=ckan_package['name'])
                     if not delr['success']:
                         raise Exception('Failed to delete {}'.format(ckan_package['name']))
@@ -317,7 +484,7 @@ class CKANPortalAPI:
                     error = ('DUPLICATED CKAN package: {}'
                              '\n\t Status code: {}'
                              '\n\t content:{}'
-                             '\n\t Dataset {}'.format(url, req.status_code, content, ckan_package))
+                             '\n\t Dataset {}'.format(url, req.status_code, truncate(content), ckan_package.get('name')))
                     logger.error(error)
                     raise Exception(error)
 
@@ -325,7 +492,7 @@ class CKANPortalAPI:
             error = ('ERROR creating CKAN package: {}'
                      '\n\t Status code: {}'
                      '\n\t content:{}'
-                     '\n\t Dataset {}'.format(url, req.status_code, content, ckan_package))
+                     '\n\t Dataset {}'.format(url, req.status_code, truncate(content), ckan_package.get('name')))
             logger.error(error)
             raise Exception(error)
 
@@ -333,7 +500,8 @@ class CKANPortalAPI:
             error = 'API response failed: {}'.format(json_content.get('error', None))
             logger.error(error)
 
-        logger.info(f'Harvest source created: {json_content}')
+        logger.info('Package created %s', ckan_package.get('name'))
+        logger.debug('Package created: %s', json_content)
         return json_content
 
     def create_harvest_source(self, title, url, owner_org_id, name=None,
@@ -347,7 +515,7 @@ class CKANPortalAPI:
             Previous: https://github.com/ckan/ckanext-harvest/blob/3a72337f1e619bf9ea3221037ca86615ec22ae2f/ckanext/harvest/logic/action/create.py#L27"""
 
         if name is None:
-            name = self.generate_name(title=title)
+            name = self.generate_name(title=title, identifier=url)
 
         # ----------------------------------------------------
         # since the CKAN rejects the unregistered harvest types
@@ -383,7 +551,7 @@ class CKANPortalAPI:
 
         return self.create_package(ckan_package=ckan_package, on_duplicated=on_duplicated)
 
-    def generate_name(self, title):
+    def generate_name(self, title, identifier=None):
         # names are unique in CKAN
         # old harvester do like this: https://github.com/GSA/ckanext-datajson/blob/07ca20e0b6dc1898f4ca034c1e073e0c27de2015/ckanext/datajson/harvester_base.py#L747
 
@@ -391,6 +559,9 @@ class CKANPortalAPI:
         if len(name) > 95:  # max length is 100
             name = name[:95]
 
+        if self.name_allocator is not None:
+            name = self.name_allocator.allocate(name, identifier=identifier)
+
         return name
 
     def update_package(self, ckan_package):
@@ -402,11 +573,12 @@ class CKANPortalAPI:
         headers = self.get_request_headers(include_api_key=True)
 
         headers['Content-Type'] = 'application/json'
-        ckan_package = json.dumps(ckan_package)
+        ckan_package_str = json.dumps(ckan_package)
 
-        logger.info(f'POST {url} headers:{headers} data:{ckan_package}')
+        logger.info('POST %s package %s', url, ckan_package.get('name', ckan_package.get('id')))
+        logger.debug('POST %s data:%s', url, ckan_package_str)
         try:
-            req = requests.post(url, data=ckan_package, headers=headers)
+            req = self.request('package_update', 'POST', url, data=ckan_package_str, headers=headers)
         except Exception as e:
             error = 'ERROR creating CKAN package: {} [{}]'.format(url, e)
             raise
@@ -414,14 +586,46 @@ class CKANPortalAPI:
         content = req.content
 
         if req.status_code >= 400:
-            error = 'ERROR updateing CKAN package: {} \n\t Status code: {} \n\t content:{}'.format(url, req.status_code, content)
+            error = 'ERROR updateing CKAN package: {} \n\t Status code: {} \n\t content:{}'.format(url, req.status_code, truncate(content))
+            logger.error(error)
+            raise Exception(error)
+
+        try:
+            json_content = json.loads(content)
+        except Exception as e:
+            error = 'ERROR parsing JSON data: {} [{}]'.format(truncate(content), e)
+            raise
+
+        if not json_content['success']:
+            error = 'API response failed: {}'.format(json_content.get('error', None))
+            logger.error(error)
+
+        return json_content
+
+    def post_json(self, action, url, data):
+        """ POST JSON data to a CKAN write action """
+        headers = self.get_request_headers(include_api_key=True)
+        headers['Content-Type'] = 'application/json'
+        data_str = json.dumps(data)
+
+        logger.debug('POST %s data:%s', url, data_str)
+        try:
+            req = self.request(action, 'POST', url, data=data_str, headers=headers)
+        except Exception as e:
+            error = 'ERROR at {}: {} [{}]'.format(action, url, e)
+            raise
+
+        content = req.content
+
+        if req.status_code >= 400:
+            error = 'ERROR at {}: {} \n\t Status code: {} \n\t content:{}'.format(action, url, req.status_code, truncate(content))
             logger.error(error)
             raise Exception(error)
 
         try:
             json_content = json.loads(content)
         except Exception as e:
-            error = 'ERROR parsing JSON data: {} [{}]'.format(content, e)
+            error = 'ERROR parsing JSON data from {}: {} [{}]'.format(action, truncate(content), e)
             raise
 
         if not json_content['success']:
@@ -430,6 +634,120 @@ class CKANPortalAPI:
 
         return json_content
 
+    def patch_package(self, ckan_package):
+        """ POST to CKAN API to patch a package/dataset.
+            Just the fields included are updated. Requires "id"
+            https://docs.ckan.org/en/2.8/api/#ckan.logic.action.patch.package_patch
+        """
+        url = '{}{}'.format(self.base_url, self.package_patch_url)
+        logger.info('POST %s package %s fields %s', url, ckan_package['id'], list(ckan_package.keys()))
+        return self.post_json('package_patch', url, ckan_package)
+
+    def revise_package(self, revise):
+        """ POST to CKAN API to revise a package/dataset (CKAN >= 2.9)
+            https://docs.ckan.org/en/2.9/api/#ckan.logic.action.update.package_revise
+        """
+        url = '{}{}'.format(self.base_url, self.package_revise_url)
+        logger.info('POST %s match %s', url, revise['match'])
+        return self.post_json('package_revise', url, revise)
+
+    def update_package_diff(self, ckan_package, existing, mode='patch'):
+        """ send just the changes between ckan_package (e.g. from transform_to_ckan_dataset)
+            and the existing CKAN package (a full package dict).
+            mode: 'patch' (package_patch) or 'revise' (package_revise, CKAN >= 2.9)
+            No request if nothing changed.
+            Returns the API response with an extra "diff" key (PackageDiff) """
+        diff = diff_package(new_package=ckan_package, old_package=existing)
+        if not diff.has_changes:
+            logger.info('No changes for %s, skip', existing.get('name'))
+            metrics.inc('ckan_diff_updates', result='unchanged')
+            res = {'success': True, 'result': existing}
+        else:
+            logger.info('Changes for %s: %s', existing.get('name'), diff.changed_keys())
+            metrics.inc('ckan_diff_updates', result='changed')
+            if mode == 'revise':
+                res = self.revise_package(diff.as_revise())
+            else:
+                res = self.patch_package(diff.as_patch())
+        res['diff'] = diff
+        return res
+
+    def upsert_package(self, ckan_package, existing=None):
+        """ create or update a package without a failed create (409) first
+            Params:
+             - ckan_package: a dict with with a ready-to-save package
+             - existing: the package in CKAN (dict or PackageRecord with at least "id"
+               and "source_hash") or None if it's a new one.
+               With a full package just the changes are sent (package_patch)
+            Returns the API response with an extra "upsert" key: created | updated | skipped """
+
+        if existing is None:
+            res = self.create_package(ckan_package=ckan_package, on_duplicated='RAISE')
+            action = 'created'
+        elif record_value(existing, 'extras_source_hash') is not None and \
+                record_value(existing, 'extras_source_hash') == package_value(ckan_package, 'extras_source_hash'):
+            # same source, nothing to write
+            res = {'success': True, 'result': existing}
+            action = 'skipped'
+        elif isinstance(existing, dict) and 'resources' in existing:
+            # full package: send just the changes
+            res = self.update_package_diff(ckan_package=ckan_package, existing=existing)
+            action = 'updated' if res['diff'].has_changes else 'skipped'
+        else:
+            # copy: callers could reuse the transformed package
+            res = self.update_package(ckan_package=dict(ckan_package, id=record_value(existing, 'id')))
+            action = 'updated'
+
+        metrics.inc('ckan_upserts', action=action)
+        logger.info('Upsert %s: %s', ckan_package.get('name'), action)
+        res['upsert'] = action
+        return res
+
+    def upsert_packages(self, ckan_packages,
+                        index=None,  # dict {identifier: existing package or record}
+                        field='extras_identifier',  # or 'name'
+                        max_workers=4,
+                        checkpoint=None):  # harvesters.checkpoint.Checkpoint
+        """ create or update many packages.
+            If "index" is None existing packages are found with one batched lookup
+            (show_packages_by_identifier).
+            With a checkpoint, packages already written at a previous (failed) run are not sent again
+            (upsert: "resumed") and each outcome is recorded.
+            Returns a list of API responses (same order) """
+        identifiers = [package_value(ckan_package, field) for ckan_package in ckan_packages]
+        if checkpoint is not None:
+            pending = [identifier for identifier in identifiers if not checkpoint.is_written(identifier)]
+        else:
+            pending = identifiers
+        if index is None:
+            index = self.show_packages_by_identifier(pending, field=field) if len(pending) > 0 else {}
+
+        def upsert(ckan_package, identifier):
+            if checkpoint is None:
+                return self.upsert_package(ckan_package, index.get(identifier))
+            if checkpoint.is_written(identifier):
+                metrics.inc('ckan_upserts', action='resumed')
+                package_id = checkpoint.package_id(identifier)
+                result = {'id': package_id} if package_id is not None else index.get(identifier)
+                return {'success': True, 'result': result, 'upsert': 'resumed'}
+            try:
+                res = self.upsert_package(ckan_package, index.get(identifier))
+            except Exception:
+                checkpoint.record_write(identifier, 'error')
+                raise
+            package_id = record_value(res['result'], 'id') if res.get('result') is not None else None
+            checkpoint.record_write(identifier, res['upsert'], package_id=package_id)
+            return res
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(upsert, ckan_package, identifier)
+                       for ckan_package, identifier in zip(ckan_packages, identifiers)]
+            results = [future.result() for future in futures]
+
+        if checkpoint is not None:
+            checkpoint.save()
+        return results
+
     def delete_package(self, ckan_package_id_or_name):
         """ POST to CKAN API to delete a new package/dataset
             https://docs.ckan.org/en/2.8/api/#ckan.logic.action.delete.package_delete
@@ -437,9 +755,9 @@ class CKANPortalAPI:
         url = '{}{}'.format(self.base_url, self.package_delete_url)
         headers = self.get_request_headers(include_api_key=True)
         data = {'id': ckan_package_id_or_name}
-        logger.error(f'POST {url} headers:{headers} data:{data}')
+        logger.info('POST %s data:%s', url, data)
         try:
-            req = requests.post(url, data=data, headers=headers)
+            req = self.request('package_delete', 'POST', url, data=data, headers=headers)
         except Exception as e:
             error = 'ERROR deleting CKAN package: {} [{}]'.format(url, e)
             raise
@@ -447,14 +765,14 @@ class CKANPortalAPI:
         content = req.content
 
         if req.status_code >= 400:
-            error = 'ERROR deleting CKAN package: {} \n\t Status code: {} \n\t content:{}'.format(url, req.status_code, content)
+            error = 'ERROR deleting CKAN package: {} \n\t Status code: {} \n\t content:{}'.format(url, req.status_code, truncate(content))
             logger.error(error)
             raise Exception(error)
 
         try:
             json_content = json.loads(content)
         except Exception as e:
-            error = 'ERROR parsing JSON data from delete_package: {} [{}]'.format(content, e)
+            error = 'ERROR parsing JSON data from delete_package: {} [{}]'.format(truncate(content), e)
             raise
 
         if not json_content['success']:
@@ -469,16 +787,16 @@ class CKANPortalAPI:
         url = '{}{}'.format(self.base_url, self.package_show_url)
         headers = self.get_request_headers(include_api_key=True)
         data = {'id': ckan_package_id_or_name}
-        logger.info(f'GET {url} headers:{headers} data:{data}')
+        logger.info('GET %s data:%s', url, data)
         try:
-            req = requests.get(url, params=data, headers=headers)
+            req = self.request('package_show', 'GET', url, params=data, headers=headers)
         except Exception as e:
             error = 'ERROR showing CKAN package: {} [{}]'.format(url, e)
             raise
 
         content = req.content
         if req.status_code >= 400:
-            error = 'ERROR showing CKAN package: {} \n\t Status code: {} \n\t content:{}'.format(url, req.status_code, content)
+            error = 'ERROR showing CKAN package: {} \n\t Status code: {} \n\t content:{}'.format(url, req.status_code, truncate(content))
             logger.error(error)
             raise Exception(error)
 
@@ -487,7 +805,7 @@ class CKANPortalAPI:
         try:
             json_content = json.loads(content)
         except Exception as e:
-            error = 'ERROR parsing JSON data from show_package: {} [{}]'.format(content, e)
+            error = 'ERROR parsing JSON data from show_package: {} [{}]'.format(truncate(content), e)
             raise
 
         if not json_content['success']:
@@ -498,6 +816,8 @@ class CKANPortalAPI:
 
     def save_datasets_as_data_packages(self, folder_path):
         """ save each dataset source as _datapackage_ """
+        from datapackage import Package, Resource
+
         for dataset in self.package_list:
             package = Package()
 
@@ -520,14 +840,18 @@ class CKANPortalAPI:
             package.save(target=package_path)
 
     def get_admin_users(self, organization_id):
-        """ GET to CKAN API to get list of admins
+        """ GET to CKAN API to get list of admins (cached)
             https://docs.ckan.org/en/2.8/api/#ckan.logic.action.get.member_list
         """
+        cached = self.cache.get('members', organization_id)
+        if cached is not None:
+            return cached
+
         url = '{}{}?id={}&object_type=user&capacity=admin'.format(self.base_url, self.member_list_url, organization_id)
         headers = self.get_request_headers(include_api_key=True)
-        logger.info(f'GET {url} headers:{headers}')
+        logger.info('GET %s', url)
         try:
-            req = requests.get(url, headers=headers)
+            req = self.request('member_list', 'GET', url, headers=headers)
         except Exception as e:
             error = 'ERROR getting organization members: {} [{}]'.format(url, e)
             raise
@@ -535,31 +859,37 @@ class CKANPortalAPI:
         content = req.content
 
         if req.status_code >= 400:
-            error = 'ERROR getting organization members: {} \n\t Status code: {} \n\t content:{}'.format(url, req.status_code, content)
+            error = 'ERROR getting organization members: {} \n\t Status code: {} \n\t content:{}'.format(url, req.status_code, truncate(content))
             logger.error(error)
             raise Exception(error)
 
         try:
             json_content = json.loads(content)
         except Exception as e:
-            error = 'ERROR parsing JSON data from organization members {} [{}]'.format(content, e)
+            error = 'ERROR parsing JSON data from organization members {} [{}]'.format(truncate(content), e)
             raise
 
         if not json_content['success']:
             error = 'API response failed: {}'.format(json_content.get('error', None))
             logger.error(error)
+        else:
+            self.cache.set('members', organization_id, json_content)
 
         return json_content
 
     def get_user_info(self, user_id):
-        """ GET to CKAN API to get list of admins
+        """ GET to CKAN API to get list of admins (cached)
             https://docs.ckan.org/en/2.8/api/#ckan.logic.action.get.user_show
         """
+        cached = self.cache.get('user', user_id)
+        if cached is not None:
+            return cached
+
         url = '{}{}?id={}'.format(self.base_url, self.user_show_url, user_id)
         headers = self.get_request_headers(include_api_key=True)
-        logger.info(f'GET {url} headers:{headers}')
+        logger.info('GET %s', url)
         try:
-            req = requests.get(url, headers=headers)
+            req = self.request('user_show', 'GET', url, headers=headers)
         except Exception as e:
             error = 'ERROR getting users information: {} [{}]'.format(url, e)
             raise
@@ -567,43 +897,103 @@ class CKANPortalAPI:
         content = req.content
 
         if req.status_code >= 400:
-            error = 'ERROR getting users information: {} \n\t Status code: {} \n\t content:{}'.format(url, req.status_code, content)
+            error = 'ERROR getting users information: {} \n\t Status code: {} \n\t content:{}'.format(url, req.status_code, truncate(content))
             logger.error(error)
             raise Exception(error)
 
         try:
             json_content = json.loads(content)
         except Exception as e:
-            error = 'ERROR parsing JSON data from users information {} [{}]'.format(content, e)
+            error = 'ERROR parsing JSON data from users information {} [{}]'.format(truncate(content), e)
             raise
 
         if not json_content['success']:
             error = 'API response failed: {}'.format(json_content.get('error', None))
             logger.error(error)
+        else:
+            self.cache.set('user', user_id, json_content)
 
         return json_content
 
-    def delete_all_harvest_sources(self, harvest_type='harvest', source_type='datajson'):
-        logger.info(f'Deleting local harvest sources from {self.base_url}')
-        deleted = []
-        for harvest_sources in self.search_harvest_packages(harvest_type=harvest_type, source_type=source_type):
-            for harvest_source in harvest_sources:
-                
-                harvest_source_name = harvest_source['name']
-                if harvest_source_name in deleted:
-                    #TODO fix duplicated
-                    continue
+    def purge_package(self, ckan_package_id_or_name):
+        """ POST to CKAN API to purge a package/dataset (sysadmin only).
+            Unlike delete, the package is completely removed
+            https://docs.ckan.org/en/2.8/api/#ckan.logic.action.delete.dataset_purge
+        """
+        url = '{}{}'.format(self.base_url, self.dataset_purge_url)
+        logger.info('POST %s id:%s', url, ckan_package_id_or_name)
+        return self.post_json('dataset_purge', url, {'id': ckan_package_id_or_name})
+
+    def bulk_delete_packages(self, organization_id, package_ids):
+        """ POST to CKAN API to delete many packages from one organization in one request
+            https://docs.ckan.org/en/2.8/api/#ckan.logic.action.update.bulk_update_delete
+        """
+        url = '{}{}'.format(self.base_url, self.bulk_update_delete_url)
+        logger.info('POST %s org:%s %s datasets', url, organization_id, len(package_ids))
+        return self.post_json('bulk_update_delete', url, {'org_id': organization_id, 'datasets': package_ids})
+
+    def list_harvest_sources(self, harvest_type='harvest', source_type='datajson', method='POST'):
+        """ snapshot of all the harvest sources (unique by ID).
+            Changes while we delete or create do not affect the list """
+        harvest_sources = {}
+        for page in self.search_harvest_packages(harvest_type=harvest_type, source_type=source_type, method=method):
+            for harvest_source in page:
+                harvest_sources.setdefault(harvest_source['id'], harvest_source)
+        return list(harvest_sources.values())
+
+    def delete_harvest_sources(self, harvest_sources,
+                               purge=False,  # dataset_purge instead of package_delete
+                               use_bulk=False,  # bulk_update_delete by organization
+                               max_workers=4):
+        """ delete harvest sources concurrently.
+            Returns the list of deleted names """
+
+        def delete(harvest_source):
+            name = harvest_source['name']
+            logger.info('Deleting local harvest %s', name)
+            if purge:
+                res = self.purge_package(ckan_package_id_or_name=harvest_source['id'])
+            else:
+                res = self.delete_package(ckan_package_id_or_name=harvest_source['id'])
+            if not res['success']:
+                raise Exception(f'Failed to delete {name}')
+            logger.info('Deleted %s', name)
+            return [name]
+
+        def bulk_delete(organization_id, sources):
+            res = self.bulk_delete_packages(organization_id=organization_id,
+                                            package_ids=[source['id'] for source in sources])
+            if not res['success']:
+                raise Exception(f'Failed to delete harvest sources from {organization_id}')
+            return [source['name'] for source in sources]
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            if use_bulk and not purge:
+                by_organization = {}
+                for harvest_source in harvest_sources:
+                    by_organization.setdefault(harvest_source['owner_org'], []).append(harvest_source)
+                futures = [executor.submit(bulk_delete, organization_id, sources)
+                           for organization_id, sources in by_organization.items()]
+            else:
+                futures = [executor.submit(delete, harvest_source) for harvest_source in harvest_sources]
 
-                logger.info(f'Deleting local harvest {harvest_source_name}')
-                res = self.delete_package(ckan_package_id_or_name=harvest_source_name)
-                if not res['success']:
-                    raise Exception(f'Failed to delete {harvest_source_name}')
-                else:
-                    logger.info(f'Deleted {harvest_source_name}')
-                    deleted.append(harvest_source_name)
-                    deleted += 1
+            deleted = []
+            for future in futures:
+                deleted += future.result()
 
-        logger.info(f'{deleted} harvest sources deleted')
+        metrics.inc('harvest_sources_deleted', len(deleted))
+        return deleted
+
+    def delete_all_harvest_sources(self, harvest_type='harvest', source_type='datajson',
+                                   purge=False, use_bulk=False, max_workers=4):
+        """ delete all the harvest sources.
+            The list is read before deleting: deleting while paginating skips pages """
+        logger.info('Deleting local harvest sources from %s', self.base_url)
+        harvest_sources = self.list_harvest_sources(harvest_type=harvest_type, source_type=source_type)
+        deleted = self.delete_harvest_sources(harvest_sources, purge=purge,
+                                              use_bulk=use_bulk, max_workers=max_workers)
+
+        logger.info('%s harvest sources deleted', len(deleted))
         return deleted
 
     def import_harvest_sources(self, catalog_url,
@@ -611,51 +1001,62 @@ class CKANPortalAPI:
                                on_duplicated='DELETE',
                                harvest_type='harvest',
                                source_type='datajson',
-                               delete_local_harvest_sources=True):
+                               delete_local_harvest_sources=True,
+                               max_workers=4):
         """ import harvest sources from another CKAN open data portal """
 
         if delete_local_harvest_sources:
-            deleted = self.delete_all_harvest_sources(source_type=source_type)
+            deleted = self.delete_all_harvest_sources(source_type=source_type, max_workers=max_workers)
 
-        logger.info(f'Getting external harvest sources for {catalog_url}')
+        logger.info('Getting external harvest sources for %s', catalog_url)
         external_portal = CKANPortalAPI(base_url=catalog_url)
 
-        total_sources = 0
-        search_external = external_portal.search_harvest_packages(method=method,
-                                                                  harvest_type=harvest_type,
-                                                                  source_type=source_type)
-        for external_harvest_sources in search_external:
-            for external_harvest_source in external_harvest_sources:
-                name = external_harvest_source['name']
-
-                organization = external_harvest_source['organization']
-                logger.info(f'**** Importing Organization {organization}')
-                # copy organization locally
-                del organization['id']  # drop original ID
-                del organization['created']
-                del organization['revision_id']
-                res = self.create_organization(organization=organization)
-                owner_org_id = organization['name']
-
-                config = external_harvest_source.get('config', {})
-                # res = self.delete_package(name)
-                logger.info(external_harvest_source)
-                res = self.create_harvest_source(title=external_harvest_source['title'],
-                                                url=external_harvest_source['url'],
-                                                owner_org_id=owner_org_id,
-                                                name=name,
-                                                config=config,
-                                                notes=external_harvest_source['notes'],
-                                                source_type=source_type,
-                                                frequency=external_harvest_source['frequency'],
-                                                on_duplicated=on_duplicated)
-
-                if not res['success']:
-                    raise Exception(f'Failed to import harvest source {name}')
-                else:
-                    logger.info(f'Created {name}')
-                    total_sources += 1
-
+        # snapshot, unique by name
+        external_harvest_sources = {}
+        for page in external_portal.search_harvest_packages(method=method,
+                                                            harvest_type=harvest_type,
+                                                            source_type=source_type):
+            for external_harvest_source in page:
+                external_harvest_sources.setdefault(external_harvest_source['name'], external_harvest_source)
+
+        # create each organization once
+        organizations = {}
+        for external_harvest_source in external_harvest_sources.values():
+            organization = dict(external_harvest_source['organization'])
+            # copy organization locally
+            for field in ['id', 'created', 'revision_id']:  # drop original ID
+                organization.pop(field, None)
+            organizations.setdefault(organization['name'], organization)
+
+        def import_organization(organization):
+            logger.info('**** Importing Organization %s', organization.get('name'))
+            return self.create_organization(organization=organization)
+
+        def import_source(external_harvest_source):
+            name = external_harvest_source['name']
+            config = external_harvest_source.get('config', {})
+            logger.debug('External harvest source: %s', external_harvest_source)
+            res = self.create_harvest_source(title=external_harvest_source['title'],
+                                             url=external_harvest_source['url'],
+                                             owner_org_id=external_harvest_source['organization']['name'],
+                                             name=name,
+                                             config=config,
+                                             notes=external_harvest_source['notes'],
+                                             source_type=source_type,
+                                             frequency=external_harvest_source['frequency'],
+                                             on_duplicated=on_duplicated)
+            if not res['success']:
+                raise Exception(f'Failed to import harvest source {name}')
+            logger.info('Created %s', name)
+            return res
+
+        logger.info('Importing %s harvest sources from %s organizations',
+                    len(external_harvest_sources), len(organizations))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            list(executor.map(import_organization, organizations.values()))
+            total_sources = len(list(executor.map(import_source, external_harvest_sources.values())))
+
+        metrics.inc('harvest_sources_imported', total_sources)
         return total_sources
 
     def create_organization(self, organization, check_if_exists=True):
@@ -663,25 +1064,27 @@ class CKANPortalAPI:
             organization is just a python dict
             https://docs.ckan.org/en/2.8/api/#ckan.logic.action.create.organization_create
         """
-        logger.info(f'**** Creating Organization {organization}')
+        logger.info('**** Creating Organization %s', organization['name'])
         if check_if_exists:
-            logger.info(f'Exists Organization? {organization}')
+            logger.info('Exists Organization? %s', organization['name'])
             res = self.show_organization(organization_id_or_name=organization['name'])
             if res['success']:
                 # do not create
-                logger.info(f'Avoid create Organization {organization}')
+                logger.info('Avoid create Organization %s', organization['name'])
                 return res
 
+        self.cache.invalidate('organization', organization['name'])
+
         url = '{}{}'.format(self.base_url, self.organization_create_url)
         headers = self.get_request_headers(include_api_key=True)
 
         headers['Content-Type'] = 'application/json'
         organization = json.dumps(organization)
 
-        logger.info(f'POST {url} headers:{headers} data:{organization}')
+        logger.debug('POST %s data:%s', url, organization)
 
         try:
-            req = requests.post(url, data=organization, headers=headers)
+            req = self.request('organization_create', 'POST', url, data=organization, headers=headers)
         except Exception as e:
             error = 'ERROR creating [POST] organization: {} [{}]'.format(url, e)
             raise
@@ -693,37 +1096,43 @@ class CKANPortalAPI:
             error = ('ERROR creating [STATUS] organization: {}'
                      '\n\t Status code: {}'
                      '\n\t content:{}'
-                     '\n\t Dataset {}'.format(url, req.status_code, content, organization))
+                     '\n\t Dataset {}'.format(url, req.status_code, truncate(content), organization))
             logger.error(error)
             raise Exception(error)
 
         try:
             json_content = json.loads(content)
         except Exception as e:
-            error = 'ERROR parsing JSON data: {} [{}]'.format(content, e)
+            error = 'ERROR parsing JSON data: {} [{}]'.format(truncate(content), e)
             logger.error(error)
             raise
 
         if not json_content['success']:
             error = 'API response failed: {}'.format(json_content.get('error', None))
             logger.error(error)
+        else:
+            self.cache_organization(json_content)
 
         return json_content
 
     def show_organization(self,
                           organization_id_or_name,
                           method='POST'):  # troubles using 2.3 and 2.8 CKAN versions):
-        """ GET to CKAN API to show a organization """
+        """ GET to CKAN API to show a organization (cached) """
+
+        cached = self.cache.get('organization', organization_id_or_name)
+        if cached is not None:
+            return cached
 
         url = '{}{}'.format(self.base_url, self.organization_show_url)
         headers = self.get_request_headers()
         data = {'id': organization_id_or_name}
-        logger.info(f'POST {url} headers:{headers} data:{data}')
+        logger.info('POST %s data:%s', url, data)
         try:
             if method == 'POST':
-                req = requests.post(url, data=data, headers=headers)
+                req = self.request('organization_show', 'POST', url, data=data, headers=headers)
             else:
-                req = requests.get(url, params=data, headers=headers)
+                req = self.request('organization_show', 'GET', url, params=data, headers=headers)
         except Exception as e:
             error = 'ERROR showing organization: {} [{}]'.format(url, e)
             raise
@@ -731,20 +1140,29 @@ class CKANPortalAPI:
         content = req.content
 
         if req.status_code >= 400 and req.status_code != 404:
-            error = 'ERROR showing organization: {} \n\t Status code: {} \n\t content:{}'.format(url, req.status_code, content)
+            error = 'ERROR showing organization: {} \n\t Status code: {} \n\t content:{}'.format(url, req.status_code, truncate(content))
             logger.error(error)
             raise Exception(error)
 
         try:
             json_content = json.loads(content)
         except Exception as e:
-            error = 'ERROR parsing JSON data from show_organization: {} [{}]'.format(content, e)
+            error = 'ERROR parsing JSON data from show_organization: {} [{}]'.format(truncate(content), e)
             raise
 
         if not json_content['success']:
             error = 'API response failed: {}'.format(json_content.get('error', None))
             logger.error(error)
+        else:
+            self.cache_organization(json_content)
 
         return json_content
 
+    def cache_organization(self, json_content):
+        """ cache an organization by ID and name """
+        organization = json_content['result']
+        for key in [organization.get('id'), organization.get('name')]:
+            if key is not None:
+                self.cache.set('organization', key, json_content)
+
 
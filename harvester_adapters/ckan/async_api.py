@@ -0,0 +1,333 @@
+''' asyncio CKAN client (optional, requires aiohttp: pip install ckan-harvesters[async])
+
+Same actions and error semantics as CKANPortalAPI, but thousands of requests
+could be in flight from one thread. One connection pool is shared by all the
+requests and a semaphore for each action type (read, write) limits the load on CKAN.
+
+    api = AsyncCKANPortalAPI(base_url=CKAN_BASE_URL, api_key=CKAN_API_KEY, limits={'read': 50, 'write': 10})
+    packages = await asyncio.gather(*[api.show_package(name) for name in names])
+    await api.close()
+
+Without an event loop use the sync facade
+
+    api = SyncCKANPortalAPI(base_url=CKAN_BASE_URL, api_key=CKAN_API_KEY)
+    api.show_package('my-dataset')
+    api.gather([api.aio.show_package(name) for name in names])
+    api.close()
+'''
+import asyncio
+import json
+
+from harvesters.errors import truncate
+from harvesters.logs import logger
+from harvesters.metrics import metrics
+from harvester_adapters.ckan.api import CKANPortalAPI
+from harvester_adapters.ckan.cache import TTLCache
+
+# action type for each CKAN action. Each type has its own concurrency limit
+ACTION_TYPES = {
+    'package_search': 'read',
+    'package_show': 'read',
+    'organization_show': 'read',
+    'member_list': 'read',
+    'user_show': 'read',
+    'package_create': 'write',
+    'package_update': 'write',
+    'package_patch': 'write',
+    'package_delete': 'write',
+    'organization_create': 'write',
+}
+
+DEFAULT_LIMITS = {'read': 50, 'write': 10}
+
+
+class AsyncResponse:
+    """ status and body of a finished request """
+
+    def __init__(self, status_code, content):
+        self.status_code = status_code
+        self.content = content
+
+
+class AsyncCKANPortalAPI:
+    """ asyncio version of CKANPortalAPI """
+
+    version = CKANPortalAPI.version
+    user_agent = CKANPortalAPI.user_agent
+
+    def __init__(self, base_url, api_key=None, cache=None,
+                 limits=None,  # requests at the same time by action type, e.g. {'read': 50, 'write': 10}
+                 connection_limit=100,  # connections in the shared pool
+                 timeout=60):
+        self.base_url = base_url
+        self.api_key = api_key
+        self.cache = TTLCache() if cache is None else cache
+        self.limits = dict(DEFAULT_LIMITS, **(limits or {}))
+        self.connection_limit = connection_limit
+        self.timeout = timeout
+        self.session = None
+        self.semaphores = {}  # created inside the event loop
+
+    def get_request_headers(self, include_api_key=False):
+        headers = {'User-Agent': f'{self.user_agent} {self.version}'}
+        if include_api_key:
+            headers['X-CKAN-API-Key'] = self.api_key
+        return headers
+
+    def get_semaphore(self, action):
+        action_type = ACTION_TYPES.get(action, 'write')
+        if action_type not in self.semaphores:
+            self.semaphores[action_type] = asyncio.Semaphore(self.limits.get(action_type, 10))
+        return self.semaphores[action_type]
+
+    def get_session(self):
+        if self.session is None:
+            try:
+                import aiohttp
+            except ImportError:
+                raise ImportError('aiohttp is required for the async CKAN client: '
+                                  'pip install ckan-harvesters[async]')
+            connector = aiohttp.TCPConnector(limit=self.connection_limit)
+            self.session = aiohttp.ClientSession(connector=connector,
+                                                 timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self.session
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def request(self, action, method, url, **kwargs):
+        """ HTTP request to the CKAN API. Returns an AsyncResponse.
+            Latency is measured by action and status code """
+        async with self.get_semaphore(action):
+            with metrics.timer('ckan_api_seconds', action=action) as labels:
+                async with self.get_session().request(method, url, **kwargs) as res:
+                    content = await res.read()
+                labels['status'] = res.status
+        metrics.inc('ckan_api_requests', action=action, status=res.status)
+        return AsyncResponse(status_code=res.status, content=content)
+
+    async def call(self, action, method, url, allowed_status=(), **kwargs):
+        """ request and read the JSON response """
+        req = await self.request(action, method, url, **kwargs)
+        return self.read_response(action, url, req, allowed_status=allowed_status)
+
+    def read_response(self, action, url, req, allowed_status=()):
+        """ JSON response as CKANPortalAPI reads it:
+            HTTP errors raise, failed actions are logged and returned """
+        content = req.content
+
+        if req.status_code >= 400 and req.status_code not in allowed_status:
+            error = 'ERROR at {}: {} \n\t Status code: {} \n\t content:{}'.format(action, url, req.status_code, truncate(content))
+            logger.error(error)
+            raise Exception(error)
+
+        try:
+            json_content = json.loads(content)
+        except Exception as e:
+            error = 'ERROR parsing JSON data from {}: {} [{}]'.format(action, truncate(content), e)
+            logger.error(error)
+            raise
+
+        if not json_content['success']:
+            error = 'API response failed: {}'.format(json_content.get('error', None))
+            logger.error(error)
+
+        return json_content
+
+    async def post_json(self, action, url, data, allowed_status=()):
+        headers = self.get_request_headers(include_api_key=True)
+        headers['Content-Type'] = 'application/json'
+        return await self.call(action, 'POST', url, data=json.dumps(data), headers=headers,
+                               allowed_status=allowed_status)
+
+    async def package_search(self, params, method='POST'):
+        """ just one request to package_search.
+            Returns the "result" dict (count, results, ...) """
+        url = '{}{}'.format(self.base_url, CKANPortalAPI.package_search_url)
+        headers = self.get_request_headers()
+        if method == 'POST':
+            json_content = await self.call('package_search', 'POST', url, data=params, headers=headers)
+        else:
+            json_content = await self.call('package_search', 'GET', url, params=params, headers=headers)
+
+        if not json_content['success']:
+            error = 'API response failed: {}'.format(json_content.get('error', None))
+            raise ValueError(error)
+
+        return json_content['result']
+
+    async def search_packages(self, search_params={}, rows=1000, method='POST'):
+        """ all the packages for a search. After the first page, the other ones are requested at the same time """
+        params = dict(search_params, start=0, rows=rows)
+        first = await self.package_search(params=params, method=method)
+        packages = first['results']
+
+        starts = range(rows, first['count'], rows)
+        pages = await asyncio.gather(*[self.package_search(params=dict(search_params, start=start, rows=rows),
+                                                           method=method)
+                                       for start in starts])
+        for page in pages:
+            packages += page['results']
+        return packages
+
+    async def create_package(self, ckan_package, on_duplicated='RAISE'):
+        """ create a package. on_duplicated: RAISE | SKIP | DELETE (see CKANPortalAPI.create_package) """
+        url = '{}{}'.format(self.base_url, CKANPortalAPI.package_create_url)
+        headers = self.get_request_headers(include_api_key=True)
+        headers['Content-Type'] = 'application/json'
+        logger.info('POST %s package %s', url, ckan_package.get('name'))
+        req = await self.request('package_create', 'POST', url, data=json.dumps(ckan_package), headers=headers)
+
+        if req.status_code == 409:
+            errors = self.read_response('package_create', url, req, allowed_status=(409, )).get('error') or {}
+            name_errors = errors.get('name', []) if isinstance(errors, dict) else []
+            url_errors = errors.get('url', []) if isinstance(errors, dict) else []
+            is_duplicated = any('That URL is already in use' in e for e in name_errors) or \
+                any('There already is a Harvest Source for this URL' in e for e in url_errors)
+            if is_duplicated:
+                logger.error('Already exists! ACTION: %s', on_duplicated)
+                if on_duplicated == 'SKIP':
+                    logger.info('Skipped %s', ckan_package['name'])
+                    return await self.show_package(ckan_package['name'])
+                elif on_duplicated == 'DELETE':
+                    metrics.inc('ckan_api_retries', action='package_create', reason='duplicated')
+                    delr = await self.delete_package(ckan_package['name'])
+                    if not delr['success']:
+                        raise Exception('Failed to delete {}'.format(ckan_package['name']))
+                    return await self.create_package(ckan_package=ckan_package, on_duplicated='RAISE')
+                error = ('DUPLICATED CKAN package: {}'
+                         '\n\t Status code: {}'
+                         '\n\t content:{}'
+                         '\n\t Dataset {}'.format(url, req.status_code, truncate(req.content), ckan_package.get('name')))
+                logger.error(error)
+                raise Exception(error)
+
+        json_content = self.read_response('package_create', url, req)
+        logger.info('Package created %s', ckan_package.get('name'))
+        return json_content
+
+    async def update_package(self, ckan_package):
+        url = '{}{}'.format(self.base_url, CKANPortalAPI.package_update_url)
+        logger.info('POST %s package %s', url, ckan_package.get('name', ckan_package.get('id')))
+        return await self.post_json('package_update', url, ckan_package)
+
+    async def patch_package(self, ckan_package):
+        """ just the fields included are updated. Requires "id" """
+        url = '{}{}'.format(self.base_url, CKANPortalAPI.package_patch_url)
+        logger.info('POST %s package %s fields %s', url, ckan_package['id'], list(ckan_package.keys()))
+        return await self.post_json('package_patch', url, ckan_package)
+
+    async def delete_package(self, ckan_package_id_or_name):
+        url = '{}{}'.format(self.base_url, CKANPortalAPI.package_delete_url)
+        data = {'id': ckan_package_id_or_name}
+        logger.info('POST %s data:%s', url, data)
+        return await self.call('package_delete', 'POST', url, data=data,
+                               headers=self.get_request_headers(include_api_key=True))
+
+    async def show_package(self, ckan_package_id_or_name):
+        url = '{}{}'.format(self.base_url, CKANPortalAPI.package_show_url)
+        data = {'id': ckan_package_id_or_name}
+        logger.info('GET %s data:%s', url, data)
+        return await self.call('package_show', 'GET', url, params=data,
+                               headers=self.get_request_headers(include_api_key=True))
+
+    def cache_organization(self, json_content):
+        """ cache an organization by ID and name """
+        organization = json_content['result']
+        for key in [organization.get('id'), organization.get('name')]:
+            if key is not None:
+                self.cache.set('organization', key, json_content)
+
+    async def show_organization(self, organization_id_or_name, method='POST'):
+        """ show a organization (cached) """
+        cached = self.cache.get('organization', organization_id_or_name)
+        if cached is not None:
+            return cached
+
+        url = '{}{}'.format(self.base_url, CKANPortalAPI.organization_show_url)
+        headers = self.get_request_headers()
+        data = {'id': organization_id_or_name}
+        if method == 'POST':
+            json_content = await self.call('organization_show', 'POST', url, data=data, headers=headers,
+                                           allowed_status=(404, ))
+        else:
+            json_content = await self.call('organization_show', 'GET', url, params=data, headers=headers,
+                                           allowed_status=(404, ))
+        if json_content['success']:
+            self.cache_organization(json_content)
+        return json_content
+
+    async def create_organization(self, organization, check_if_exists=True):
+        if check_if_exists:
+            res = await self.show_organization(organization['name'])
+            if res['success']:
+                logger.info('Avoid create Organization %s', organization['name'])
+                return res
+
+        self.cache.invalidate('organization', organization['name'])
+        url = '{}{}'.format(self.base_url, CKANPortalAPI.organization_create_url)
+        json_content = await self.post_json('organization_create', url, organization)
+        if json_content['success']:
+            self.cache_organization(json_content)
+        return json_content
+
+    async def get_admin_users(self, organization_id):
+        """ list of admins (cached) """
+        cached = self.cache.get('members', organization_id)
+        if cached is not None:
+            return cached
+
+        url = '{}{}'.format(self.base_url, CKANPortalAPI.member_list_url)
+        params = {'id': organization_id, 'object_type': 'user', 'capacity': 'admin'}
+        json_content = await self.call('member_list', 'GET', url, params=params,
+                                       headers=self.get_request_headers(include_api_key=True))
+        if json_content['success']:
+            self.cache.set('members', organization_id, json_content)
+        return json_content
+
+    async def get_user_info(self, user_id):
+        """ user_show (cached) """
+        cached = self.cache.get('user', user_id)
+        if cached is not None:
+            return cached
+
+        url = '{}{}'.format(self.base_url, CKANPortalAPI.user_show_url)
+        json_content = await self.call('user_show', 'GET', url, params={'id': user_id},
+                                       headers=self.get_request_headers(include_api_key=True))
+        if json_content['success']:
+            self.cache.set('user', user_id, json_content)
+        return json_content
+
+
+class SyncCKANPortalAPI:
+    """ blocking facade over AsyncCKANPortalAPI with its own event loop.
+        Every async method is available as a blocking one.
+        Use gather() to run many calls at the same time """
+
+    def __init__(self, *args, **kwargs):
+        self.aio = AsyncCKANPortalAPI(*args, **kwargs)
+        self.loop = asyncio.new_event_loop()
+
+    def run(self, coroutine):
+        return self.loop.run_until_complete(coroutine)
+
+    def gather(self, coroutines, return_exceptions=False):
+        """ run many calls (e.g. [api.aio.show_package(name) for name in names]). Results in the same order """
+        async def gather_all():
+            return await asyncio.gather(*coroutines, return_exceptions=return_exceptions)
+        return self.run(gather_all())
+
+    def close(self):
+        self.run(self.aio.close())
+        self.loop.close()
+
+    def __getattr__(self, name):
+        attr = getattr(self.aio, name)
+        if not asyncio.iscoroutinefunction(attr):
+            return attr
+
+        def blocking(*args, **kwargs):
+            return self.run(attr(*args, **kwargs))
+        return blocking
@@ -0,0 +1,68 @@
+''' TTL cache for CKAN metadata (organizations, members, users) '''
+import json
+import os
+import threading
+import time
+
+from harvesters.logs import logger
+from harvesters.metrics import metrics
+
+
+class TTLCache:
+    """ values by namespace and key, valid for "ttl" seconds.
+        With "path" the cache is loaded from disk and saved with save()
+        so repeated runs reuse it """
+
+    def __init__(self, ttl=3600, path=None):
+        self.ttl = ttl
+        self.path = path
+        self.data = {}  # namespace: {key: {'value': value, 'stored': timestamp}}
+        self.lock = threading.Lock()
+
+        if path is not None:
+            self.load()
+
+    def load(self):
+        if not os.path.isfile(self.path):
+            return
+        f = open(self.path, 'r')
+        try:
+            self.data = json.load(f)
+        except ValueError as e:
+            logger.error('Invalid CKAN cache at %s: %s', self.path, e)
+            self.data = {}
+        f.close()
+
+    def save(self):
+        if self.path is None:
+            return
+        with self.lock:
+            dmp = json.dumps(self.data, indent=2)
+        f = open(self.path, 'w')
+        f.write(dmp)
+        f.close()
+
+    def get(self, namespace, key):
+        """ cached value or None if unknown or expired """
+        with self.lock:
+            entry = self.data.get(namespace, {}).get(str(key))
+            if entry is not None and time.time() - entry['stored'] > self.ttl:
+                self.data[namespace].pop(str(key))
+                entry = None
+
+        metrics.inc('ckan_cache', namespace=namespace, result='miss' if entry is None else 'hit')
+        return None if entry is None else entry['value']
+
+    def set(self, namespace, key, value):
+        with self.lock:
+            self.data.setdefault(namespace, {})[str(key)] = {'value': value, 'stored': time.time()}
+
+    def invalidate(self, namespace=None, key=None):
+        """ drop one key, one namespace or everything """
+        with self.lock:
+            if namespace is None:
+                self.data = {}
+            elif key is None:
+                self.data.pop(namespace, None)
+            else:
+                self.data.get(namespace, {}).pop(str(key), None)
@@ -7,6 +7,8 @@ from harvester_adapters.ckan import settings
 class CKANDatasetAdapter(ABC):
     ''' transform other datasets objects into CKAN datasets '''
 
+    name_allocator = None  # NameAllocator shared by all datasets to get unique names
+
     def __init__(self, original_dataset, schema='default'):
         self.schema = schema
         self.original_dataset = original_dataset
@@ -205,8 +207,10 @@ class CKANDatasetAdapter(ABC):
         if len(name) > cut_at:
             name = name[:cut_at]
 
-        # TODO check if the name MUST be a new unexisting one
-        # TODO check if it's an existing resource and we need to read previos name using the identifier
+        # with an allocator the name is unique and the same identifier gets the previous name
+        if self.name_allocator is not None:
+            identifier = self.original_dataset.get('identifier') if isinstance(self.original_dataset, dict) else None
+            name = self.name_allocator.allocate(name, identifier=identifier)
 
         return name
 
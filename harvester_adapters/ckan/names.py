@@ -0,0 +1,93 @@
+''' unique CKAN names before hitting the API '''
+import json
+import os
+import threading
+
+from harvesters.logs import logger
+from harvester_adapters.ckan import settings
+
+
+class NameAllocator:
+    """ hand out unique names: "annual-report", "annual-report-1", "annual-report-2" ...
+        Seeded with the names already in use (at CKAN or a local index).
+        The same identifier always gets the same name, so names are stable across runs.
+        Thread-safe """
+
+    def __init__(self, names=(), index=None, max_length=settings.MAX_NAME_LENGTH, path=None):
+        self.used = set(names)
+        self.by_identifier = {}  # identifier: name
+        self.next_suffix = {}  # base name: next suffix to try
+        self.max_length = max_length
+        self.path = path
+        self.lock = threading.Lock()
+
+        if path is not None:
+            self.load()
+        for identifier, name in (index or {}).items():
+            self.add(name, identifier=identifier)
+
+    @classmethod
+    def from_ckan(cls, ckan_api, field='extras_identifier', search_params={}, **kwargs):
+        """ seed with all the names (and identifiers) at a CKAN instance (CKANPortalAPI) """
+        allocator = cls(**kwargs)
+        pages = ckan_api.search_packages(search_params=search_params,
+                                         fields=['name', field],
+                                         pagination='keyset')
+        for page in pages:
+            for record in page:
+                allocator.add(record[0], identifier=record[1])
+        logger.info('%s names in use at %s', len(allocator.used), ckan_api.base_url)
+        return allocator
+
+    def load(self):
+        if not os.path.isfile(self.path):
+            return
+        f = open(self.path, 'r')
+        try:
+            index = json.load(f)
+        except ValueError as e:
+            logger.error('Invalid names index at %s: %s', self.path, e)
+            index = {}
+        f.close()
+        for identifier, name in index.items():
+            self.add(name, identifier=identifier)
+
+    def save(self):
+        """ save the identifier: name index """
+        if self.path is None:
+            return
+        with self.lock:
+            dmp = json.dumps(self.by_identifier, indent=2)
+        f = open(self.path, 'w')
+        f.write(dmp)
+        f.close()
+
+    def add(self, name, identifier=None):
+        """ register a name already in use """
+        with self.lock:
+            self.used.add(name)
+            if identifier is not None:
+                self.by_identifier[identifier] = name
+
+    def allocate(self, base, identifier=None):
+        """ unique name for "base" (a slug). O(1) amortized """
+        with self.lock:
+            if identifier is not None and identifier in self.by_identifier:
+                return self.by_identifier[identifier]
+
+            base = base[:self.max_length]
+            name = base
+            if name in self.used:
+                suffix = self.next_suffix.get(base, 1)
+                while True:
+                    end = f'-{suffix}'
+                    name = base[:self.max_length - len(end)] + end
+                    if name not in self.used:
+                        break
+                    suffix += 1
+                self.next_suffix[base] = suffix + 1
+
+            self.used.add(name)
+            if identifier is not None:
+                self.by_identifier[identifier] = name
+            return name
@@ -0,0 +1,168 @@
+''' minimal changes between a transformed dataset and the package in CKAN '''
+from harvester_adapters.ckan.resource_merge import ResourceMerger
+
+# fields managed by CKAN, never sent in a patch
+IGNORED_FIELDS = ('id', 'metadata_created', 'metadata_modified', 'revision_id',
+                  'num_resources', 'num_tags', 'organization', 'creator_user_id',
+                  'groups', 'relationships_as_object', 'relationships_as_subject')
+
+# extras added at CKAN side (harvest plugin), kept even if the source doesn't have them
+CKAN_MANAGED_EXTRAS = ('harvest_object_id', 'harvest_source_id', 'harvest_source_title')
+
+IGNORED_RESOURCE_FIELDS = ('package_id', 'created', 'last_modified', 'position',
+                           'revision_id', 'cache_url', 'cache_last_updated', 'datastore_active')
+
+
+def same_value(new_value, old_value):
+    """ CKAN stores extras as strings and drops empty values """
+    if new_value in (None, '') and old_value in (None, ''):
+        return True
+    if new_value == old_value:
+        return True
+    if isinstance(old_value, str) and not isinstance(new_value, str):
+        return str(new_value) == old_value
+    return False
+
+
+def tag_names(package):
+    """ set of tag names from "tags" and "tag_string" """
+    names = set(tag['name'] for tag in package.get('tags') or [])
+    tag_string = package.get('tag_string') or ''
+    names.update(tag.strip() for tag in tag_string.split(',') if tag.strip() != '')
+    return names
+
+
+class PackageDiff:
+    """ changes to apply to a CKAN package """
+
+    def __init__(self, package_id):
+        self.package_id = package_id
+        self.fields = {}  # changed top-level fields: new values
+        self.extras = None  # full extras list, if any extra changed
+        self.resources = None  # full new resources list, if any resource changed
+        self.changed_resources = {}  # resource id: {changed fields}
+        self.added_resources = []
+        self.removed_resources = []  # resource ids
+
+    @property
+    def has_changes(self):
+        return len(self.fields) > 0 or self.extras is not None or self.resources is not None
+
+    def changed_keys(self):
+        keys = list(self.fields.keys())
+        if self.extras is not None:
+            keys.append('extras')
+        if self.resources is not None:
+            keys.append('resources')
+        return keys
+
+    def as_patch(self):
+        """ data for package_patch.
+            Lists (extras, resources) are replaced as a whole by CKAN, so they are complete """
+        data = {'id': self.package_id}
+        data.update(self.fields)
+        if self.extras is not None:
+            data['extras'] = self.extras
+        if self.resources is not None:
+            data['resources'] = self.resources
+        return data
+
+    def as_revise(self):
+        """ data for package_revise (CKAN >= 2.9).
+            Just the changed resource fields are sent, unless some resource was removed """
+        update = dict(self.fields)
+        if self.extras is not None:
+            update['extras'] = self.extras
+
+        data = {'match': {'id': self.package_id}, 'update': update}
+        if self.resources is None:
+            return data
+
+        if len(self.removed_resources) > 0:
+            update['resources'] = self.resources
+            return data
+
+        for resource_id, changes in self.changed_resources.items():
+            data[f'update__resources__{resource_id}'] = changes
+        if len(self.added_resources) > 0:
+            data['update__resources__extend'] = self.added_resources
+        return data
+
+
+def pair_resources(new_resources, old_resources):
+    """ transformed resources have no CKAN id: find the existing resource
+        (normalized URL, then name and format) and copy its id and CKAN fields.
+        Returns a new list, the new resources are not changed """
+    new_ids = set(res['id'] for res in new_resources if res.get('id') is not None)
+    merger = ResourceMerger([res for res in old_resources if res.get('id') not in new_ids])
+    paired = []
+    for res in new_resources:
+        if res.get('id') is None:
+            existing = merger.find(res)
+            if existing is not None:
+                res = dict(res)
+                for field in merger.preserved_fields:
+                    if field in existing and field not in res:
+                        res[field] = existing[field]
+        paired.append(res)
+    return paired
+
+
+def diff_resources(diff, new_resources, old_resources):
+    new_resources = pair_resources(new_resources, old_resources)
+    old_by_id = {res['id']: res for res in old_resources if 'id' in res}
+    seen = set()
+    for res in new_resources:
+        resource_id = res.get('id')
+        old = old_by_id.get(resource_id)
+        if old is None:
+            diff.added_resources.append(res)
+            continue
+        seen.add(resource_id)
+        changes = {key: value for key, value in res.items()
+                   if key not in IGNORED_RESOURCE_FIELDS and key != 'id' and not same_value(value, old.get(key))}
+        if len(changes) > 0:
+            diff.changed_resources[resource_id] = changes
+
+    diff.removed_resources = [resource_id for resource_id in old_by_id if resource_id not in seen]
+
+    if len(diff.added_resources) > 0 or len(diff.changed_resources) > 0 or len(diff.removed_resources) > 0:
+        diff.resources = new_resources
+
+
+def diff_package(new_package, old_package):
+    """ compare a transformed dataset (e.g. from transform_to_ckan_dataset)
+        with the current CKAN package. Returns a PackageDiff """
+    diff = PackageDiff(package_id=old_package['id'])
+
+    for key, value in new_package.items():
+        if key in IGNORED_FIELDS or key in ('extras', 'resources', 'tags', 'tag_string'):
+            continue
+        if not same_value(value, old_package.get(key)):
+            diff.fields[key] = value
+
+    # tags
+    if 'tags' in new_package or 'tag_string' in new_package:
+        if tag_names(new_package) != tag_names(old_package):
+            for key in ('tags', 'tag_string'):
+                if new_package.get(key) is not None:
+                    diff.fields[key] = new_package[key]
+
+    # extras
+    if 'extras' in new_package:
+        new_extras = {extra['key']: extra['value'] for extra in new_package['extras']}
+        old_extras = {extra['key']: extra['value'] for extra in old_package.get('extras', [])}
+        changed = any(not same_value(value, old_extras.get(key)) for key, value in new_extras.items())
+        # extras dropped at the source are removed
+        removed = [key for key in old_extras if key not in new_extras and key not in CKAN_MANAGED_EXTRAS]
+        if changed or len(removed) > 0:
+            # keep extras added at CKAN side (e.g. harvest_object_id)
+            diff.extras = new_package['extras'] + [extra for extra in old_package.get('extras', [])
+                                                   if extra['key'] not in new_extras and
+                                                   extra['key'] in CKAN_MANAGED_EXTRAS]
+
+    # resources
+    if 'resources' in new_package:
+        diff_resources(diff, new_package['resources'], old_package.get('resources', []))
+
+    return diff
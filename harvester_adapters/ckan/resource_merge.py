@@ -0,0 +1,120 @@
+''' merge new resources with the resources already in a CKAN dataset '''
+from collections import deque
+from urllib.parse import urlparse, urlunparse
+
+# fields owned by CKAN: we keep them from the existing resource
+PRESERVED_FIELDS = ('id', 'package_id', 'created', 'position', 'revision_id',
+                    'cache_url', 'cache_last_updated', 'datastore_active')
+
+
+def normalize_resource_url(url):
+    """ key to match URLs: no spaces, lowercase scheme and host, no trailing slash """
+    if url is None:
+        return None
+    parts = urlparse(url.strip())
+    path = parts.path.rstrip('/')
+    return urlunparse((parts.scheme.lower(), parts.netloc.lower(), path, parts.params, parts.query, ''))
+
+
+def name_format_key(resource):
+    """ secondary key, used when the URL changed """
+    name = (resource.get('name') or '').strip().lower()
+    resource_format = (resource.get('format') or '').strip().lower()
+    if name == '':
+        return None
+    return name, resource_format
+
+
+class ResourceMergeReport:
+    """ result of a merge. Each list holds resources (dicts) """
+
+    def __init__(self):
+        self.added = []  # new resources with no match in CKAN
+        self.kept = []  # new resources matched with an existing one (includes unchanged)
+        self.unchanged = []  # kept resources with no changes
+        self.removed = []  # existing resources not in the new list
+
+    @property
+    def has_changes(self):
+        """ False if CKAN resources could be left as they are """
+        return len(self.added) > 0 or len(self.removed) > 0 or len(self.kept) != len(self.unchanged)
+
+    def as_dict(self):
+        return {'added': len(self.added),
+                'kept': len(self.kept),
+                'unchanged': len(self.unchanged),
+                'removed': len(self.removed)}
+
+
+class ResourceMerger:
+    """ match new resources with existing CKAN resources in O(n+m)
+        using an index by normalized URL and another one by (name, format) """
+
+    def __init__(self, existing_resources, preserved_fields=PRESERVED_FIELDS):
+        self.existing_resources = existing_resources
+        self.preserved_fields = preserved_fields
+        self.by_url = {}
+        self.by_name_format = {}
+        self.used = set()  # index of the existing resources already matched
+
+        for idx, res in enumerate(existing_resources):
+            # duplicated keys are matched in order
+            self.by_url.setdefault(normalize_resource_url(res.get('url')), deque()).append(idx)
+            key = name_format_key(res)
+            if key is not None:
+                self.by_name_format.setdefault(key, deque()).append(idx)
+
+    def _take(self, index, key):
+        candidates = index.get(key)
+        while candidates:
+            idx = candidates.popleft()
+            if idx not in self.used:
+                self.used.add(idx)
+                return self.existing_resources[idx]
+        return None
+
+    def find(self, resource):
+        """ existing resource for this new one (or None) """
+        existing = self._take(self.by_url, normalize_resource_url(resource.get('url')))
+        if existing is None:
+            key = name_format_key(resource)
+            if key is not None:
+                existing = self._take(self.by_name_format, key)
+        return existing
+
+    def is_unchanged(self, resource, existing):
+        for key, value in resource.items():
+            if key in self.preserved_fields:
+                continue
+            if existing.get(key) != value:
+                return False
+        return True
+
+    def merge(self, new_resources):
+        """ returns the merged list of resources and a ResourceMergeReport """
+        report = ResourceMergeReport()
+        merged = []
+
+        for res in new_resources:
+            existing = self.find(res)
+            if existing is None:
+                report.added.append(res)
+            else:
+                unchanged = self.is_unchanged(res, existing)
+                for field in self.preserved_fields:
+                    if field in existing and field not in res:
+                        res[field] = existing[field]
+                report.kept.append(res)
+                if unchanged:
+                    report.unchanged.append(res)
+            merged.append(res)
+
+        report.removed = [res for idx, res in enumerate(self.existing_resources) if idx not in self.used]
+        return merged, report
+
+
+def merge_resources(existing_resources, new_resources, preserved_fields=PRESERVED_FIELDS):
+    """ merge new resources with the existing ones (keep CKAN IDs).
+        Returns the merged resources and a ResourceMergeReport """
+    merger = ResourceMerger(existing_resources, preserved_fields=preserved_fields)
+    return merger.merge(new_resources)
@@ -0,0 +1,136 @@
+"""
+Checkpoints to resume a failed harvest run
+
+Saved at the source data folder (harvesters.config) as "checkpoint.json":
+ - the hash of the fetched source. If the source changed, we start again
+ - positions: last completed page (CSW) or dataset index (data.json)
+ - CKAN write outcomes by identifier
+
+Each save is atomic (temp file + rename) so a crash never leaves a broken checkpoint.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+
+from harvesters import config
+from harvesters.logs import logger
+from harvesters.metrics import metrics
+
+# write outcomes we don't need to repeat
+DONE_OUTCOMES = ('created', 'updated', 'skipped')
+# each save rewrites the whole state, so write outcomes are saved in batches
+SAVE_EVERY = 100
+
+
+def content_hash(content):
+    """ sha256 for bytes, str or JSON serializable data """
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    elif not isinstance(content, bytes):
+        content = json.dumps(content, sort_keys=True).encode('utf-8')
+    return hashlib.sha256(content).hexdigest()
+
+
+def atomic_write(path, content):
+    """ write a file so readers (and crashes) see the old or the new version, never a partial one """
+    tmp_path = '{}.tmp'.format(path)
+    f = open(tmp_path, 'w')
+    f.write(content)
+    f.flush()
+    os.fsync(f.fileno())
+    f.close()
+    os.replace(tmp_path, path)
+
+
+class Checkpoint:
+    """ durable progress of a harvest source.
+        Saved every "save_every" changes (a crash loses at most that many write outcomes,
+        those packages are sent again). Positions are saved at once unless force=False """
+
+    def __init__(self, path=None, save_every=SAVE_EVERY):
+        if path is None:
+            path = os.path.join(config.get_base_path(), 'checkpoint.json')
+        self.path = path
+        self.save_every = save_every
+        self.lock = threading.Lock()
+        self.pending_changes = 0
+        self.reset()
+        self.load()
+
+    def reset(self):
+        self.state = {'source_hash': None, 'positions': {}, 'writes': {}, 'package_ids': {}, 'updated': None}
+
+    def load(self):
+        if not os.path.isfile(self.path):
+            return
+        f = open(self.path, 'r')
+        try:
+            self.state = json.load(f)
+        except ValueError as e:
+            logger.error('Invalid checkpoint at %s: %s', self.path, e)
+            self.reset()
+        f.close()
+
+    def save(self):
+        with self.lock:
+            self.state['updated'] = time.time()
+            dmp = json.dumps(self.state, indent=2)
+            self.pending_changes = 0
+            atomic_write(self.path, dmp)
+        metrics.inc('checkpoint_saves')
+
+    def changed(self, force=False):
+        with self.lock:
+            self.pending_changes += 1
+            pending = self.pending_changes
+        if force or pending >= self.save_every:
+            self.save()
+
+    def check_source(self, source_hash):
+        """ True if we can resume (same source as the last run).
+            Otherwise the checkpoint is reset for the new source """
+        if self.state['source_hash'] == source_hash:
+            logger.info('Resuming from checkpoint %s', self.path)
+            return True
+        if self.state['source_hash'] is not None:
+            logger.info('Source changed, checkpoint %s reset', self.path)
+        self.reset()
+        self.state['source_hash'] = source_hash
+        self.changed(force=True)
+        return False
+
+    def get_position(self, stage, default=None):
+        return self.state['positions'].get(stage, default)
+
+    def set_position(self, stage, value, force=True):
+        """ last durable point for a stage (e.g. next CSW start position).
+            With force=False it's saved following "save_every" """
+        with self.lock:
+            self.state['positions'][stage] = value
+        self.changed(force=force)
+
+    def record_write(self, identifier, outcome, package_id=None):
+        """ outcome of a CKAN write: created, updated, skipped or error.
+            The CKAN package id is kept for the resumed packages """
+        with self.lock:
+            self.state['writes'][identifier] = outcome
+            if package_id is not None:
+                self.state.setdefault('package_ids', {})[identifier] = package_id
+        self.changed()
+
+    def write_outcome(self, identifier):
+        return self.state['writes'].get(identifier)
+
+    def package_id(self, identifier):
+        return self.state.get('package_ids', {}).get(identifier)
+
+    def is_written(self, identifier):
+        return self.write_outcome(identifier) in DONE_OUTCOMES
+
+    def clear(self):
+        """ finished run, next one starts from scratch """
+        self.reset()
+        if os.path.isfile(self.path):
+            os.remove(self.path)
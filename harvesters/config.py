@@ -1,5 +1,7 @@
 import os
 import json
+import threading
+from contextlib import contextmanager
 from slugify import slugify
 
 
@@ -13,11 +15,56 @@ CKAN_CATALOG_URL = ''  # 'https://catalog.data.gov'
 CKAN_API_KEY = ''
 CKAN_OWNER_ORG = ''  # ID of the orginazion sharing their data to a CKAN instance
 
+CONFIG_KEYS = ('DATA_FOLDER_PATH', 'SOURCE_NAME', 'SOURCE_ID', 'SOURCE_URL', 'LIMIT_DATASETS',
+               'CKAN_CATALOG_URL', 'CKAN_API_KEY', 'CKAN_OWNER_ORG')
+
+_local = threading.local()
+
+
+class SourceConfig:
+    """ config for one harvest source, so many sources could run in the same process.
+        Missing values are read from the module globals """
+
+    def __init__(self, **values):
+        for key, value in values.items():
+            if key not in CONFIG_KEYS:
+                raise ValueError(f'Unknown config key {key}')
+            setattr(self, key, value)
+
+    def __getattr__(self, key):
+        # just called for values not set at this config
+        if key not in CONFIG_KEYS:
+            raise AttributeError(key)
+        return globals()[key]
+
+
+@contextmanager
+def source_config(config=None, **values):
+    """ use a SourceConfig for the current thread
+        with source_config(SOURCE_NAME='Dep of Agriculture', SOURCE_URL=url):
+            path = get_data_cache_path() """
+    if config is None:
+        config = SourceConfig(**values)
+    previous = getattr(_local, 'config', None)
+    _local.config = config
+    try:
+        yield config
+    finally:
+        _local.config = previous
+
+
+def get(key):
+    """ config value for the current source """
+    config = getattr(_local, 'config', None)
+    if config is None:
+        return globals()[key]
+    return getattr(config, key)
+
 
 def get_base_path():
 
-    nice_name = slugify(SOURCE_NAME)
-    base_path = os.path.join(DATA_FOLDER_PATH, nice_name)
+    nice_name = slugify(get('SOURCE_NAME'))
+    base_path = os.path.join(get('DATA_FOLDER_PATH'), nice_name)
 
     if not os.path.isdir(base_path):
         os.makedirs(base_path)
@@ -107,7 +154,7 @@ def get_flow2_data_package_folder_path():
 
 
 def get_harvest_sources_path(hs_name):
-    base_path = os.path.join(DATA_FOLDER_PATH, 'harvest_sources/datasets')
+    base_path = os.path.join(get('DATA_FOLDER_PATH'), 'harvest_sources/datasets')
 
     if not os.path.isdir(base_path):
         os.makedirs(base_path)
@@ -118,7 +165,7 @@ def get_harvest_sources_path(hs_name):
 
 
 def get_harvest_sources_data_folder(source_type, name):
-    base_path = os.path.join(DATA_FOLDER_PATH, 'harvest_sources', source_type)
+    base_path = os.path.join(get('DATA_FOLDER_PATH'), 'harvest_sources', source_type)
 
     if not os.path.isdir(base_path):
         os.makedirs(base_path)
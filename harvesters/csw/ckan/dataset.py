@@ -1,10 +1,13 @@
 import json
+import logging
 from slugify import slugify
 from urllib.parse import urlparse
 
 from harvester_adapters.ckan.dataset import CKANDatasetAdapter
-from harvesters.csw.ckan.resource import CSWResource
-from harvesters.logs import logger
+from harvesters.csw.ckan.resource import CSWResource, report_format_cache_metrics
+from harvesters.errors import truncate
+from harvesters.logs import logger, PER_DATASET
+from harvesters.metrics import metrics
 from harvesters.helpers import clean_tags
 from harvester_adapters.ckan import settings as ckan_settings
 
@@ -145,6 +148,7 @@ class CSWDataset(CKANDatasetAdapter):
 
         return True, None
 
+    @metrics.timed('transform_seconds', source_type='csw')
     def transform_to_ckan_dataset(self, existing_resources=None):
 
         valid, error = self.validate_origin_dataset()
@@ -157,15 +161,19 @@ class CSWDataset(CKANDatasetAdapter):
         self.ckan_dataset['tag_string'] = ','.join(cleaned_tags)
 
         # previous transformations at origin
+        debug = logger.isEnabledFor(logging.DEBUG)  # skip per-field calls when not needed
         for old_field, field_ckan in self.mapped_fields.items():
-            logger.debug(f'Connecting fields "{old_field}", "{field_ckan}"')
+            if debug:
+                logger.debug('Connecting fields "%s", "%s"', old_field, field_ckan)
             # identify origin and set value to destination
             origin = self.identify_origin_element(raw_field=old_field)
             if origin is None:
-                logger.debug(f'No data in origin for "{old_field}"')
+                if debug:
+                    logger.debug('No data in origin for "%s"', old_field)
             else:
                 self.set_destination_element(raw_field=field_ckan, new_value=origin)
-                logger.debug(f'Connected OK fields "{old_field}"="{origin}"')
+                if debug:
+                    logger.debug('Connected OK fields "%s"="%s"', old_field, origin)
 
         self.infer_resources()
         self.ckan_dataset['resources'] = self.transform_resources()
@@ -193,9 +201,11 @@ class CSWDataset(CKANDatasetAdapter):
 
         valid = self.validate_final_dataset()
         if not valid:
-            raise Exception(f'Error validating final dataset: {self.errors} from {self.original_dataset}')
+            # never the whole record: it includes the raw XML
+            identifier = self.original_dataset.get('identifier', '')
+            raise Exception(f'Error validating final dataset {identifier}: {truncate(self.errors)}')
 
-        logger.info('Dataset transformed {} OK'.format(self.original_dataset.get('identifier', '')))
+        logger.info('Dataset transformed %s OK', self.original_dataset.get('identifier', ''), extra=PER_DATASET)
         return self.ckan_dataset
 
     def infer_resources(self):
@@ -250,14 +260,16 @@ class CSWDataset(CKANDatasetAdapter):
 
         resources = []
         for original_resource in self.resources:
-            cra = CSWResource(original_resource=original_resource)
-            resource_transformed = cra.transform_to_ckan_resource()
+            with metrics.timer('resource_transform_seconds', source_type='csw'):
+                cra = CSWResource(original_resource=original_resource)
+                resource_transformed = cra.transform_to_ckan_resource()
             if resource_transformed is not None:
                 resources.append(resource_transformed)
             else:
                 # TODO is this an error?
                 pass
 
+        report_format_cache_metrics()
         self.resources = resources
         return self.resources
 
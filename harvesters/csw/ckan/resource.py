@@ -1,18 +1,24 @@
-import datetime
 import json
 import mimetypes
+import re
+from datetime import datetime
+from functools import lru_cache
 
-import requests
-from owslib import wms
 from slugify import slugify
 
 from harvester_adapters.ckan.resource import CKANResourceAdapter
+from harvesters.csw.wms_verification import get_default_verifier
 from harvesters.logs import logger
+from harvesters.metrics import metrics
 
 
 class CSWResource(CKANResourceAdapter):
     ''' CSW resource '''
 
+    validate_wms = True  # TODO config.get('ckanext.spatial.harvest.validate_wms', False)
+    wms_verifier = None  # shared WMSVerifier, the default one if None
+    defer_wms_verification = False  # do not block on the network, see verify_wms
+
     def validate_origin_distribution(self):
         return True, None
 
@@ -47,13 +53,8 @@ class CSWResource(CKANResourceAdapter):
                 resource = {}
                 format_from_url = self.guess_resource_format(url)
                 resource['format'] = format_from_url
-                cfg = True  # TODO config.get('ckanext.spatial.harvest.validate_wms', False)
-                if resource['format'] == 'wms' and cfg:
-                    # Check if the service is a view service
-                    test_url = url.split('?')[0] if '?' in url else url
-                    if self._is_wms(test_url):
-                        resource['verified'] = True
-                        resource['verified_date'] = datetime.now().isoformat()
+                if resource['format'] == 'wms' and self.validate_wms:
+                    self.verify_wms(resource, url)
 
                 resource.update(
                     {
@@ -86,13 +87,8 @@ class CSWResource(CKANResourceAdapter):
                     resource = {}
                     format_from_url = self.guess_resource_format(url)
                     resource['format'] = format_from_url if format_from_url else data_format
-                    cfg = True  # TODO config.get('ckanext.spatial.harvest.validate_wms', False)
-                    if resource['format'] == 'wms' and cfg:
-                        # Check if the service is a view service
-                        test_url = url.split('?')[0] if '?' in url else url
-                        if self._is_wms(test_url):
-                            resource['verified'] = True
-                            resource['verified_date'] = datetime.now().isoformat()
+                    if resource['format'] == 'wms' and self.validate_wms:
+                        self.verify_wms(resource, url)
 
                     resource.update(
                         {
@@ -104,7 +100,7 @@ class CSWResource(CKANResourceAdapter):
                         })
 
         if resource is None:
-            logger.error(f'Unable to parse resource: {original_resource}')
+            logger.error('Unable to parse resource: %s', original_resource)
             return None
 
         ckan_resource.update(**resource)
@@ -114,25 +110,30 @@ class CSWResource(CKANResourceAdapter):
 
         return ckan_resource
 
+    def get_wms_verifier(self):
+        return self.wms_verifier or get_default_verifier()
+
+    def verify_wms(self, resource, url):
+        """ Check if the service is a view service.
+            With defer_wms_verification the URL is just queued and
+            the resources must be updated later with
+            verifier.verify_pending() and verifier.apply(resources) """
+        verifier = self.get_wms_verifier()
+        if self.defer_wms_verification:
+            verifier.defer(url)
+            return
+
+        if verifier.verify(url):
+            resource['verified'] = True
+            resource['verified_date'] = datetime.now().isoformat()
+
     def _is_wms(self, url):
         '''
         Checks if the provided URL actually points to a Web Map Service.
-        Uses owslib WMS reader to parse the response.
+        Cached and shared between resources, see WMSVerifier
         '''
+        return self.get_wms_verifier().verify(url)
 
-        try:
-            capabilities_url = wms.WMSCapabilitiesReader().capabilities_url(url)
-            res = requests.get(capabilities_url, timeout=10)
-            xml = res.text
-
-            s = wms.WebMapService(url, xml=xml)
-            raise Exception('is_wms: {}'.format(s.contents))
-            return isinstance(s.contents, dict) and s.contents != {}
-        except Exception as e:
-            logger.error('WMS check for %s failed with exception: %s' % (url, str(e)))
-        return False
-
-    # TODO copie from previous plugin. UPGRADE required
     def guess_resource_format(self, url, use_mimetypes=True):
         '''
         Given a URL try to guess the best format to assign to the resource
@@ -146,38 +147,77 @@ class CSWResource(CKANResourceAdapter):
 
         Returns None if no format could be guessed.
 
+        Results are cached by normalized URL, see classify_url.
+        The format is guessed from the normalized URL too, so map request params
+        (VOLATILE_PARAMS) are ignored: "data.csv?bbox=..." is text/csv and
+        "export?layers=roads.kml" is not kml
         '''
-        url = url.lower().strip()
-
-        resource_types = {
-            # OGC
-            'wms': ('service=wms', 'geoserver/wms', 'mapserver/wmsserver', 'com.esri.wms.Esrimap', 'service/wms'),
-            'wfs': ('service=wfs', 'geoserver/wfs', 'mapserver/wfsserver', 'com.esri.wfs.Esrimap'),
-            'wcs': ('service=wcs', 'geoserver/wcs', 'imageserver/wcsserver', 'mapserver/wcsserver'),
-            'sos': ('service=sos',),
-            'csw': ('service=csw',),
-            # ESRI
-            'kml': ('mapserver/generatekml',),
-            'arcims': ('com.esri.esrimap.esrimap',),
-            'arcgis_rest': ('arcgis/rest/services',),
-        }
-
-        for resource_type, parts in resource_types.items():
-            if any(part in url for part in parts):
-                return resource_type
-
-        file_types = {
-            'kml' : ('kml',),
-            'kmz': ('kmz',),
-            'gml': ('gml',),
-        }
-
-        for file_type, extensions in file_types.items():
-            if any(url.endswith(extension) for extension in extensions):
-                return file_type
-
+        return classify_url(normalize_format_key(url), use_mimetypes=use_mimetypes)
+
+
+# Service patterns in priority order (the first type that matches wins)
+RESOURCE_TYPES = (
+    # OGC
+    ('wms', ('service=wms', 'geoserver/wms', 'mapserver/wmsserver', 'com.esri.wms.esrimap', 'service/wms')),
+    ('wfs', ('service=wfs', 'geoserver/wfs', 'mapserver/wfsserver', 'com.esri.wfs.esrimap')),
+    ('wcs', ('service=wcs', 'geoserver/wcs', 'imageserver/wcsserver', 'mapserver/wcsserver')),
+    ('sos', ('service=sos',)),
+    ('csw', ('service=csw',)),
+    # ESRI
+    ('kml', ('mapserver/generatekml',)),
+    ('arcims', ('com.esri.esrimap.esrimap',)),
+    ('arcgis_rest', ('arcgis/rest/services',)),
+)
+
+# pattern: (priority, resource type)
+SERVICE_PATTERN_TYPES = {part: (priority, resource_type)
+                         for priority, (resource_type, parts) in enumerate(RESOURCE_TYPES)
+                         for part in parts}
+
+# one scan for all the service patterns. The lookahead finds overlapping matches
+SERVICE_PATTERNS_RE = re.compile('(?=({}))'.format('|'.join(re.escape(part) for part in SERVICE_PATTERN_TYPES)))
+FILE_TYPES_RE = re.compile('(kml|kmz|gml)$')
+
+# request params that change for each layer/map of the same service and do not define the format
+VOLATILE_PARAMS = ('bbox', 'width', 'height', 'layers', 'srs', 'crs', 'styles')
+
+
+def normalize_format_key(url):
+    """ lowercase URL without the params that change on each layer of the same service """
+    url = url.lower().strip()
+    if '?' not in url:
+        return url
+
+    base, query = url.split('?', 1)
+    params = [param for param in query.split('&')
+              if param.split('=', 1)[0] not in VOLATILE_PARAMS]
+    return '{}?{}'.format(base, '&'.join(params)) if params else base
+
+
+@lru_cache(maxsize=8192)
+def classify_url(url, use_mimetypes=True):
+    """ resource format for a normalized URL """
+    matches = [SERVICE_PATTERN_TYPES[match.group(1)] for match in SERVICE_PATTERNS_RE.finditer(url)]
+    if len(matches) > 0:
+        priority, resource_type = min(matches)
+        return resource_type
+
+    match = FILE_TYPES_RE.search(url)
+    if match is not None:
+        return match.group(1)
+
+    if use_mimetypes:
         resource_format, encoding = mimetypes.guess_type(url)
         if resource_format:
             return resource_format
 
-        return None
+    return None
+
+
+def report_format_cache_metrics():
+    info = classify_url.cache_info()
+    total = info.hits + info.misses
+    metrics.set_gauge('resource_format_cache_hits', info.hits)
+    metrics.set_gauge('resource_format_cache_misses', info.misses)
+    metrics.set_gauge('resource_format_cache_hit_rate', info.hits / total if total else 0)
+    return info
@@ -11,16 +11,12 @@ GeoNode State CSW: http://geonode.state.gov/catalogue/csw?service=CSW&version=2.
 OpenTopography CSW: https://portal.opentopography.org/geoportal/csw
 """
 import json
-import requests
-from slugify import slugify
 from urllib.parse import urlparse, urlencode, urlunparse
-from owslib.csw import CatalogueServiceWeb, namespaces
-from owslib.ows import ExceptionReport
-from owslib import util
 import xml.etree.ElementTree as xet
+from harvesters.checkpoint import content_hash
 from harvesters.harvester import HarvesterBaseSource
-from harvesters.csw.iso_geo import ISODocument
 from harvesters.logs import logger
+from harvesters.metrics import metrics
 
 
 class CSWSource(HarvesterBaseSource):
@@ -40,12 +36,14 @@ class CSWSource(HarvesterBaseSource):
 
     def fetch(self, clean_url=True, timeout=120):
         # connect to csw source
+        from owslib.csw import CatalogueServiceWeb
+
         url = self.get_cleaned_url() if clean_url else self.url
         try:
-            self.csw = CatalogueServiceWeb(url, timeout=timeout)
+            with metrics.timer('fetch_seconds', source_type='csw', operation='GetCapabilities'):
+                self.csw = CatalogueServiceWeb(url, timeout=timeout)
         except Exception as e:
-            error = f'Error connection CSW: {e}'
-            self.errors.append(error)
+            error = self.add_error('fetch_error', 'fetch', f'Error connection CSW: {e}', identifier=url)
             logger.error(error)
             raise
 
@@ -55,8 +53,13 @@ class CSWSource(HarvesterBaseSource):
         self.read_csw_info()
         return self.csw_info
 
-    def get_records(self, page=10, outputschema='gmd', esn='brief'):
+    def get_records(self, page=10, outputschema='gmd', esn='brief', checkpoint=None, start=1, end=None):
         # iterate pages to get all records
+        # with "start" and "end" just the records at positions [start, end) (e.g. a shard)
+        # with a checkpoint (harvesters.checkpoint.Checkpoint) we start at the last completed page
+        # of the same query. Clear the checkpoint when the harvest is finished
+        from owslib.csw import namespaces
+
         self.csw_info['records'] = {}
         self.csw_info['pages'] = 0
 
@@ -70,32 +73,40 @@ class CSWSource(HarvesterBaseSource):
         # "gmd" at CSWHarvester
         # outputschema = 'gmd'  # https://github.com/geopython/OWSLib/blob/master/owslib/csw.py#L551
 
-        startposition = 0
+        startposition = start  # CSW positions are 1-based
         kwa = {
             "constraints": [],
             "typenames": 'csw:Record',
             "esn": esn,
             # esn: the ElementSetName 'full', 'brief' or 'summary' (default is 'full')
             "startposition": startposition,
-            "maxrecords": page,
+            "maxrecords": page if end is None else min(page, end - startposition),
             "outputschema": namespaces[outputschema],
             "cql": cql,
             }
 
+        if checkpoint is not None:
+            query = {'url': self.url, 'page': page, 'outputschema': outputschema, 'esn': esn,
+                     'start': start, 'end': end}
+            if checkpoint.check_source(content_hash(query)):
+                kwa['startposition'] = startposition = checkpoint.get_position('csw_startposition', startposition)
+
         matches = 0
         self.csw_info['records'] = {}
         while True:
             try:
-                self.csw.getrecords2(**kwa)
+                with metrics.timer('fetch_seconds', source_type='csw', operation='GetRecords'):
+                    self.csw.getrecords2(**kwa)
+                metrics.inc('fetch_bytes', len(self.csw.response), source_type='csw')
             except Exception as e:
-                error = f'Error getting records(2): {e}'
-                self.errors.append(error)
+                self.add_error('fetch_error', 'fetch', f'Error getting records(2): {e}',
+                               identifier=self.url, offset=kwa['startposition'])
                 break
 
             if self.csw.exceptionreport:
                 exceptions = self.csw.exceptionreport.exceptions
                 error = 'Error getting records: {}'.format(exceptions)
-                self.errors.append(error)
+                self.add_error('csw_exception', 'fetch', error, identifier=self.url, offset=kwa['startposition'])
                 # raise Exception(error)
                 break
 
@@ -132,19 +143,38 @@ class CSWSource(HarvesterBaseSource):
                 break
 
             startposition += page
+            if checkpoint is not None:
+                checkpoint.set_position('csw_startposition', startposition)
             if startposition > matches:
                 break
+            if end is not None:
+                if startposition >= end:
+                    break
+                kwa["maxrecords"] = min(page, end - startposition)
 
             kwa["startposition"] = startposition
 
         self.csw_info['total_records'] = len(self.csw_info['records'].keys())
 
+    def get_matches(self, outputschema='gmd', esn='brief'):
+        """ total records at the CSW source (to split it in shards) """
+        from owslib.csw import namespaces
+
+        with metrics.timer('fetch_seconds', source_type='csw', operation='GetRecords'):
+            self.csw.getrecords2(typenames='csw:Record', esn=esn, startposition=1, maxrecords=1,
+                                 outputschema=namespaces[outputschema])
+        return self.csw.results['matches']
+
     def get_record(self, identifier, esn='full', outputschema='gmd'):
         #  Get Full record info
+        from owslib.csw import namespaces
+        from owslib.ows import ExceptionReport
+
         try:
-            records = self.csw.getrecordbyid([identifier], outputschema=namespaces[outputschema])
+            with metrics.timer('fetch_seconds', source_type='csw', operation='GetRecordById'):
+                records = self.csw.getrecordbyid([identifier], outputschema=namespaces[outputschema])
         except ExceptionReport as e:
-            self.errors.append(f'Error getting record {e}')
+            self.add_error('csw_exception', 'fetch', f'Error getting record {e}', identifier=identifier)
             # 'Invalid parameter value: locator=outputSchema' is an XML error
             return None
 
@@ -164,6 +194,8 @@ class CSWSource(HarvesterBaseSource):
         # transform the XML in a dict as ISODocument class
         # (https://github.com/GSA/ckanext-spatial/blob/2a25f8d60c31add77e155c4136f2c0d4e3b86385/ckanext/spatial/model/harvested_metadata.py#L461) did with its read_values function.
 
+        from harvesters.csw.iso_geo import ISODocument  # lxml
+
         iso_parser = ISODocument(xml_str=xml_data)
         return iso_parser.read_values()
 
@@ -35,7 +35,7 @@ class ISOElement:
         for xpath in self.get_search_paths():
             elements = self.get_elements(tree, xpath)
             values = self.get_values(elements)
-            # logger.info(f'values {values}')
+            # logger.info('values %s', values)
             if values:
                 break
         return self.fix_multiplicity(values)
@@ -96,7 +96,7 @@ class ISOElement:
         elif self.multiplicity == "1":
             # 1 = Mandatory, maximum 1 = Exactly one
             if not values:
-                logger.warning('Value not found for element "{}"'.format(self.name))
+                logger.warning('Value not found for element "%s"', self.name)
                 return ''
             return values[0]
         elif self.multiplicity == "*":
@@ -112,7 +112,7 @@ class ISOElement:
             # 1..* = one or more
             return values
         else:
-            logger.warning('Multiplicity not specified for element: {}'.format(self.name))
+            logger.warning('Multiplicity not specified for element: %s', self.name)
             return values
 
 
@@ -879,12 +879,12 @@ class ISODocument:
         if self.xml_tree is None:
             parser = letree.XMLParser(remove_blank_text=True)
             if type(self.xml_str) != str:
-                logger.info('XML_STR is not str, is {}: {}'.format(type(self.xml_str), self.xml_str))
+                logger.info('XML_STR is not str, is %s: %s', type(self.xml_str), self.xml_str)
                 xml_str = str(self.xml_str)
             else:
                 xml_str = self.xml_str
 
-            # logger.debug(f'Parsing ISO XML {xml_str}')
+            # logger.debug('Parsing ISO XML %s', xml_str)
             self.xml_tree = letree.fromstring(xml_str, parser=parser)
         return self.xml_tree
 
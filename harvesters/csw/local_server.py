@@ -0,0 +1,362 @@
+"""
+Local stand-in for a CSW 2.0.2 endpoint
+
+Serves GetCapabilities, paged GetRecords (with numberOfRecordsMatched) and
+GetRecordById in the gmd (ISO 19139) output schema, so CSWSource can be
+exercised at scale without hitting a real geoportal.
+
+Records come from a folder of ISO XML files and/or are synthesized.
+Latency and the max page size are tunable to test paging strategies.
+
+Usage:
+    server = LocalCSWServer(synthesize=10000, latency=0.05, max_page_size=100)
+    server.start()
+    csw = CSWSource(url=server.url)
+    csw.fetch()
+    for record in csw.get_records(page=100):
+        ...
+    server.stop()
+
+or from the command line
+    python -m harvesters.csw.local_server --synthesize 10000 --port 8011
+"""
+import argparse
+import os
+import threading
+import time
+import xml.etree.ElementTree as xet
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs, urlparse
+from xml.sax.saxutils import escape
+
+from harvesters.logs import logger
+
+NAMESPACES = {
+    'csw': 'http://www.opengis.net/cat/csw/2.0.2',
+    'gmd': 'http://www.isotc211.org/2005/gmd',
+    'gmi': 'http://www.isotc211.org/2005/gmi',
+    'gco': 'http://www.isotc211.org/2005/gco',
+    'ows': 'http://www.opengis.net/ows',
+    'xlink': 'http://www.w3.org/1999/xlink',
+}
+
+CAPABILITIES_TEMPLATE = '''<?xml version="1.0" encoding="UTF-8"?>
+<csw:Capabilities xmlns:csw="{csw}" xmlns:ows="{ows}" xmlns:xlink="{xlink}" version="2.0.2">
+  <ows:ServiceIdentification>
+    <ows:Title>{title}</ows:Title>
+    <ows:Abstract>Local CSW stand-in serving {total} records</ows:Abstract>
+    <ows:Keywords><ows:Keyword>benchmark</ows:Keyword></ows:Keywords>
+    <ows:ServiceType>CSW</ows:ServiceType>
+    <ows:ServiceTypeVersion>2.0.2</ows:ServiceTypeVersion>
+    <ows:Fees>NONE</ows:Fees>
+    <ows:AccessConstraints>NONE</ows:AccessConstraints>
+  </ows:ServiceIdentification>
+  <ows:ServiceProvider>
+    <ows:ProviderName>ckan-harvesters</ows:ProviderName>
+    <ows:ProviderSite xlink:href="{url}"/>
+    <ows:ServiceContact>
+      <ows:IndividualName>Local stand-in</ows:IndividualName>
+      <ows:ContactInfo>
+        <ows:Address>
+          <ows:Country>US</ows:Country>
+          <ows:ElectronicMailAddress>local@example.com</ows:ElectronicMailAddress>
+        </ows:Address>
+      </ows:ContactInfo>
+    </ows:ServiceContact>
+  </ows:ServiceProvider>
+  <ows:OperationsMetadata>
+{operations}
+  </ows:OperationsMetadata>
+</csw:Capabilities>'''
+
+OPERATION_TEMPLATE = '''    <ows:Operation name="{name}">
+      <ows:DCP><ows:HTTP>
+        <ows:Get xlink:href="{url}"/>
+        <ows:Post xlink:href="{url}"/>
+      </ows:HTTP></ows:DCP>
+      <ows:Parameter name="outputSchema"><ows:Value>{gmd}</ows:Value></ows:Parameter>
+    </ows:Operation>'''
+
+GET_RECORDS_TEMPLATE = '''<?xml version="1.0" encoding="UTF-8"?>
+<csw:GetRecordsResponse xmlns:csw="{csw}" version="2.0.2">
+  <csw:SearchStatus timestamp="{timestamp}"/>
+  <csw:SearchResults numberOfRecordsMatched="{matches}" numberOfRecordsReturned="{returned}" nextRecord="{next_record}" elementSet="{esn}">
+{records}
+  </csw:SearchResults>
+</csw:GetRecordsResponse>'''
+
+GET_RECORD_BY_ID_TEMPLATE = '''<?xml version="1.0" encoding="UTF-8"?>
+<csw:GetRecordByIdResponse xmlns:csw="{csw}">
+{records}
+</csw:GetRecordByIdResponse>'''
+
+EXCEPTION_TEMPLATE = '''<?xml version="1.0" encoding="UTF-8"?>
+<ows:ExceptionReport xmlns:ows="{ows}" version="1.2.0">
+  <ows:Exception exceptionCode="{code}" locator="{locator}">
+    <ows:ExceptionText>{text}</ows:ExceptionText>
+  </ows:Exception>
+</ows:ExceptionReport>'''
+
+ISO_RECORD_TEMPLATE = '''<gmd:MD_Metadata xmlns:gmd="{gmd}" xmlns:gco="{gco}">
+  <gmd:fileIdentifier><gco:CharacterString>{identifier}</gco:CharacterString></gmd:fileIdentifier>
+  <gmd:language><gco:CharacterString>eng</gco:CharacterString></gmd:language>
+  <gmd:hierarchyLevel><gmd:MD_ScopeCode codeListValue="dataset">dataset</gmd:MD_ScopeCode></gmd:hierarchyLevel>
+  <gmd:dateStamp><gco:Date>2019-01-01</gco:Date></gmd:dateStamp>
+  <gmd:identificationInfo>
+    <gmd:MD_DataIdentification>
+      <gmd:citation><gmd:CI_Citation>
+        <gmd:title><gco:CharacterString>{title}</gco:CharacterString></gmd:title>
+      </gmd:CI_Citation></gmd:citation>
+      <gmd:abstract><gco:CharacterString>Synthesized record number {index}</gco:CharacterString></gmd:abstract>
+      <gmd:descriptiveKeywords><gmd:MD_Keywords>
+        <gmd:keyword><gco:CharacterString>synthetic</gco:CharacterString></gmd:keyword>
+        <gmd:keyword><gco:CharacterString>group-{group}</gco:CharacterString></gmd:keyword>
+      </gmd:MD_Keywords></gmd:descriptiveKeywords>
+    </gmd:MD_DataIdentification>
+  </gmd:identificationInfo>
+  <gmd:distributionInfo><gmd:MD_Distribution>
+    <gmd:transferOptions><gmd:MD_DigitalTransferOptions>
+      <gmd:onLine><gmd:CI_OnlineResource>
+        <gmd:linkage><gmd:URL>http://example.com/geoserver/wms?layers=layer-{index}</gmd:URL></gmd:linkage>
+        <gmd:name><gco:CharacterString>layer-{index}</gco:CharacterString></gmd:name>
+      </gmd:CI_OnlineResource></gmd:onLine>
+    </gmd:MD_DigitalTransferOptions></gmd:transferOptions>
+  </gmd:MD_Distribution></gmd:distributionInfo>
+</gmd:MD_Metadata>'''
+
+
+def synthesize_record(index):
+    """ build a minimal, valid ISO 19139 record """
+    identifier = f'local-csw-record-{index:07d}'
+    return identifier, ISO_RECORD_TEMPLATE.format(identifier=identifier,
+                                                  title=f'Synthetic dataset {index}',
+                                                  index=index,
+                                                  group=index % 100,
+                                                  **NAMESPACES)
+
+
+def read_records_folder(folder_path):
+    """ read ISO XML files from a folder.
+        Returns a list of (identifier, xml string) tuples """
+    records = []
+    roots = [f'{{{NAMESPACES["gmd"]}}}MD_Metadata', f'{{{NAMESPACES["gmi"]}}}MI_Metadata']
+    file_id_path = 'gmd:fileIdentifier/gco:CharacterString'
+
+    for file_name in sorted(os.listdir(folder_path)):
+        if not file_name.lower().endswith('.xml'):
+            continue
+        path = os.path.join(folder_path, file_name)
+        try:
+            tree = xet.parse(path)
+        except xet.ParseError as e:
+            logger.error('Unable to parse ISO file %s: %s', path, e)
+            continue
+
+        root = tree.getroot()
+        if root.tag not in roots:
+            found = [el for tag in roots for el in root.iter(tag)]
+            if len(found) == 0:
+                logger.error('No MD_Metadata found at %s', path)
+                continue
+            root = found[0]
+
+        fid = root.find(file_id_path, NAMESPACES)
+        identifier = fid.text.strip() if fid is not None and fid.text else os.path.splitext(file_name)[0]
+        records.append((identifier, xet.tostring(root, encoding='unicode')))
+
+    return records
+
+
+class LocalCSWServer:
+    """ Local CSW 2.0.2 endpoint backed by ISO XML files and/or synthesized records """
+
+    def __init__(self, records_folder=None, synthesize=0,
+                 latency=0.0,  # seconds to wait before each response
+                 max_page_size=None,  # cap for maxRecords (like real servers do)
+                 host='127.0.0.1', port=0,  # port 0: pick a free one
+                 title='Local CSW stand-in'):
+        self.title = title
+        self.latency = latency
+        self.max_page_size = max_page_size
+        self.host = host
+        self.port = port
+
+        self.records = []  # ordered (identifier, xml) list
+        if records_folder is not None:
+            self.records += read_records_folder(records_folder)
+        for index in range(synthesize):
+            self.records.append(synthesize_record(index))
+        self.index = {identifier: xml for identifier, xml in self.records}
+
+        # simple counters to inspect how clients page
+        self.requests = {'GetCapabilities': 0, 'GetRecords': 0, 'GetRecordById': 0}
+
+        self.httpd = None
+        self.thread = None
+
+    @property
+    def url(self):
+        return f'http://{self.host}:{self.port}/csw'
+
+    def start(self):
+        handler = type('BoundCSWHandler', (CSWRequestHandler, ), {'csw_server': self})
+        self.httpd = ThreadingHTTPServer((self.host, self.port), handler)
+        self.port = self.httpd.server_address[1]
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        logger.info('Local CSW serving %d records at %s', len(self.records), self.url)
+        return self.url
+
+    def stop(self):
+        if self.httpd is not None:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def get_capabilities(self):
+        operations = [OPERATION_TEMPLATE.format(name=name, url=escape(self.url), **NAMESPACES)
+                      for name in ['GetCapabilities', 'GetRecords', 'GetRecordById']]
+        return CAPABILITIES_TEMPLATE.format(title=escape(self.title),
+                                            total=len(self.records),
+                                            url=escape(self.url),
+                                            operations='\n'.join(operations),
+                                            **NAMESPACES)
+
+    def get_records(self, start_position=1, max_records=10, esn='summary', result_type='results'):
+        """ CSW positions are 1-based. nextRecord is 0 when there are no more records """
+        if self.max_page_size is not None:
+            max_records = min(max_records, self.max_page_size)
+        start_position = max(start_position, 1)
+
+        matches = len(self.records)
+        if result_type == 'hits':
+            page = []
+        else:
+            page = self.records[start_position - 1:start_position - 1 + max_records]
+
+        next_record = start_position + len(page)
+        if next_record > matches:
+            next_record = 0
+
+        return GET_RECORDS_TEMPLATE.format(timestamp=datetime.utcnow().isoformat(),
+                                           matches=matches,
+                                           returned=len(page),
+                                           next_record=next_record,
+                                           esn=escape(esn),
+                                           records='\n'.join(xml for identifier, xml in page),
+                                           **NAMESPACES)
+
+    def get_record_by_id(self, identifiers):
+        found = [self.index[idf] for idf in identifiers if idf in self.index]
+        if len(found) == 0:
+            return self.exception('InvalidParameterValue', 'id', f'Records not found: {identifiers}')
+        return GET_RECORD_BY_ID_TEMPLATE.format(records='\n'.join(found), **NAMESPACES)
+
+    def exception(self, code, locator, text):
+        return EXCEPTION_TEMPLATE.format(code=code, locator=locator, text=escape(text), **NAMESPACES)
+
+    def dispatch_kvp(self, params):
+        """ resolve a GET (KVP) request """
+        params = {k.lower(): v[0] for k, v in params.items()}
+        request = params.get('request', '')
+
+        if request == 'GetCapabilities':
+            return request, self.get_capabilities()
+        elif request == 'GetRecords':
+            return request, self.get_records(start_position=int(params.get('startposition', 1)),
+                                             max_records=int(params.get('maxrecords', 10)),
+                                             esn=params.get('elementsetname', 'summary'),
+                                             result_type=params.get('resulttype', 'results'))
+        elif request == 'GetRecordById':
+            identifiers = [idf for idf in params.get('id', '').split(',') if idf != '']
+            return request, self.get_record_by_id(identifiers)
+
+        return None, self.exception('OperationNotSupported', 'request', f'Unknown request "{request}"')
+
+    def dispatch_xml(self, body):
+        """ resolve a POST (XML) request """
+        try:
+            root = xet.fromstring(body)
+        except xet.ParseError as e:
+            return None, self.exception('NoApplicableCode', 'request', f'Invalid XML: {e}')
+
+        if root.tag == f'{{{NAMESPACES["csw"]}}}GetRecords':
+            esn = root.find('csw:Query/csw:ElementSetName', NAMESPACES)
+            return 'GetRecords', self.get_records(start_position=int(root.get('startPosition', 1)),
+                                                  max_records=int(root.get('maxRecords', 10)),
+                                                  esn=esn.text if esn is not None else 'summary',
+                                                  result_type=root.get('resultType', 'results'))
+        elif root.tag == f'{{{NAMESPACES["csw"]}}}GetRecordById':
+            identifiers = [el.text for el in root.findall('csw:Id', NAMESPACES)]
+            return 'GetRecordById', self.get_record_by_id(identifiers)
+        elif root.tag == f'{{{NAMESPACES["csw"]}}}GetCapabilities':
+            return 'GetCapabilities', self.get_capabilities()
+
+        return None, self.exception('OperationNotSupported', 'request', f'Unknown request "{root.tag}"')
+
+
+class CSWRequestHandler(BaseHTTPRequestHandler):
+    csw_server = None  # LocalCSWServer, bound at start()
+
+    def do_GET(self):
+        params = parse_qs(urlparse(self.path).query)
+        self.respond(*self.csw_server.dispatch_kvp(params))
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length)
+        self.respond(*self.csw_server.dispatch_xml(body))
+
+    def respond(self, request, xml):
+        if self.csw_server.latency:
+            time.sleep(self.csw_server.latency)
+        if request is not None:
+            self.csw_server.requests[request] += 1
+
+        data = xml.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/xml')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        logger.debug('Local CSW: ' + format, *args)
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    # http.server.ThreadingHTTPServer requires Python 3.7
+    daemon_threads = True
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local CSW 2.0.2 stand-in')
+    parser.add_argument('--records-folder', type=str, default=None, help='Folder with ISO XML files')
+    parser.add_argument('--synthesize', type=int, default=0, help='Number of records to synthesize')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds to wait before each response')
+    parser.add_argument('--max-page-size', type=int, default=None, help='Max records per GetRecords page')
+    parser.add_argument('--host', type=str, default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8011)
+    args = parser.parse_args()
+
+    server = LocalCSWServer(records_folder=args.records_folder,
+                            synthesize=args.synthesize,
+                            latency=args.latency,
+                            max_page_size=args.max_page_size,
+                            host=args.host,
+                            port=args.port)
+    server.start()
+    print(f'Serving CSW at {server.url}')
+    try:
+        server.thread.join()
+    except KeyboardInterrupt:
+        server.stop()
@@ -0,0 +1,219 @@
+"""
+Verify WMS resources in bulk
+
+CSW sources list many layers of the same WMS server. Each check is a
+GetCapabilities request, so we:
+ - normalize the URL (no params, lowercase host) and probe each server once
+ - run the probes concurrently, limited per host
+ - cache results with a TTL (optionally on disk, reused across runs).
+   Failed probes (timeouts, 5xx) are not an answer: they are cached just for a short time
+ - optionally defer all probes to a post-pass after the transformation
+"""
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import urlparse, urlunparse
+
+from harvesters.logs import logger
+from harvesters.metrics import metrics
+
+
+def normalize_capabilities_url(url):
+    """ base URL of the service: no params, lowercase scheme and host, no trailing slash """
+    parts = urlparse(url.strip())
+    path = parts.path.rstrip('/')
+    return urlunparse((parts.scheme.lower(), parts.netloc.lower(), path, None, None, None))
+
+
+class WMSVerifier:
+    """ Shared, cached and concurrent WMS checker """
+
+    def __init__(self, cache_path=None,
+                 ttl=7 * 24 * 3600,  # seconds to trust a cached result
+                 failure_ttl=600,  # seconds to remember a failed probe (not a WMS answer)
+                 timeout=10,
+                 max_workers=8,  # global probes at the same time
+                 per_host=2):  # probes at the same time for each host
+        self.cache_path = cache_path
+        self.ttl = ttl
+        self.failure_ttl = failure_ttl
+        self.timeout = timeout
+        self.max_workers = max_workers
+        self.per_host = per_host
+
+        self.cache = {}  # normalized URL: {'is_wms': bool, 'checked': timestamp, 'failed': bool}
+        self.pending = set()  # deferred normalized URLs
+        self.in_flight = {}  # normalized URL: Future
+        self.host_semaphores = {}
+        self.lock = threading.Lock()
+        self.executor = None
+
+        if cache_path is not None:
+            self.load()
+
+    def load(self):
+        if not os.path.isfile(self.cache_path):
+            return
+        f = open(self.cache_path, 'r')
+        try:
+            self.cache = json.load(f)
+        except ValueError as e:
+            logger.error('Invalid WMS cache at %s: %s', self.cache_path, e)
+            self.cache = {}
+        f.close()
+
+    def save(self):
+        if self.cache_path is None:
+            return
+        with self.lock:
+            dmp = json.dumps(self.cache, indent=2)
+        f = open(self.cache_path, 'w')
+        f.write(dmp)
+        f.close()
+
+    def get_cached(self, url):
+        """ cached entry for this URL or None if unknown or expired """
+        entry = self.cache.get(normalize_capabilities_url(url))
+        if entry is None:
+            return None
+        ttl = self.failure_ttl if entry.get('failed') else self.ttl
+        if time.time() - entry['checked'] > ttl:
+            return None
+        return entry
+
+    def probe(self, url):
+        """ Checks if the URL actually points to a Web Map Service.
+            Uses owslib WMS reader to parse the response.
+            Returns None if there is no answer (errors, non 2xx responses) """
+        import requests
+        from owslib import wms
+
+        host = urlparse(url).netloc
+        with self.lock:
+            semaphore = self.host_semaphores.setdefault(host, threading.Semaphore(self.per_host))
+
+        with semaphore:
+            try:
+                capabilities_url = wms.WMSCapabilitiesReader().capabilities_url(url)
+                with metrics.timer('wms_probe_seconds'):
+                    res = requests.get(capabilities_url, timeout=self.timeout)
+            except Exception as e:
+                logger.error('WMS check for %s failed with exception: %s', url, e)
+                metrics.inc('wms_probes', is_wms='failed')
+                return None
+            if res.status_code // 100 != 2:
+                logger.error('WMS check for %s failed with status %s', url, res.status_code)
+                metrics.inc('wms_probes', is_wms='failed')
+                return None
+            try:
+                s = wms.WebMapService(url, xml=res.text)
+                is_wms = isinstance(s.contents, dict) and s.contents != {}
+            except Exception as e:
+                # the server answered with something else
+                logger.error('WMS check for %s, invalid capabilities: %s', url, e)
+                is_wms = False
+
+        metrics.inc('wms_probes', is_wms=is_wms)
+        return is_wms
+
+    def _probe_and_store(self, key):
+        is_wms = self.probe(key)
+        with self.lock:
+            self.cache[key] = {'is_wms': bool(is_wms), 'checked': time.time(), 'failed': is_wms is None}
+            self.in_flight.pop(key, None)
+        return bool(is_wms)
+
+    def submit(self, url):
+        """ start (or join) the probe for this URL. Returns a Future """
+        key = normalize_capabilities_url(url)
+        with self.lock:
+            if key in self.in_flight:
+                return self.in_flight[key]
+            entry = self.get_cached(key)
+            if entry is not None:
+                # finished while we were waiting for the lock
+                done = Future()
+                done.set_result(entry['is_wms'])
+                return done
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=self.max_workers)
+            future = self.executor.submit(self._probe_and_store, key)
+            self.in_flight[key] = future
+        return future
+
+    def verify(self, url):
+        """ check one URL, cached """
+        entry = self.get_cached(url)
+        if entry is not None:
+            metrics.inc('wms_cache', result='hit')
+            return entry['is_wms']
+        metrics.inc('wms_cache', result='miss')
+        return self.submit(url).result()
+
+    def verify_many(self, urls):
+        """ check many URLs concurrently, each server just once.
+            Returns a dict {url: is_wms} """
+        futures = {}
+        results = {}
+        for url in urls:
+            entry = self.get_cached(url)
+            if entry is not None:
+                metrics.inc('wms_cache', result='hit')
+                results[url] = entry['is_wms']
+            else:
+                metrics.inc('wms_cache', result='miss')
+                futures[url] = self.submit(url)
+
+        for url, future in futures.items():
+            results[url] = future.result()
+
+        self.save()
+        return results
+
+    def defer(self, url):
+        """ queue a URL to check later with verify_pending """
+        with self.lock:
+            self.pending.add(normalize_capabilities_url(url))
+
+    def verify_pending(self, wait=True):
+        """ post-pass for deferred URLs.
+            With wait=False the probes run in background and
+            a dict of {url: Future} is returned """
+        with self.lock:
+            pending = list(self.pending)
+            self.pending = set()
+
+        if wait:
+            return self.verify_many(pending)
+
+        return {url: self.submit(url) for url in pending if self.get_cached(url) is None}
+
+    def apply(self, resources):
+        """ mark already verified WMS resources (after verify_pending) """
+        for resource in resources:
+            if resource.get('format') != 'wms':
+                continue
+            entry = self.get_cached(resource['url'])
+            if entry is not None and entry['is_wms']:
+                resource['verified'] = True
+                resource['verified_date'] = datetime.fromtimestamp(entry['checked']).isoformat()
+        return resources
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+        self.save()
+
+
+_default_verifier = None
+
+
+def get_default_verifier():
+    global _default_verifier
+    if _default_verifier is None:
+        _default_verifier = WMSVerifier()
+    return _default_verifier
@@ -1,10 +1,13 @@
 import json
+import logging
 from slugify import slugify
-from harvesters.logs import logger
+from harvesters.logs import logger, PER_DATASET
+from harvesters.metrics import metrics
 from harvesters.helpers import clean_tags
 from harvesters.datajson.ckan.resource import DataJSONDistribution
 from harvester_adapters.ckan import settings as ckan_settings
 from harvester_adapters.ckan.dataset import CKANDatasetAdapter
+from harvester_adapters.ckan.resource_merge import merge_resources
 
 
 class DataJSONSchema1_1(CKANDatasetAdapter):
@@ -14,6 +17,7 @@ class DataJSONSchema1_1(CKANDatasetAdapter):
     # value at data.json -> value at CKAN dataset
 
     ckan_owner_org_id = None  # required, the client must inform which existing org
+    resources_merge_report = None  # ResourceMergeReport from the last merge_resources
 
     def __init__(self, original_dataset, schema='default'):
         super().__init__(original_dataset, schema=schema)
@@ -133,7 +137,7 @@ class DataJSONSchema1_1(CKANDatasetAdapter):
                 ok = False
 
         if not ok:
-            logger.info(f'requires failed on {self.original_dataset}: {self.errors}')
+            logger.info('requires failed on %s: %s', self.original_dataset.get('identifier', ''), self.errors, extra=PER_DATASET)
         return ok
 
     def fix_fields(self, field, value):
@@ -175,20 +179,22 @@ class DataJSONSchema1_1(CKANDatasetAdapter):
         resources = []
         for original_resource in distribution:
             try:
-                cra = DataJSONDistribution(original_resource=original_resource)
-                resource_transformed = cra.transform_to_ckan_resource()
+                with metrics.timer('resource_transform_seconds', source_type='datajson'):
+                    cra = DataJSONDistribution(original_resource=original_resource)
+                    resource_transformed = cra.transform_to_ckan_resource()
             except Exception as e:
                 resource_transformed = {'error': e}
             resources.append(resource_transformed)
 
         return resources
 
+    @metrics.timed('transform_seconds', source_type='datajson')
     def transform_to_ckan_dataset(self, existing_resources=None):
         # check how to parse
         # https://github.com/GSA/ckanext-datajson/blob/07ca20e0b6dc1898f4ca034c1e073e0c27de2015/ckanext/datajson/parse_datajson.py#L5
         # if we are updating existing dataset we need to merge resources
 
-        logger.info('Transforming data.json dataset {}'.format(self.original_dataset.get('identifier', '')))
+        logger.info('Transforming data.json dataset %s', self.original_dataset.get('identifier', ''), extra=PER_DATASET)
         valid = self.validate_origin_dataset()
         if not valid:
             # raise Exception(f'Error validating origin dataset: {error}')
@@ -200,15 +206,19 @@ class DataJSONSchema1_1(CKANDatasetAdapter):
         self.ckan_dataset['tag_string'] = ','.join(cleaned_tags)
 
         # previous transformations at origin
+        debug = logger.isEnabledFor(logging.DEBUG)  # skip per-field calls when not needed
         for old_field, field_ckan in self.mapped_fields.items():
-            logger.debug(f'Connecting fields "{old_field}", "{field_ckan}"')
+            if debug:
+                logger.debug('Connecting fields "%s", "%s"', old_field, field_ckan)
             # identify origin and set value to destination
             origin = self.identify_origin_element(raw_field=old_field)
             if origin is None:
-                logger.debug(f'No data in origin for "{old_field}"')
+                if debug:
+                    logger.debug('No data in origin for "%s"', old_field)
             else:
                 self.set_destination_element(raw_field=field_ckan, new_value=origin)
-                logger.debug(f'Connected OK fields "{old_field}"="{origin}"')
+                if debug:
+                    logger.debug('Connected OK fields "%s"="%s"', old_field, origin)
 
         # transform distribution into resources
         distribution = datajson_dataset['distribution'] if 'distribution' in datajson_dataset else []
@@ -285,20 +295,19 @@ class DataJSONSchema1_1(CKANDatasetAdapter):
         if valid is None:
             return None
 
-        logger.info('Dataset transformed {} OK'.format(self.original_dataset.get('identifier', '')))
+        logger.info('Dataset transformed %s OK', self.original_dataset.get('identifier', ''), extra=PER_DATASET)
         return ckan_dataset_copy
 
     def merge_resources(self, existing_resources, new_resources):
         # if we are updating datasets we need to check if the resources exists and merge them
         # https://github.com/GSA/ckanext-datajson/blob/07ca20e0b6dc1898f4ca034c1e073e0c27de2015/ckanext/datajson/harvester_base.py#L681
 
-        merged_resources = []
+        merged_resources, report = merge_resources(existing_resources=existing_resources,
+                                                   new_resources=new_resources)
+        # with no changes CKAN updates can skip resources
+        self.resources_merge_report = report
+        for result, total in report.as_dict().items():
+            metrics.inc('resources_merged', total, result=result)
+        logger.debug('Resources merged: %s', report.as_dict())
 
-        for res in new_resources:
-            for existing_res in existing_resources:
-                if res["url"] == existing_res["url"]:
-                    # in CKAN exts maybe the have an ID because a local show
-                    res["id"] = existing_res["id"]
-            merged_resources.append(res)
-
-        return merged_resources
\ No newline at end of file
+        return merged_resources
@@ -0,0 +1,119 @@
+"""
+Fill collection_package_id for data.json datasets with "isPartOf"
+
+DataJSON.post_fetch marks children (collection_pkg_id = '') and parents (is_collection).
+The resolver writes parents first, keeps the new CKAN package ids in memory and finds
+already existing parents with one bulk lookup, so no child needs a show_package.
+
+    resolver = CollectionResolver(ckan_api)
+    responses = resolver.write(dj.datasets, write=write_datasets)
+
+"write" gets a list of data.json datasets (a level: no dataset depends on another one at
+the same level) with collection_pkg_id filled and returns the CKAN API responses in
+the same order, e.g. transform + CKANPortalAPI.upsert_packages.
+"""
+from harvester_adapters.ckan.api import record_value
+from harvesters.logs import logger
+from harvesters.metrics import metrics
+
+
+class CollectionResolver:
+    """ parents-first writes and bulk resolution of isPartOf """
+
+    def __init__(self, ckan_api=None, field='extras_identifier'):
+        self.ckan_api = ckan_api  # for existing parents, None to skip the lookup
+        self.field = field
+        self.package_ids = {}  # parent identifier: CKAN package id
+        self.cycles = []  # identifiers where an isPartOf cycle was broken
+
+    def order(self, datasets):
+        """ topological order over isPartOf.
+            Returns a list of levels (lists of datasets): parents always at a previous level """
+        self.cycles = []
+        parents = {}
+        in_source = set(dataset.get('identifier') for dataset in datasets)
+        for dataset in datasets:
+            parent = dataset.get('isPartOf')
+            if parent is not None and parent in in_source:
+                parents[dataset.get('identifier')] = parent
+
+        depths = {}
+        for dataset in datasets:
+            path = []
+            identifier = dataset.get('identifier')
+            while identifier not in depths:
+                if identifier in path:
+                    logger.error('isPartOf cycle at %s', identifier)
+                    self.cycles.append(identifier)
+                    depths[identifier] = 0
+                    path.remove(identifier)
+                    break
+                path.append(identifier)
+                if identifier not in parents:
+                    depths[identifier] = 0
+                    path.pop()
+                    break
+                identifier = parents[identifier]
+            for child in reversed(path):
+                depths[child] = depths[parents[child]] + 1
+
+        levels = []
+        for dataset in datasets:
+            depth = depths[dataset.get('identifier')]
+            while len(levels) <= depth:
+                levels.append([])
+            levels[depth].append(dataset)
+        return levels
+
+    def lookup_parents(self, datasets):
+        """ one bulk lookup for all the parents (at the source or not) already in CKAN """
+        identifiers = [dataset['isPartOf'] for dataset in datasets
+                       if dataset.get('isPartOf') is not None and dataset['isPartOf'] not in self.package_ids]
+        if self.ckan_api is None or len(identifiers) == 0:
+            return
+        packages = self.ckan_api.show_packages_by_identifier(identifiers, field=self.field)
+        for identifier, package in packages.items():
+            self.package_ids[identifier] = record_value(package, 'id')
+
+    def record(self, identifier, package_id):
+        """ save the CKAN id of a written package """
+        if identifier is not None and package_id is not None:
+            self.package_ids[identifier] = package_id
+
+    def record_responses(self, datasets, responses):
+        for dataset, response in zip(datasets, responses):
+            result = response.get('result') if isinstance(response, dict) else None
+            if result is not None:
+                self.record(dataset.get('identifier'), record_value(result, 'id'))
+
+    def resolve(self, datasets):
+        """ fill collection_pkg_id for the children with a known parent.
+            Returns the number of unresolved children """
+        unresolved = 0
+        for dataset in datasets:
+            parent = dataset.get('isPartOf')
+            if parent is None:
+                continue
+            package_id = self.package_ids.get(parent)
+            if package_id is None:
+                unresolved += 1
+                dataset['collection_pkg_id'] = ''
+                metrics.inc('collection_links', status='unresolved')
+            else:
+                dataset['collection_pkg_id'] = package_id
+                metrics.inc('collection_links', status='resolved')
+        if unresolved > 0:
+            logger.error('%s datasets with an unknown parent (isPartOf)', unresolved)
+        return unresolved
+
+    def write(self, datasets, write):
+        """ write all the datasets, parents first. Returns the API responses (same order as datasets) """
+        self.lookup_parents(datasets)
+        responses = {}
+        for level in self.order(datasets):
+            self.resolve(level)
+            level_responses = write(level)
+            self.record_responses(level, level_responses)
+            for dataset, response in zip(level, level_responses):
+                responses[id(dataset)] = response
+        return [responses.get(id(dataset)) for dataset in datasets]
@@ -0,0 +1,206 @@
+"""
+Download many data.json sources at the same time (optional, requires aiohttp)
+
+ - per host and global limits, timeout for each download
+ - conditional requests (ETag / Last-Modified) and a sha256 of the body
+   to tell changed from unchanged sources
+ - bodies are streamed to the cache folder, never kept in memory
+
+    fetcher = DataJSONBatchFetcher(cache_folder='data/datajson-cache', per_host=2)
+    for result in fetcher.fetch(sources):  # URLs or harvest sources (dicts with "url")
+        print(result.url, result.status, result.bytes, result.seconds)
+
+Then read a downloaded file with DataJSON.read_local_data_json(result.path)
+"""
+import asyncio
+import hashlib
+import json
+import os
+import time
+from urllib.parse import urlparse
+
+from slugify import slugify
+
+from harvesters import config
+from harvesters.checkpoint import atomic_write
+from harvesters.logs import logger
+from harvesters.metrics import metrics
+
+
+class FetchResult:
+    """ result of one download """
+
+    def __init__(self, url, name):
+        self.url = url
+        self.name = name
+        self.status = None  # changed | unchanged | error
+        self.http_status = None
+        self.bytes = 0
+        self.seconds = 0
+        self.hash = None
+        self.path = None  # cached body
+        self.error = None
+
+    def as_dict(self):
+        return {'url': self.url, 'name': self.name, 'status': self.status, 'http_status': self.http_status,
+                'bytes': self.bytes, 'seconds': self.seconds, 'hash': self.hash, 'path': self.path,
+                'error': self.error}
+
+
+class DataJSONBatchFetcher:
+    """ concurrent data.json downloads """
+
+    def __init__(self, cache_folder=None,
+                 per_host=2,  # downloads at the same time for each host
+                 max_concurrent=50,  # downloads at the same time
+                 timeout=120,  # seconds for each download
+                 chunk_size=64 * 1024):
+        if cache_folder is None:
+            cache_folder = os.path.join(config.get('DATA_FOLDER_PATH'), 'datajson-cache')
+        self.cache_folder = cache_folder
+        self.per_host = per_host
+        self.max_concurrent = max_concurrent
+        self.timeout = timeout
+        self.chunk_size = chunk_size
+        self.index_path = os.path.join(cache_folder, '_index.json')  # slugified names never start with _
+        self.index = {}  # url: {'hash', 'etag', 'last_modified', 'bytes', 'fetched'}
+        self.host_semaphores = {}
+        self.semaphore = None
+
+        if not os.path.isdir(cache_folder):
+            os.makedirs(cache_folder)
+        self.load_index()
+
+    def load_index(self):
+        if not os.path.isfile(self.index_path):
+            return
+        f = open(self.index_path, 'r')
+        try:
+            self.index = json.load(f)
+        except ValueError as e:
+            logger.error('Invalid data.json cache index at %s: %s', self.index_path, e)
+            self.index = {}
+        f.close()
+
+    def save_index(self):
+        atomic_write(self.index_path, json.dumps(self.index, indent=2))
+
+    def get_session(self):
+        try:
+            import aiohttp
+        except ImportError:
+            raise ImportError('aiohttp is required for the batch fetcher: pip install ckan-harvesters[async]')
+        connector = aiohttp.TCPConnector(limit=self.max_concurrent)
+        return aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=self.timeout))
+
+    def cache_path(self, url, name):
+        """ readable file name plus a short URL hash: different URLs never share a file """
+        url_hash = hashlib.sha1(url.encode('utf-8')).hexdigest()[:8]
+        return os.path.join(self.cache_folder, '{}-{}.json'.format(slugify(name or url)[:200], url_hash))
+
+    def get_host_semaphore(self, url):
+        host = urlparse(url).netloc.lower()
+        if host not in self.host_semaphores:
+            self.host_semaphores[host] = asyncio.Semaphore(self.per_host)
+        return self.host_semaphores[host]
+
+    def request_headers(self, url, path):
+        """ conditional request headers from the last download (if we still have the file) """
+        headers = {}
+        if not os.path.isfile(path):
+            return headers
+        previous = self.index.get(url, {})
+        if previous.get('etag'):
+            headers['If-None-Match'] = previous['etag']
+        if previous.get('last_modified'):
+            headers['If-Modified-Since'] = previous['last_modified']
+        return headers
+
+    async def fetch_one(self, session, source):
+        if isinstance(source, dict):
+            url, name = source['url'], source.get('name')
+        else:
+            url, name = source, None
+        result = FetchResult(url=url, name=name)
+        result.path = self.cache_path(url, name)
+        previous = self.index.get(url, {})
+
+        async with self.semaphore, self.get_host_semaphore(url):
+            started = time.time()  # not counting the wait for a free slot
+            try:
+                async with session.get(url, headers=self.request_headers(url, result.path)) as res:
+                    result.http_status = res.status
+                    if res.status == 304 and os.path.isfile(result.path):
+                        result.status = 'unchanged'
+                        result.hash = previous.get('hash')
+                        result.bytes = previous.get('bytes', 0)
+                    elif res.status == 304:
+                        # nothing cached to reuse: next sweep downloads it again
+                        self.index.pop(url, None)
+                        result.status = 'error'
+                        result.error = '{} not modified (304) but there is no cached file'.format(url)
+                    elif res.status >= 400:
+                        result.status = 'error'
+                        result.error = '{} HTTP error: {}'.format(url, res.status)
+                    else:
+                        await self.save_body(res, result)
+                        result.status = 'unchanged' if result.hash == previous.get('hash') else 'changed'
+                        self.index[url] = {'hash': result.hash, 'bytes': result.bytes,
+                                           'etag': res.headers.get('ETag'),
+                                           'last_modified': res.headers.get('Last-Modified'),
+                                           'fetched': time.time()}
+            except Exception as e:
+                result.status = 'error'
+                result.error = 'ERROR Donwloading data: {} [{}]'.format(url, repr(e) if str(e) == '' else e)
+
+        result.seconds = time.time() - started
+        if result.status == 'error':
+            logger.error(result.error)
+        metrics.observe('fetch_seconds', result.seconds, source_type='datajson', status=result.http_status)
+        metrics.inc('fetch_bytes', result.bytes, source_type='datajson')
+        metrics.inc('datajson_sweep', status=result.status)
+        return result
+
+    async def save_body(self, res, result):
+        """ stream the body to the cache (temp file + rename) and hash it """
+        sha = hashlib.sha256()
+        tmp_path = '{}.tmp'.format(result.path)
+        f = open(tmp_path, 'wb')
+        try:
+            async for chunk in res.content.iter_chunked(self.chunk_size):
+                sha.update(chunk)
+                result.bytes += len(chunk)
+                f.write(chunk)
+        except Exception:
+            f.close()
+            os.remove(tmp_path)
+            raise
+        f.close()
+        os.replace(tmp_path, result.path)
+        result.hash = sha.hexdigest()
+
+    async def fetch_all(self, sources):
+        """ download all the sources. Results in the same order.
+            A URL listed many times is downloaded once (same result for all of them) """
+        self.semaphore = asyncio.Semaphore(self.max_concurrent)
+        self.host_semaphores = {}
+        unique = {}
+        for source in sources:
+            url = source['url'] if isinstance(source, dict) else source
+            unique.setdefault(url, source)
+        session = self.get_session()
+        try:
+            results = await asyncio.gather(*[self.fetch_one(session, source) for source in unique.values()])
+        finally:
+            await session.close()
+        self.save_index()
+        by_url = dict(zip(unique.keys(), results))
+        return [by_url[source['url'] if isinstance(source, dict) else source] for source in sources]
+
+    def fetch(self, sources):
+        """ blocking version of fetch_all """
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(self.fetch_all(sources))
+        finally:
+            loop.close()
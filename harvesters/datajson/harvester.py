@@ -3,20 +3,16 @@ process Data JSON files
     check the schema definition: https://project-open-data.cio.gov/v1.1/schema/catalog.json
     validate: maybe with this https://github.com/Julian/jsonschema
 """
-import codecs
-import csv
 import json
 import os
-import urllib.request
-
-import jsonschema as jss
-import requests
-import rfc3987 as rfc3987_url
-from slugify import slugify
-from validate_email import validate_email
+from functools import lru_cache
 
+from harvesters.checkpoint import content_hash
+from harvesters.errors import byte_offset, excerpt_at, truncate, validation_message
 from harvesters.logs import logger
 from harvesters.harvester import HarvesterBaseSource
+from harvesters.metrics import metrics
+from harvesters.datajson.precheck import best_match, get_envelope_validator, get_precheck, get_validator
 
 # valid schema to analyze
 VALID_DATAJSON_SCHEMAS = {
@@ -35,30 +31,34 @@ class DataJSON(HarvesterBaseSource):
 
     def fetch(self, timeout=30):
         """ download de data.json file """
-        logger.info(f'Fetching data from {self.url}')
+        logger.info('Fetching data from %s', self.url)
         if self.url is None:
-            error = "No URL defined"
-            self.errors.append(error)
+            error = self.add_error('no_url', 'fetch', 'No URL defined')
             logger.error(error)
             raise Exception(error)
 
+        import requests
+
         try:
-            req = requests.get(self.url, timeout=timeout)
+            with metrics.timer('fetch_seconds', source_type='datajson') as labels:
+                req = requests.get(self.url, timeout=timeout)
+                labels['status'] = req.status_code
         except Exception as e:
-            error = 'ERROR Donwloading data: {} [{}]'.format(self.url, e)
-            self.errors.append(error)
+            error = self.add_error('fetch_error', 'fetch', 'ERROR Donwloading data: {} [{}]'.format(self.url, e),
+                                   identifier=self.url)
             logger.error(error)
             raise
 
-        logger.info(f'Data fetched status {req.status_code}')
+        logger.info('Data fetched status %s', req.status_code)
         if req.status_code >= 400:
-            error = '{} HTTP error: {}'.format(self.url, req.status_code)
-            self.errors.append(error)
+            error = self.add_error('http_error', 'fetch', '{} HTTP error: {}'.format(self.url, req.status_code),
+                                   identifier=self.url, excerpt=req.content)
             logger.error(error)
             raise Exception(error)
 
-        logger.info(f'Data fetched OK')
+        logger.info('Data fetched OK')
         self.raw_data_json = req.content
+        metrics.inc('fetch_bytes', len(req.content), source_type='datajson')
 
     def read_local_data_json(self, data_json_path):
         # initialize reading a JSON file
@@ -73,16 +73,23 @@ class DataJSON(HarvesterBaseSource):
         self.data_json = data_json_dict
         return True, None
 
-    def validate(self, validator_schema):
+    @metrics.timed('validate_seconds', scope='catalog')
+    def validate(self, validator_schema,
+                 mode='full'):  # 'full' | 'envelope'
         """ Validate the data.json suorce 
             We need to know which validator to use 
             and two jsonschema definition file
             at ./validation/schemas/{validator_schema}
                 /catalog.json: definition for full data.json 
                 /dataset.json: definition for each dataset
+            With mode='envelope' just the headers and the "dataset" array type
+            are checked here. Then use validate_datasets to validate each
+            dataset just once
             """
         if validator_schema not in VALID_DATAJSON_SCHEMAS:
             raise Exception(f'Unknown validator_schema {validator_schema}')
+        if mode not in ('full', 'envelope'):
+            raise ValueError(f'Unknown validation mode "{mode}"')
         
         self.schema_version = VALID_DATAJSON_SCHEMAS[validator_schema]
         
@@ -91,8 +98,15 @@ class DataJSON(HarvesterBaseSource):
             try:
                 self.data_json = json.loads(self.raw_data_json)
             except Exception as e:
-                error = 'ERROR parsing JSON: {}. Data: {}'.format(e, self.raw_data_json)
-                self.errors.append(error)
+                # just the data around the problem, the file could be huge
+                offset = getattr(e, 'pos', None)  # chars in the decoded text (e.doc)
+                if offset is None:
+                    excerpt = truncate(self.raw_data_json)
+                else:
+                    excerpt = excerpt_at(e.doc, offset)
+                    offset = byte_offset(e.doc, offset)  # UTF-8 bytes, as in the downloaded file
+                error = self.add_error('json_parse', 'validate', 'ERROR parsing JSON: {}'.format(e),
+                                       identifier=self.url, excerpt=excerpt, offset=offset)
                 logger.error(error)
                 return False
             
@@ -104,30 +118,38 @@ class DataJSON(HarvesterBaseSource):
             error = 'Data.json is a simple list. We expect a dict'  
             
         if error is not None:
-            self.errors.append(error)
+            self.add_error('invalid_catalog', 'validate', error, identifier=self.url)
             logger.error(error)
             return False
 
         # validate with json schema
-        schemas_folder = os.path.join(os.path.dirname(__file__),
-                                                      'validation',
-                                                      'schemas',
-                                                      validator_schema) 
-        catalog_schema = os.path.join(schemas_folder, 'catalog.json')
-
-        if os.path.isfile(catalog_schema):
-            f = open(catalog_schema, 'r')
-            schema = json.load(f)
-            
+        if mode == 'envelope':
+            validator = get_envelope_validator(validator_schema)
+        else:
+            validator = get_validator(validator_schema, 'catalog')
+        if validator is not None:
             try:
-                jss.validate(instance=self.data_json, schema=schema)
+                error = best_match(validator.iter_errors(self.data_json))
             except Exception as e:
-                error = "Error validating catalog: {} with schema {}".format(e, schema)
-                self.errors.append(error)
+                error = e  # e.g. unresolvable $ref
+            if error is not None:
+                error = "Error validating catalog: {}".format(validation_message(error))
+                self.add_error('invalid_catalog', 'validate', error, identifier=self.url)
                 return False
 
         return True
 
+    def validate_datasets(self, validator_schema, all_errors=False):
+        """ validate each dataset, one by one.
+            Yields (dataset, errors). errors is an empty list for valid datasets """
+        for dataset in self.data_json['dataset']:
+            if type(dataset) != dict:
+                yield dataset, ['Error validating dataset: {} is not of type \'object\''.format(truncate(dataset))]
+                continue
+            ds = DataJSONDataset(dataset=dataset)
+            ds.validate(validator_schema=validator_schema, all_errors=all_errors)
+            yield dataset, ds.errors
+
     def post_fetch(self):
         # save headers
         self.headers = self.data_json.copy()
@@ -144,6 +166,24 @@ class DataJSON(HarvesterBaseSource):
         self.datasets = self.data_json['dataset']
         self.__detect_collections()
 
+    def iter_datasets(self, checkpoint=None):
+        """ iterate datasets.
+            With a checkpoint (harvesters.checkpoint.Checkpoint) we start after the last completed
+            dataset if the data.json file didn't change. A dataset is completed when the next one is requested """
+        start = 0
+        if checkpoint is not None:
+            source = self.raw_data_json if self.raw_data_json is not None else self.data_json
+            if checkpoint.check_source(content_hash(source)):
+                start = checkpoint.get_position('dataset_index', 0)
+
+        for index in range(start, len(self.datasets)):
+            yield self.datasets[index]
+            if checkpoint is not None:
+                checkpoint.set_position('dataset_index', index + 1, force=False)
+
+        if checkpoint is not None:
+            checkpoint.save()
+
     def __detect_collections(self):
         # if a dataset has the property "isPartOf" assigned then
         #   this datasets must be marked as is_colleccion
@@ -188,38 +228,72 @@ class DataJSON(HarvesterBaseSource):
         return self.data_json
 
 
+OMB_BUREAU_CODES_URL = "https://project-open-data.cio.gov/data/omb_bureau_codes.csv"
+
+
+@lru_cache(maxsize=4)
+def get_omb_bureau_codes(url=OMB_BUREAU_CODES_URL):
+    """ set of "agency:bureau" codes. Downloaded once per run """
+    import codecs
+    import csv
+    import urllib.request
+
+    omb_bureau_codes = set()
+    # Constant URL is safe from protocol scheme abuse (bandit B310)
+    ftpstream = urllib.request.urlopen(url) #nosec
+    csvfile = csv.DictReader(codecs.iterdecode(ftpstream, 'utf-8'))
+    for row in csvfile:
+        omb_bureau_codes.add(row["Agency Code"] + ":" + row["Bureau Code"])
+    return omb_bureau_codes
+
+
 class DataJSONDataset:
 
     def __init__(self, dataset):
         assert type(dataset) == dict
         self.data = dataset  # a dict
-        self.bureau_code_url = "https://project-open-data.cio.gov/data/omb_bureau_codes.csv"
-        
+        self.bureau_code_url = OMB_BUREAU_CODES_URL
         self.errors = []
-        self.omb_burueau_codes = set()
-        # Constant URL is safe from protocol scheme abuse (bandit B310)
-        self.ftpstream = urllib.request.urlopen(self.bureau_code_url) #nosec
-        self.csvfile = csv.DictReader(codecs.iterdecode(self.ftpstream, 'utf-8'))
-        for row in self.csvfile:
-            self.omb_burueau_codes.add(row["Agency Code"] + ":" + row["Bureau Code"])
-
-    def validate(self, validator_schema):
-
-        schemas_folder = os.path.join(os.path.dirname(__file__),
-                                                      'validation',
-                                                      'schemas',
-                                                      validator_schema) 
-        dataset_schema = os.path.join(schemas_folder, 'dataset.json')
-        if os.path.isfile(dataset_schema):
-            f = open(dataset_schema, 'r')
-            schema = json.load(f)
-            
+
+    @property
+    def omb_burueau_codes(self):
+        return get_omb_bureau_codes(self.bureau_code_url)
+
+    @metrics.timed('validate_seconds', scope='dataset')
+    def validate(self, validator_schema, all_errors=False):
+        """ validate the dataset with ./validation/schemas/{validator_schema}/dataset.json
+            A fast precheck (required keys, types) rejects obviously bad datasets
+            before the full JSON Schema validation.
+            With all_errors=True all the errors are collected, not just the first one,
+            so the JSON Schema validation always runs (the precheck knows just a subset) """
+
+        validator = get_validator(validator_schema, 'dataset')
+        precheck = get_precheck(validator_schema, 'dataset')
+        if precheck is not None and (not all_errors or validator is None):
+            errors = precheck.errors(self.data, all_errors=all_errors)
+            metrics.inc('validation_precheck', result='rejected' if errors else 'passed')
+            if len(errors) > 0:
+                for error in errors:
+                    error = "Error validating dataset: {}".format(truncate(error))
+                    self.errors.append(error)
+                    logger.error(error)
+                return False
+
+        if validator is not None:
             try:
-                jss.validate(self.data, schema=schema)
+                if all_errors:
+                    errors = list(validator.iter_errors(self.data))
+                else:
+                    error = best_match(validator.iter_errors(self.data))
+                    errors = [] if error is None else [error]
             except Exception as e:
-                error = "Error validating dataset: {}".format(e)
-                self.errors.append(error)
-                logger.error(error)
+                errors = [e]
+            errors = ["Error validating dataset: {}".format(validation_message(error)) for error in errors]
+
+            if len(errors) > 0:
+                for error in errors:
+                    self.errors.append(error)
+                    logger.error(error)
                 return False
         
         if validator_schema in ['federal-v1.1', 'federal']:
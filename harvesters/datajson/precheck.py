@@ -0,0 +1,191 @@
+"""
+Cheap checks before the full JSON Schema validation
+
+The rules are compiled from the dataset.json schema:
+ - required keys
+ - JSON types (also for anyOf where all the options define a type and $ref to definitions)
+ - minLength for single type strings
+ - enum values
+ - item types for arrays (e.g. distribution)
+Just rules that the full schema also applies, so a rejected dataset
+is always invalid. Datasets passing the precheck still need the full validation.
+"""
+import copy
+import json
+import os
+from functools import lru_cache
+
+JSON_TYPES = {
+    'string': (str, ),
+    'array': (list, ),
+    'object': (dict, ),
+    'boolean': (bool, ),
+    'null': (type(None), ),
+    'number': (int, float),
+    'integer': (int, ),
+}
+
+SCHEMAS_FOLDER = os.path.join(os.path.dirname(__file__), 'validation', 'schemas')
+
+
+@lru_cache(maxsize=32)
+def load_schema(validator_schema, name):
+    """ cached schema from ./validation/schemas/{validator_schema}/{name}.json
+        None if not exists """
+    path = os.path.join(SCHEMAS_FOLDER, validator_schema, f'{name}.json')
+    if not os.path.isfile(path):
+        return None
+    f = open(path, 'r')
+    schema = json.load(f)
+    f.close()
+    return schema
+
+
+def build_validator(schema):
+    import jsonschema as jss
+
+    cls = jss.validators.validator_for(schema)
+    cls.check_schema(schema)
+    return cls(schema)
+
+
+def best_match(errors):
+    """ most relevant jsonschema error or None """
+    from jsonschema.exceptions import best_match as jss_best_match
+
+    return jss_best_match(errors)
+
+
+@lru_cache(maxsize=32)
+def get_validator(validator_schema, name):
+    """ cached jsonschema validator (checked schema, resolved refs) """
+    schema = load_schema(validator_schema, name)
+    if schema is None:
+        return None
+    return build_validator(schema)
+
+
+@lru_cache(maxsize=32)
+def get_envelope_validator(validator_schema):
+    """ cached catalog validator without the dataset rules:
+        just the headers and "dataset" as an array """
+    schema = load_schema(validator_schema, 'catalog')
+    if schema is None:
+        return None
+    schema = copy.deepcopy(schema)
+    schema.pop('items', None)  # 1.0 catalogs are a list of datasets
+    if 'dataset' in schema.get('properties', {}):
+        schema['properties']['dataset'] = {'type': 'array'}
+    return build_validator(schema)
+
+
+def is_type(value, json_type):
+    if isinstance(value, bool) and json_type in ['number', 'integer']:
+        return False
+    return isinstance(value, JSON_TYPES[json_type])
+
+
+def resolve(schema, definition):
+    """ follow local $ref: #/definitions/name """
+    ref = definition.get('$ref', '')
+    if ref.startswith('#/definitions/'):
+        return schema.get('definitions', {}).get(ref[len('#/definitions/'):], {})
+    return definition
+
+
+def allowed_types(schema, definition):
+    """ set of JSON types for a property definition or None if unknown """
+    definition = resolve(schema, definition)
+    if 'type' in definition:
+        types = definition['type']
+        return set(types) if isinstance(types, list) else set([types])
+    if 'anyOf' in definition:
+        types = set()
+        for option in definition['anyOf']:
+            option_types = allowed_types(schema, option)
+            if option_types is None:
+                return None
+            types.update(option_types)
+        return types
+    return None
+
+
+class PropertyRule:
+    """ compiled checks for one property """
+
+    def __init__(self, schema, name, definition):
+        self.name = name
+        definition = resolve(schema, definition)
+        self.types = allowed_types(schema, definition)
+        self.min_length = definition.get('minLength') if definition.get('type') == 'string' else None
+        self.enum = definition.get('enum')
+        self.item_types = self.get_item_types(schema, definition)
+
+    @staticmethod
+    def get_item_types(schema, definition):
+        """ types for array items or None if unknown """
+        item_types = set()
+        arrays = [resolve(schema, option) for option in definition.get('anyOf', [definition])]
+        arrays = [option for option in arrays if option.get('type') == 'array']
+        if len(arrays) == 0:
+            return None
+        for option in arrays:
+            types = allowed_types(schema, option['items']) if 'items' in option else None
+            if types is None:
+                return None
+            item_types.update(types)
+        return item_types
+
+    def check(self, value):
+        """ list of errors (jsonschema like messages) """
+        if self.types is not None and not any(is_type(value, t) for t in self.types):
+            if len(self.types) == 1:
+                return [f'{repr(value)} is not of type {repr(list(self.types)[0])}']
+            return [f'{repr(value)} is not valid under any of the given schemas']
+        if self.min_length is not None and isinstance(value, str) and len(value) < self.min_length:
+            return [f'{repr(value)} is too short']
+        if self.enum is not None and value not in self.enum:
+            return [f'{repr(value)} is not one of {repr(self.enum)}']
+        if self.item_types is not None and isinstance(value, list):
+            for item in value:
+                if not any(is_type(item, t) for t in self.item_types):
+                    return [f'{repr(item)} is not valid under any of the given schemas']
+        return []
+
+
+class Precheck:
+    """ fast validation compiled from a dataset schema """
+
+    def __init__(self, schema):
+        self.required = schema.get('required', [])
+        self.rules = [PropertyRule(schema, name, definition)
+                      for name, definition in schema.get('properties', {}).items()]
+
+    def errors(self, dataset, all_errors=False):
+        """ list of errors. Just the first one unless all_errors """
+        if not isinstance(dataset, dict):
+            return [f'{repr(dataset)} is not of type \'object\'']
+
+        errors = []
+        for key in self.required:
+            if key not in dataset:
+                errors.append(f'{repr(key)} is a required property')
+                if not all_errors:
+                    return errors
+
+        for rule in self.rules:
+            if rule.name in dataset:
+                errors += rule.check(dataset[rule.name])
+                if len(errors) > 0 and not all_errors:
+                    return errors
+
+        return errors
+
+
+@lru_cache(maxsize=32)
+def get_precheck(validator_schema, name='dataset'):
+    """ cached Precheck for a schema or None if the schema not exists """
+    schema = load_schema(validator_schema, name)
+    if schema is None:
+        return None
+    return Precheck(schema)
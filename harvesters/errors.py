@@ -0,0 +1,127 @@
+"""
+Bounded, structured harvest errors
+Never keep whole payloads (data.json files, schemas, CKAN responses)
+in the error list: just a truncated excerpt and the position of the problem.
+"""
+import json
+import threading
+import time
+
+from harvesters.logs import logger
+from harvesters.metrics import metrics
+
+MAX_EXCERPT_LENGTH = 300  # chars of the related payload saved with each error
+MAX_ERRORS = 1000  # error budget for a harvest run
+
+
+def truncate(value, max_length=MAX_EXCERPT_LENGTH):
+    """ string version of any value, cut to "max_length" chars """
+    if value is None:
+        return None
+    if isinstance(value, bytes):
+        # do not decode a huge payload just to cut it
+        value = value[:max_length * 4].decode('utf-8', errors='replace')
+    elif not isinstance(value, str):
+        value = repr(value)
+    if len(value) <= max_length:
+        return value
+    return '{}... [{} chars]'.format(value[:max_length], len(value))
+
+
+def byte_offset(text, offset, encoding='utf-8'):
+    """ position in the encoded payload for a char offset (e.g. JSONDecodeError.pos) """
+    return len(text[:offset].encode(encoding, errors='replace'))
+
+
+def excerpt_at(value, offset, max_length=MAX_EXCERPT_LENGTH):
+    """ "max_length" items of a payload around "offset".
+        offset is in chars for a str and in bytes for bytes, never mix them (see byte_offset) """
+    if value is None:
+        return None
+    start = max(0, offset - max_length // 2)
+    return truncate(value[start:start + max_length], max_length=max_length)
+
+
+def validation_message(error, max_length=MAX_EXCERPT_LENGTH):
+    """ short message for a jsonschema ValidationError (or any exception).
+        str(ValidationError) includes the whole schema and instance, we just keep the message and path """
+    message = getattr(error, 'message', None) or str(error)
+    path = '/'.join(str(part) for part in getattr(error, 'absolute_path', []))
+    if path != '':
+        message = '{} at {}'.format(message, path)
+    return truncate(message, max_length=max_length)
+
+
+class HarvestError:
+    """ one error at some harvest stage (fetch, validate, transform, write ...) """
+
+    def __init__(self, code, stage, message, identifier=None, excerpt=None, offset=None,
+                 max_length=MAX_EXCERPT_LENGTH):
+        self.code = code  # short machine readable code, e.g. "json_parse"
+        self.stage = stage
+        self.message = truncate(message, max_length=max_length)
+        self.identifier = identifier  # URL, dataset identifier or package name
+        self.excerpt = truncate(excerpt, max_length=max_length)
+        self.offset = offset  # position of the problem at the payload
+        self.timestamp = time.time()
+
+    def as_dict(self):
+        return {
+            'code': self.code,
+            'stage': self.stage,
+            'message': self.message,
+            'identifier': self.identifier,
+            'excerpt': self.excerpt,
+            'offset': self.offset,
+            'timestamp': self.timestamp,
+        }
+
+    def __str__(self):
+        error = self.message
+        if self.offset is not None:
+            error += ' (offset {})'.format(self.offset)
+        if self.excerpt is not None:
+            error += '. Data: {}'.format(self.excerpt)
+        return error
+
+
+class ErrorLog:
+    """ errors of a harvest run.
+        Just "max_errors" are kept (the rest are counted as dropped).
+        With "path" each error is appended to a JSON lines file when added """
+
+    def __init__(self, max_errors=MAX_ERRORS, max_length=MAX_EXCERPT_LENGTH, path=None):
+        self.max_errors = max_errors
+        self.max_length = max_length
+        self.path = path
+        self.records = []
+        self.dropped = 0
+        self.lock = threading.Lock()
+
+    def add(self, code, stage, message, identifier=None, excerpt=None, offset=None):
+        """ register an error. Returns the HarvestError or None if the budget is exhausted """
+        metrics.inc('harvest_errors', code=code, stage=stage)
+        error = HarvestError(code=code, stage=stage, message=message, identifier=identifier,
+                             excerpt=excerpt, offset=offset, max_length=self.max_length)
+        with self.lock:
+            if len(self.records) >= self.max_errors:
+                self.dropped += 1
+                if self.dropped == 1:
+                    logger.error('Error budget exhausted (%s errors). Dropping the next ones', self.max_errors)
+                return None
+            self.records.append(error)
+            if self.path is not None:
+                f = open(self.path, 'a')
+                f.write(json.dumps(error.as_dict()) + '\n')
+                f.close()
+        return error
+
+    @property
+    def exhausted(self):
+        return len(self.records) >= self.max_errors
+
+    def as_json(self):
+        return [error.as_dict() for error in self.records]
+
+    def __len__(self):
+        return len(self.records)
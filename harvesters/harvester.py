@@ -5,14 +5,14 @@ import json
 import os
 from abc import ABC, abstractmethod
 
-from datapackage import Package, Resource
-from slugify import slugify
+from harvesters.errors import ErrorLog, truncate
 
 
 class HarvesterBaseSource(ABC):
 
     def __init__(self):
-        self.errors = []
+        self.errors = []  # error messages (bounded, see add_error)
+        self.error_log = ErrorLog()  # structured errors. Replace it to change limits or write to disk
         self.datasets = []  # list of data units
         self.duplicates = []  # list of datasets with the same identifier
 
@@ -47,6 +47,16 @@ class HarvesterBaseSource(ABC):
         f.write(dmp)
         f.close()
     
+    def add_error(self, code, stage, message, identifier=None, excerpt=None, offset=None):
+        """ register an error (with a truncated excerpt of the related data, never the whole payload)
+            Returns the error message. Once the error budget is exhausted errors are not saved """
+        error = self.error_log.add(code=code, stage=stage, message=message,
+                                   identifier=identifier, excerpt=excerpt, offset=offset)
+        if error is None:
+            return truncate(message)
+        self.errors.append(str(error))
+        return str(error)
+
     def save_errors(self, path):
         dmp = json.dumps(self.errors, indent=2)
         f = open(path, 'w')
@@ -55,6 +65,9 @@ class HarvesterBaseSource(ABC):
     
     def save_datasets_as_data_packages(self, folder_path, identifier_field):
         """ save each dataset from a data.json source as _datapackage_ """
+        from datapackage import Package, Resource
+        from slugify import slugify
+
         for dataset in self.datasets:
             package = Package()
 
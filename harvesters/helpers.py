@@ -10,10 +10,10 @@ def clean_tags(tags):
     for tag in tags:
         tag = pattern.sub('', tag).strip()
         if len(tag) > settings.MAX_TAG_NAME_LENGTH:
-            logger.error('tag is long, cutting: {}'.format(tag))
+            logger.error('tag is long, cutting: %s', tag)
             tag = tag[:settings.MAX_TAG_NAME_LENGTH]
         elif len(tag) < settings.MIN_TAG_NAME_LENGTH:
-            logger.error('tag is short: {}'.format(tag))
+            logger.error('tag is short: %s', tag)
             tag += '_' * (settings.MIN_TAG_NAME_LENGTH - len(tag))
         if tag != '':
             ret.append(tag.lower().replace(' ', '-'))  # copyin CKAN behaviour
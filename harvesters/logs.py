@@ -1,13 +1,104 @@
+"""
+Harvester logger
+
+Nothing is configured at import time. Call configure_logging() at the
+start of each harvest run: records are put in a queue and a background
+QueueListener writes them to the console and to the log file, so hot
+loops never wait on file writes.
+
+Use lazy formatting (logger.debug('value %s', value)) so messages are
+only built when the level is enabled.
+
+Per-dataset messages are logged with extra=PER_DATASET and can be
+sampled with configure_logging(sample_every=N) on large sources.
+"""
+import itertools
 import logging
+import logging.handlers
+import queue
+
 logger = logging.getLogger(__name__)
 
-c_handler = logging.StreamHandler()
-f_handler = logging.FileHandler('harvest.log')
+# mark per-dataset messages: logger.info('...', extra=PER_DATASET)
+PER_DATASET = {'per_dataset': True}
+
+_listener = None
+_queue_handler = None
+_sample_filter = None
+
+
+class SampleFilter(logging.Filter):
+    """ keep one of every `every` per-dataset records.
+        Warnings and errors are never dropped """
+
+    def __init__(self, every=1):
+        super().__init__()
+        self.every = every
+        self.counter = itertools.count()
+
+    def filter(self, record):
+        if self.every <= 1 or record.levelno >= logging.WARNING:
+            return True
+        if not getattr(record, 'per_dataset', False):
+            return True
+        return next(self.counter) % self.every == 0
+
+
+def configure_logging(log_file='harvest.log',
+                      console_level=logging.INFO,
+                      file_level=logging.DEBUG,
+                      sample_every=1):
+    """ set up the harvester logger for a run.
+        log_file=None disables the file handler.
+        Returns the QueueListener (already started) """
+    global _listener, _queue_handler, _sample_filter
+    stop_logging()
+
+    formatter = logging.Formatter('%(asctime)s %(levelname)s %(message)s')
+    handlers = []
+
+    c_handler = logging.StreamHandler()
+    c_handler.setLevel(console_level)
+    handlers.append(c_handler)
+    levels = [console_level]
+
+    if log_file is not None:
+        f_handler = logging.FileHandler(log_file)
+        f_handler.setLevel(file_level)
+        f_handler.setFormatter(formatter)
+        handlers.append(f_handler)
+        levels.append(file_level)
+
+    log_queue = queue.Queue(-1)
+    _queue_handler = logging.handlers.QueueHandler(log_queue)
+    _sample_filter = SampleFilter(every=sample_every)
+
+    logger.addHandler(_queue_handler)
+    logger.addFilter(_sample_filter)
+    # gate at the logger: disabled levels cost nothing
+    logger.setLevel(min(levels))
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def stop_logging():
+    """ flush pending records and detach the handlers added by configure_logging """
+    global _listener, _queue_handler, _sample_filter
+
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
 
-f_handler.setLevel(logging.DEBUG)
-c_handler.setLevel(logging.INFO)
+    if _queue_handler is not None:
+        logger.removeHandler(_queue_handler)
+        _queue_handler = None
 
-logger.addHandler(c_handler)
-logger.addHandler(f_handler)
+    if _sample_filter is not None:
+        logger.removeFilter(_sample_filter)
+        _sample_filter = None
 
-logger.setLevel(logging.DEBUG)
+    logger.setLevel(logging.NOTSET)
@@ -0,0 +1,179 @@
+"""
+Counters, gauges and histograms for harvest runs
+
+A default registry (`metrics`) is shared by all the harvest stages:
+fetch, validate, transform, resource transform and CKAN API calls.
+Export it at the end of each run:
+
+    from harvesters.metrics import metrics
+    metrics.reset()
+    ... harvest ...
+    metrics.save_json(path)  # JSON summary
+    metrics.save_prometheus(path)  # optional, Prometheus text format
+"""
+import json
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+# seconds
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+class Histogram:
+    """ count, sum, min, max and cumulative buckets for observed values """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.bucket_counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.bucket_counts[i] += 1
+
+    def as_dict(self):
+        return {'count': self.count,
+                'sum': self.sum,
+                'min': self.min,
+                'max': self.max,
+                'avg': self.sum / self.count if self.count else None,
+                'buckets': dict(zip([str(b) for b in self.buckets], self.bucket_counts))}
+
+
+class Metrics:
+    """ metrics registry. Every metric is identified by a name and a set of labels """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.counters = {}
+            self.gauges = {}
+            self.histograms = {}
+            self.started = time.time()
+
+    @staticmethod
+    def key(name, labels):
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        key = self.key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set_gauge(self, name, value, **labels):
+        key = self.key(name, labels)
+        with self.lock:
+            self.gauges[key] = value
+
+    def observe(self, name, value, buckets=DEFAULT_BUCKETS, **labels):
+        key = self.key(name, labels)
+        with self.lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram(buckets=buckets)
+            self.histograms[key].observe(value)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """ observe the elapsed seconds of the block.
+            Yields the labels dict so the block can add labels known
+            only at the end (e.g. an HTTP status) """
+        start = time.perf_counter()
+        try:
+            yield labels
+        except Exception:
+            labels.setdefault('status', 'error')
+            raise
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def timed(self, name, **labels):
+        """ decorator version of timer """
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.timer(name, **labels.copy()):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def get_counter(self, name, **labels):
+        return self.counters.get(self.key(name, labels), 0)
+
+    def get_histogram(self, name, **labels):
+        return self.histograms.get(self.key(name, labels), None)
+
+    def summary(self):
+        """ JSON serializable summary """
+
+        def rows(items, transform=lambda v: v):
+            return [{'name': name, 'labels': dict(labels), 'value': transform(value)}
+                    for (name, labels), value in sorted(items, key=lambda kv: kv[0])]
+
+        with self.lock:
+            return {'started': self.started,
+                    'elapsed': time.time() - self.started,
+                    'counters': rows(self.counters.items()),
+                    'gauges': rows(self.gauges.items()),
+                    'histograms': rows(self.histograms.items(), lambda h: h.as_dict())}
+
+    def save_json(self, path):
+        dmp = json.dumps(self.summary(), indent=2)
+        f = open(path, 'w')
+        f.write(dmp)
+        f.close()
+
+    def as_prometheus(self, prefix='harvester_'):
+        """ Prometheus text exposition format """
+
+        def labels_str(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if len(pairs) == 0:
+                return ''
+            values = ','.join('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"'))
+                              for k, v in pairs)
+            return '{' + values + '}'
+
+        lines = []
+        with self.lock:
+            for kind, items in [('counter', self.counters), ('gauge', self.gauges)]:
+                typed = set()
+                for (name, labels), value in sorted(items.items(), key=lambda kv: kv[0]):
+                    if name not in typed:
+                        lines.append(f'# TYPE {prefix}{name} {kind}')
+                        typed.add(name)
+                    lines.append(f'{prefix}{name}{labels_str(labels)} {value}')
+
+            typed = set()
+            for (name, labels), hist in sorted(self.histograms.items(), key=lambda kv: kv[0]):
+                if name not in typed:
+                    lines.append(f'# TYPE {prefix}{name} histogram')
+                    typed.add(name)
+                for bound, count in zip(hist.buckets, hist.bucket_counts):
+                    lines.append(f'{prefix}{name}_bucket{labels_str(labels, [("le", bound)])} {count}')
+                lines.append(f'{prefix}{name}_bucket{labels_str(labels, [("le", "+Inf")])} {hist.count}')
+                lines.append(f'{prefix}{name}_sum{labels_str(labels)} {hist.sum}')
+                lines.append(f'{prefix}{name}_count{labels_str(labels)} {hist.count}')
+
+        return '\n'.join(lines) + '\n'
+
+    def save_prometheus(self, path, prefix='harvester_'):
+        f = open(path, 'w')
+        f.write(self.as_prometheus(prefix=prefix))
+        f.close()
+
+
+# default registry for harvest runs
+metrics = Metrics()
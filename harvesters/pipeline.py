@@ -0,0 +1,206 @@
+"""
+Streaming harvest pipeline
+
+Stages are chained with bounded queues:
+  fetch -> parse -> dedup -> validate -> transform -> diff -> write
+Each stage runs in its own worker threads, so network bound and CPU bound
+stages overlap. A slow stage fills its input queue and blocks the previous ones
+(backpressure), so memory is bounded by the queue sizes, not by the source size.
+
+    pipeline = Pipeline(source=sources_urls, queue_size=100)
+    pipeline.add_stage('fetch', fetch_data_json, workers=4)
+    pipeline.add_stage('parse', lambda dj: dj.datasets, many=True)
+    pipeline.add_stage('dedup', Deduplicator(field='identifier'))
+    pipeline.add_stage('validate', validate_dataset, workers=2)
+    pipeline.add_stage('transform', transform_dataset, workers=2)
+    pipeline.add_stage('write', ckan_api.upsert_package, workers=4)
+    for result in pipeline.run():
+        ...
+
+A stage function gets one item and returns the next item, or None to drop it.
+With many=True it returns an iterable and each value is sent to the next stage.
+Errors are logged, counted and the item is dropped.
+With more than one worker the order of the items is not kept.
+"""
+import queue
+import threading
+import time
+
+from harvesters.logs import logger
+from harvesters.metrics import metrics
+
+STOP = object()  # end of the stream
+
+
+class Stage:
+    """ a step in the pipeline """
+
+    def __init__(self, name, func, workers=1, queue_size=100, many=False):
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.many = many
+        self.input = queue.Queue(maxsize=queue_size)
+        self.running_workers = workers
+        self.processed = 0
+        self.dropped = 0
+        self.errors = 0
+        self.lock = threading.Lock()
+
+    def stats(self):
+        return {'processed': self.processed, 'dropped': self.dropped, 'errors': self.errors,
+                'queued': self.input.qsize()}
+
+
+class Deduplicator:
+    """ stage function dropping items with an already seen value (e.g. data.json identifier) """
+
+    def __init__(self, field='identifier'):
+        self.field = field
+        self.seen = set()
+        self.duplicates = []
+        self.lock = threading.Lock()
+
+    def __call__(self, item):
+        value = item.get(self.field)
+        with self.lock:
+            if value in self.seen:
+                self.duplicates.append(value)
+                return None
+            self.seen.add(value)
+        return item
+
+
+class Pipeline:
+    """ bounded queues between stages. Iterate run() to get the output of the last stage """
+
+    def __init__(self, source, queue_size=100, on_error=None):
+        self.source = source  # any iterable
+        self.queue_size = queue_size
+        self.on_error = on_error  # function(stage_name, item, exception)
+        self.stages = []
+        self.output = queue.Queue(maxsize=queue_size)
+        self.stopped = threading.Event()
+        self.threads = []
+
+    def add_stage(self, name, func, workers=1, queue_size=None, many=False):
+        """ add a stage at the end. Returns the pipeline """
+        queue_size = self.queue_size if queue_size is None else queue_size
+        self.stages.append(Stage(name, func, workers=workers, queue_size=queue_size, many=many))
+        return self
+
+    def stats(self):
+        return {stage.name: stage.stats() for stage in self.stages}
+
+    def put(self, target, item):
+        """ blocking put (backpressure). False if the pipeline was stopped """
+        while not self.stopped.is_set():
+            try:
+                target.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def get(self, source):
+        """ blocking get. STOP if the pipeline was stopped """
+        while not self.stopped.is_set():
+            try:
+                return source.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return STOP
+
+    def next_queue(self, index):
+        return self.stages[index + 1].input if index + 1 < len(self.stages) else self.output
+
+    def feed(self):
+        """ read the source into the first stage """
+        target = self.next_queue(-1)
+        try:
+            for item in self.source:
+                if not self.put(target, item):
+                    return
+        except Exception as e:
+            logger.error('Pipeline source failed: %s', e)
+            if self.on_error is not None:
+                self.on_error('source', None, e)
+        self.put(target, STOP)
+
+    def work(self, index):
+        stage = self.stages[index]
+        target = self.next_queue(index)
+        while True:
+            item = self.get(stage.input)
+            if item is STOP:
+                with stage.lock:
+                    stage.running_workers -= 1
+                    last = stage.running_workers == 0
+                if last:
+                    self.put(target, STOP)
+                else:
+                    # let the other workers of this stage see it
+                    self.put(stage.input, STOP)
+                return
+
+            metrics.set_gauge('pipeline_queue_size', stage.input.qsize(), stage=stage.name)
+            started = time.time()
+            try:
+                result = stage.func(item)
+                results = [] if result is None else (result if stage.many else [result])
+                count = 0
+                for result in results:
+                    if result is not None and self.put(target, result):
+                        count += 1
+                status = 'ok' if count > 0 else 'dropped'
+            except Exception as e:
+                logger.error('Pipeline stage %s failed: %s', stage.name, e)
+                if self.on_error is not None:
+                    self.on_error(stage.name, item, e)
+                status = 'error'
+
+            metrics.observe('pipeline_stage_seconds', time.time() - started, stage=stage.name)
+            metrics.inc('pipeline_items', stage=stage.name, status=status)
+            with stage.lock:
+                stage.processed += 1
+                if status == 'dropped':
+                    stage.dropped += 1
+                elif status == 'error':
+                    stage.errors += 1
+
+    def start(self):
+        self.stopped.clear()
+        for stage in self.stages:
+            stage.running_workers = stage.workers
+        self.threads = [threading.Thread(target=self.feed, name='pipeline-source', daemon=True)]
+        for index, stage in enumerate(self.stages):
+            for n in range(stage.workers):
+                name = f'pipeline-{stage.name}-{n}'
+                self.threads.append(threading.Thread(target=self.work, args=(index, ), name=name, daemon=True))
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self):
+        """ cancel all the stages """
+        self.stopped.set()
+        for thread in self.threads:
+            thread.join()
+
+    def run(self):
+        """ start the pipeline and yield the results of the last stage """
+        self.start()
+        try:
+            while True:
+                item = self.get(self.output)
+                if item is STOP:
+                    break
+                yield item
+        finally:
+            self.stop()
+
+    def process(self):
+        """ run the pipeline to the end. Returns the number of results """
+        total = 0
+        for _ in self.run():
+            total += 1
+        return total
@@ -0,0 +1,181 @@
+"""
+Harvest many sources at the same time
+
+ - a global worker budget (sources running at the same time)
+ - per host politeness limits (sources of the same host running at the same time)
+ - priorities: most frequent sources first, then the longest (by the last run) and the biggest,
+   so long harvests do not start at the end of the window
+ - each source runs with its own config (harvesters.config.source_config)
+
+    scheduler = HarvestScheduler(run_source=harvest_one, max_workers=16, per_host=2,
+                                 history_path='harvest-history.json')
+    scheduler.add_sources(sources_from_ckan(ckan_api))
+    results = scheduler.run()
+    scheduler.save_history()
+"""
+import json
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import urlparse
+
+from harvesters import config
+from harvesters.logs import logger
+from harvesters.metrics import metrics
+
+# CKAN harvest frequencies. Lower runs first
+FREQUENCY_PRIORITY = {
+    'ALWAYS': 0,
+    'DAILY': 1,
+    'WEEKLY': 2,
+    'BIWEEKLY': 3,
+    'MONTHLY': 4,
+    'MANUAL': 5,
+}
+
+
+def sources_from_ckan(ckan_api, source_type=None):
+    """ harvest sources (dicts) from a CKAN instance (CKANPortalAPI) """
+    sources = []
+    for page in ckan_api.search_harvest_packages(harvest_type='harvest', source_type=source_type):
+        sources += page
+    return sources
+
+
+def source_host(source):
+    return urlparse(source.get('url') or '').netloc.lower()
+
+
+class HarvestScheduler:
+    """ run "run_source(source)" for each harvest source.
+        A source is a dict with at least "name" and "url" (e.g. a CKAN harvest source).
+        Thread-safe history of the last runs is used to sort the sources """
+
+    def __init__(self, run_source,
+                 max_workers=8,  # sources running at the same time
+                 per_host=2,  # sources running at the same time for each host
+                 history_path=None):  # JSON file with the last duration and size of each source
+        if max_workers < 1:
+            raise ValueError(f'max_workers must be at least 1, got {max_workers}')
+        if per_host < 1:
+            raise ValueError(f'per_host must be at least 1, got {per_host}')
+        self.run_source = run_source
+        self.max_workers = max_workers
+        self.per_host = per_host
+        self.history_path = history_path
+
+        self.sources = {}  # name: source
+        self.history = {}  # name: {'duration': seconds, 'datasets': count, 'finished': timestamp}
+        self.results = {}  # name: {'status': 'ok'|'error', 'duration': seconds, 'result'|'error': ...}
+        self.lock = threading.Lock()
+
+        if history_path is not None:
+            self.load_history()
+
+    def load_history(self):
+        if not os.path.isfile(self.history_path):
+            return
+        f = open(self.history_path, 'r')
+        try:
+            self.history = json.load(f)
+        except ValueError as e:
+            logger.error('Invalid harvest history at %s: %s', self.history_path, e)
+            self.history = {}
+        f.close()
+
+    def save_history(self):
+        if self.history_path is None:
+            return
+        with self.lock:
+            dmp = json.dumps(self.history, indent=2)
+        f = open(self.history_path, 'w')
+        f.write(dmp)
+        f.close()
+
+    def add_source(self, source):
+        self.sources[source['name']] = source
+
+    def add_sources(self, sources):
+        for source in sources:
+            self.add_source(source)
+
+    def priority(self, source):
+        """ sort key, lower runs first """
+        frequency = FREQUENCY_PRIORITY.get((source.get('frequency') or 'MANUAL').upper(), len(FREQUENCY_PRIORITY))
+        history = self.history.get(source['name'], {})
+        return (frequency, -history.get('duration', 0), -history.get('datasets', 0), source['name'])
+
+    def ordered_sources(self):
+        return sorted(self.sources.values(), key=self.priority)
+
+    def source_config(self, source):
+        """ isolated config for a source """
+        return config.SourceConfig(SOURCE_NAME=source.get('title') or source['name'],
+                                   SOURCE_ID=source.get('id', ''),
+                                   SOURCE_URL=source.get('url', ''))
+
+    def harvest(self, source):
+        """ run one source with its own config. Never raises """
+        name = source['name']
+        started = time.time()
+        try:
+            with config.source_config(self.source_config(source)):
+                result = self.run_source(source)
+            status = 'ok'
+        except Exception as e:
+            logger.error('Harvest source %s failed: %s', name, e)
+            result = str(e)
+            status = 'error'
+        duration = time.time() - started
+
+        metrics.inc('scheduled_sources', status=status)
+        metrics.observe('source_seconds', duration, source_type=source.get('source_type', 'unknown'))
+
+        with self.lock:
+            entry = {'status': status, 'duration': duration}
+            entry['result' if status == 'ok' else 'error'] = result
+            self.results[name] = entry
+            if status == 'ok':
+                history = {'duration': duration, 'finished': time.time()}
+                if isinstance(result, dict) and 'datasets' in result:
+                    history['datasets'] = result['datasets']
+                elif name in self.history and 'datasets' in self.history[name]:
+                    history['datasets'] = self.history[name]['datasets']
+                self.history[name] = history
+        return entry
+
+    def next_source(self, pending, running_hosts):
+        """ first pending source with a free slot at its host, or None """
+        for source in pending:
+            if running_hosts.get(source_host(source), 0) < self.per_host:
+                return source
+        return None
+
+    def run(self):
+        """ harvest all the sources. Returns the results by source name """
+        pending = self.ordered_sources()
+        running = {}  # future: source
+        running_hosts = {}  # host: sources running
+        logger.info('Scheduling %s harvest sources (%s workers, %s per host)',
+                    len(pending), self.max_workers, self.per_host)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while len(pending) > 0 or len(running) > 0:
+                # fill the free workers, skipping sources of busy hosts
+                while len(running) < self.max_workers:
+                    source = self.next_source(pending, running_hosts)
+                    if source is None:
+                        break
+                    pending.remove(source)
+                    host = source_host(source)
+                    running_hosts[host] = running_hosts.get(host, 0) + 1
+                    running[executor.submit(self.harvest, source)] = source
+
+                metrics.set_gauge('scheduler_pending_sources', len(pending))
+                done, _ = wait(running.keys(), return_when=FIRST_COMPLETED)
+                for future in done:
+                    source = running.pop(future)
+                    running_hosts[source_host(source)] -= 1
+
+        return self.results
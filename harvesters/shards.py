@@ -0,0 +1,436 @@
+"""
+Harvest a big source from many processes or nodes
+
+A fetched data.json catalog (dataset indexes) or a CSW source ("matches" positions)
+is split in shards of N datasets or records. Shards are saved in a durable work queue
+(SQLite by default, any ShardQueue subclass could be used) and workers claim them
+with a lease, transform and write them.
+When all the shards are done, a reconciliation step deletes the packages not at
+the source anymore and fills the collection links between shards.
+
+    queue = SQLiteShardQueue('data/shards.db')
+    queue.put(datajson_shards('my-source', total=len(dj.datasets), size=500,
+                              catalog_hash=content_hash(dj.raw_data_json)))  # a new run
+
+    # at each worker
+    def harvest_shard(shard):
+        check_catalog(shard, content_hash(dj.raw_data_json))  # same catalog as the coordinator
+        ...
+        return result
+
+    worker = ShardWorker(queue, process_shard=harvest_shard)
+    worker.run(source='my-source')
+
+    # once
+    reconciler = ShardReconciler(queue, 'my-source')
+    if reconciler.is_complete():
+        reconciler.apply(ckan_api, existing=index)
+
+Each put() of a new run replaces the shards of the previous run of that source,
+so the queue, the counts and the reconciliation only see the current run.
+
+Shards are index or position ranges, so every node must see the same catalog. Each shard
+keeps the hash of the catalog it was cut from (for CSW e.g. the hash of the ordered
+identifiers): workers check it (check_catalog, CatalogChanged fails the shard) and no
+package is deleted if the shards don't share one known hash.
+
+A shard result is a dict:
+ - identifiers: list of all the source identifiers at the shard
+ - written: {identifier: CKAN package id} for the packages created or updated
+ - links: {child identifier: parent identifier} for isPartOf not solved at the shard
+ - catalog_hash (optional): hash of the catalog the worker used
+"""
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+
+from harvesters.logs import logger
+from harvesters.metrics import metrics
+
+PENDING = 'pending'
+CLAIMED = 'claimed'
+DONE = 'done'
+FAILED = 'failed'
+
+
+def split_range(start, end, size):
+    """ [start, end) in [(start, start + size), ...] """
+    return [(position, min(position + size, end)) for position in range(start, end, size)]
+
+
+def new_run_id():
+    return '{}-{}'.format(time.strftime('%Y%m%d%H%M%S'), uuid.uuid4().hex[:8])
+
+
+def datajson_shards(source, total, size=500, run=None, catalog_hash=None):
+    """ shards of dataset indexes for a fetched data.json (0-based).
+        catalog_hash: content_hash of the fetched data.json """
+    run = run or new_run_id()
+    return [{'source': source, 'run': run, 'kind': 'datajson', 'start': start, 'end': end,
+             'catalog_hash': catalog_hash}
+            for start, end in split_range(0, total, size)]
+
+
+def csw_shards(source, matches, size=500, run=None, catalog_hash=None):
+    """ shards of record positions for a CSW source (1-based, see CSWSource.get_records).
+        catalog_hash: e.g. content_hash of the ordered record identifiers """
+    run = run or new_run_id()
+    return [{'source': source, 'run': run, 'kind': 'csw', 'start': start, 'end': end,
+             'catalog_hash': catalog_hash}
+            for start, end in split_range(1, matches + 1, size)]
+
+
+class CatalogChanged(Exception):
+    """ the worker sees another catalog than the one the shard was cut from """
+    pass
+
+
+def check_catalog(shard, catalog_hash):
+    """ raise CatalogChanged if the worker catalog is not the one of the shard """
+    if shard.get('catalog_hash') is not None and shard['catalog_hash'] != catalog_hash:
+        raise CatalogChanged('Catalog changed for shard {} of {}: {} != {}'.format(
+            shard['id'], shard['source'], catalog_hash, shard['catalog_hash']))
+
+
+def default_owner():
+    return '{}:{}:{}'.format(socket.gethostname(), os.getpid(), threading.get_ident())
+
+
+class ShardQueue(ABC):
+    """ durable queue of shards. Subclass it to use other backends (e.g. Redis, a SQL server) """
+
+    @abstractmethod
+    def put(self, shards):
+        """ add shards (dicts with source, run, kind, start and end).
+            Shards of a new run replace all the shards of the source """
+        pass
+
+    @abstractmethod
+    def current_run(self, source):
+        """ last run put for the source (or None) """
+        pass
+
+    @abstractmethod
+    def clear(self, source):
+        """ remove all the shards of a source """
+        pass
+
+    @abstractmethod
+    def claim(self, owner, source=None, lease_seconds=600, max_attempts=3):
+        """ take the next pending shard (or one with an expired lease) of the current runs.
+            None if there is nothing to do """
+        pass
+
+    @abstractmethod
+    def renew(self, shard_id, owner, lease_seconds=600):
+        """ extend the lease. False if the shard is not ours anymore """
+        pass
+
+    @abstractmethod
+    def complete(self, shard_id, owner, result):
+        """ mark a shard done with its result. False if the shard is not ours anymore """
+        pass
+
+    @abstractmethod
+    def fail(self, shard_id, owner, error, max_attempts=3):
+        """ release a failed shard (pending again until max_attempts) """
+        pass
+
+    @abstractmethod
+    def shards(self, source, status=None):
+        """ list of shards for the current run of a source """
+        pass
+
+    def counts(self, source):
+        """ shards by status """
+        counts = {PENDING: 0, CLAIMED: 0, DONE: 0, FAILED: 0}
+        for shard in self.shards(source):
+            counts[shard['status']] += 1
+        return counts
+
+
+# shards of the last run put for their source
+CURRENT_RUN = ' AND run = (SELECT runs.run FROM runs WHERE runs.source = shards.source)'
+
+
+class SQLiteShardQueue(ShardQueue):
+    """ SQLite work queue. Safe for many processes at the same host or a shared volume """
+
+    def __init__(self, path, timeout=30):
+        self.path = path
+        self.timeout = timeout
+        conn = self.connect()
+        conn.execute('''CREATE TABLE IF NOT EXISTS shards (
+                            id INTEGER PRIMARY KEY AUTOINCREMENT,
+                            source TEXT NOT NULL,
+                            run TEXT NOT NULL,
+                            kind TEXT NOT NULL,
+                            start INTEGER NOT NULL,
+                            "end" INTEGER NOT NULL,
+                            catalog_hash TEXT,
+                            status TEXT NOT NULL DEFAULT 'pending',
+                            owner TEXT,
+                            lease_expires REAL,
+                            attempts INTEGER NOT NULL DEFAULT 0,
+                            result TEXT,
+                            error TEXT,
+                            updated REAL)''')
+        conn.execute('CREATE INDEX IF NOT EXISTS shards_source_status ON shards (source, run, status)')
+        conn.execute('CREATE TABLE IF NOT EXISTS runs (source TEXT PRIMARY KEY, run TEXT NOT NULL, created REAL)')
+        conn.close()
+
+    def connect(self):
+        # a connection for each operation: safe with threads and processes
+        conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    @staticmethod
+    def as_dict(row):
+        shard = dict(row)
+        shard['result'] = None if shard['result'] is None else json.loads(shard['result'])
+        return shard
+
+    def put(self, shards):
+        conn = self.connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            runs = set((s['source'], s['run']) for s in shards)
+            for source, run in runs:
+                row = conn.execute('SELECT run FROM runs WHERE source = ?', (source, )).fetchone()
+                if row is None or row['run'] != run:
+                    # a new run: the shards (and results) of the last one are not valid anymore
+                    deleted = conn.execute('DELETE FROM shards WHERE source = ?', (source, )).rowcount
+                    conn.execute('INSERT OR REPLACE INTO runs (source, run, created) VALUES (?, ?, ?)',
+                                 (source, run, time.time()))
+                    logger.info('New run %s for %s (%s old shards removed)', run, source, deleted)
+            conn.executemany('INSERT INTO shards (source, run, kind, start, "end", catalog_hash, updated) '
+                             'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                             [(s['source'], s['run'], s['kind'], s['start'], s['end'], s.get('catalog_hash'),
+                               time.time()) for s in shards])
+            conn.execute('COMMIT')
+        finally:
+            conn.close()
+        metrics.inc('shards_created', len(shards))
+
+    def current_run(self, source):
+        conn = self.connect()
+        try:
+            row = conn.execute('SELECT run FROM runs WHERE source = ?', (source, )).fetchone()
+        finally:
+            conn.close()
+        return None if row is None else row['run']
+
+    def clear(self, source):
+        conn = self.connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute('DELETE FROM shards WHERE source = ?', (source, ))
+            conn.execute('DELETE FROM runs WHERE source = ?', (source, ))
+            conn.execute('COMMIT')
+        finally:
+            conn.close()
+
+    def claim(self, owner, source=None, lease_seconds=600, max_attempts=3):
+        now = time.time()
+        conn = self.connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')  # one claim at a time
+            # a worker died with the last attempt: the shard will never be done
+            expired = conn.execute('UPDATE shards SET status = ?, error = ?, owner = NULL, lease_expires = NULL, '
+                                   'updated = ? WHERE status = ? AND lease_expires < ? AND attempts >= ?' + CURRENT_RUN,
+                                   (FAILED, 'lease expired', now, CLAIMED, now, max_attempts)).rowcount
+            if expired > 0:
+                logger.error('%s shards failed: lease expired at the last attempt', expired)
+                metrics.inc('shards_lease_expired', expired)
+            query = ('SELECT * FROM shards WHERE (status = ? OR (status = ? AND lease_expires < ?)) '
+                     'AND attempts < ?' + CURRENT_RUN)
+            params = [PENDING, CLAIMED, now, max_attempts]
+            if source is not None:
+                query += ' AND source = ?'
+                params.append(source)
+            row = conn.execute(query + ' ORDER BY id LIMIT 1', params).fetchone()
+            if row is None:
+                conn.execute('COMMIT')
+                return None
+            if row['status'] == CLAIMED:
+                logger.info('Lease expired for shard %s (%s)', row['id'], row['owner'])
+                metrics.inc('shards_lease_expired')
+            conn.execute('UPDATE shards SET status = ?, owner = ?, lease_expires = ?, attempts = attempts + 1, '
+                         'updated = ? WHERE id = ?', (CLAIMED, owner, now + lease_seconds, now, row['id']))
+            row = conn.execute('SELECT * FROM shards WHERE id = ?', (row['id'], )).fetchone()
+            conn.execute('COMMIT')
+        finally:
+            conn.close()
+        return self.as_dict(row)
+
+    def update_owned(self, shard_id, owner, sql, params):
+        """ update a shard just if it's claimed by "owner" """
+        conn = self.connect()
+        try:
+            cursor = conn.execute(sql + ' WHERE id = ? AND owner = ? AND status = ?',
+                                  list(params) + [shard_id, owner, CLAIMED])
+            return cursor.rowcount == 1
+        finally:
+            conn.close()
+
+    def renew(self, shard_id, owner, lease_seconds=600):
+        return self.update_owned(shard_id, owner, 'UPDATE shards SET lease_expires = ?, updated = ?',
+                                 (time.time() + lease_seconds, time.time()))
+
+    def complete(self, shard_id, owner, result):
+        return self.update_owned(shard_id, owner, 'UPDATE shards SET status = ?, result = ?, error = NULL, updated = ?',
+                                 (DONE, json.dumps(result), time.time()))
+
+    def fail(self, shard_id, owner, error, max_attempts=3):
+        conn = self.connect()
+        try:
+            row = conn.execute('SELECT attempts FROM shards WHERE id = ?', (shard_id, )).fetchone()
+        finally:
+            conn.close()
+        status = FAILED if row is not None and row['attempts'] >= max_attempts else PENDING
+        return self.update_owned(shard_id, owner,
+                                 'UPDATE shards SET status = ?, error = ?, owner = NULL, lease_expires = NULL, updated = ?',
+                                 (status, str(error), time.time()))
+
+    def shards(self, source, status=None):
+        conn = self.connect()
+        try:
+            if status is None:
+                rows = conn.execute('SELECT * FROM shards WHERE source = ?' + CURRENT_RUN + ' ORDER BY id',
+                                    (source, )).fetchall()
+            else:
+                rows = conn.execute('SELECT * FROM shards WHERE source = ? AND status = ?' + CURRENT_RUN +
+                                    ' ORDER BY id', (source, status)).fetchall()
+        finally:
+            conn.close()
+        return [self.as_dict(row) for row in rows]
+
+
+class ShardWorker:
+    """ claim shards and run "process_shard(shard)" (returns the shard result) until the queue is empty """
+
+    def __init__(self, queue, process_shard, owner=None, lease_seconds=600, max_attempts=3):
+        self.queue = queue
+        self.process_shard = process_shard
+        self.owner = owner or default_owner()
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+
+    def run(self, source=None, max_shards=None):
+        """ returns the number of shards processed """
+        processed = 0
+        while max_shards is None or processed < max_shards:
+            shard = self.queue.claim(self.owner, source=source, lease_seconds=self.lease_seconds,
+                                     max_attempts=self.max_attempts)
+            if shard is None:
+                break
+            logger.info('Shard %s %s [%s, %s) claimed by %s',
+                        shard['id'], shard['source'], shard['start'], shard['end'], self.owner)
+            started = time.time()
+            try:
+                result = self.process_shard(shard)
+                if isinstance(result, dict) and 'catalog_hash' in result:
+                    check_catalog(shard, result['catalog_hash'])
+            except CatalogChanged as e:
+                # retries would see the same catalog: a new run is needed
+                logger.error(str(e))
+                self.queue.fail(shard['id'], self.owner, e, max_attempts=0)
+                metrics.inc('shards_processed', status='catalog_changed')
+            except Exception as e:
+                logger.error('Shard %s failed: %s', shard['id'], e)
+                self.queue.fail(shard['id'], self.owner, e, max_attempts=self.max_attempts)
+                metrics.inc('shards_processed', status='error')
+            else:
+                if not self.queue.complete(shard['id'], self.owner, result or {}):
+                    # the lease expired and another worker took it
+                    logger.error('Shard %s lost (lease expired)', shard['id'])
+                    metrics.inc('shards_processed', status='lost')
+                else:
+                    metrics.inc('shards_processed', status='done')
+            metrics.observe('shard_seconds', time.time() - started, kind=shard['kind'])
+            processed += 1
+        return processed
+
+
+class ShardReconciler:
+    """ final step for a sharded source: deletions and collection links """
+
+    def __init__(self, queue, source):
+        self.queue = queue
+        self.source = source
+
+    def is_complete(self):
+        counts = self.queue.counts(self.source)
+        return counts[DONE] > 0 and counts[PENDING] == 0 and counts[CLAIMED] == 0 and counts[FAILED] == 0
+
+    def results(self):
+        return [shard['result'] or {} for shard in self.queue.shards(self.source, status=DONE)]
+
+    def identifiers(self):
+        identifiers = set()
+        for result in self.results():
+            identifiers.update(result.get('identifiers', []))
+        return identifiers
+
+    def written(self):
+        written = {}
+        for result in self.results():
+            written.update(result.get('written', {}))
+        return written
+
+    def links(self):
+        links = {}
+        for result in self.results():
+            links.update(result.get('links', {}))
+        return links
+
+    def catalog_hashes(self):
+        """ catalog hashes of the shards and of the worker results """
+        hashes = set()
+        for shard in self.queue.shards(self.source, status=DONE):
+            hashes.add(shard.get('catalog_hash'))
+            if shard['result'] and 'catalog_hash' in shard['result']:
+                hashes.add(shard['result']['catalog_hash'])
+        return hashes
+
+    def to_delete(self, existing):
+        """ CKAN packages (existing: {identifier: package}) not at the source anymore """
+        identifiers = self.identifiers()
+        return {identifier: package for identifier, package in existing.items() if identifier not in identifiers}
+
+    def apply(self, ckan_api, existing, delete=True):
+        """ delete old packages and link children to their parents.
+            existing: {identifier: full package} read from CKAN after all the shards (e.g. show_packages_by_identifier) """
+        if not self.is_complete():
+            raise Exception(f'Shards for {self.source} are not complete: {self.queue.counts(self.source)}')
+
+        report = {'deleted': [], 'linked': [], 'unresolved': []}
+        hashes = self.catalog_hashes()
+        if delete and (len(hashes) != 1 or None in hashes):
+            # ranges from different catalogs could skip records: live packages would be deleted
+            raise Exception(f'Deletions refused for {self.source}: shards from different or unknown catalogs {hashes}')
+        if delete:
+            for identifier, package in self.to_delete(existing).items():
+                ckan_api.delete_package(ckan_package_id_or_name=package['id'])
+                report['deleted'].append(identifier)
+
+        package_ids = {identifier: package['id'] for identifier, package in existing.items()}
+        package_ids.update(self.written())
+        for child, parent in self.links().items():
+            if parent not in package_ids or child not in existing:
+                report['unresolved'].append(child)
+                continue
+            package = existing[child]
+            extras = [extra for extra in package.get('extras', []) if extra['key'] != 'collection_package_id']
+            extras.append({'key': 'collection_package_id', 'value': package_ids[parent]})
+            ckan_api.patch_package({'id': package['id'], 'extras': extras})
+            report['linked'].append(child)
+
+        metrics.inc('shards_reconciled')
+        return report
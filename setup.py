@@ -21,13 +21,14 @@ setuptools.setup(
         'OWSLib>=0.18.0',
         'datapackage>=1.6.2',
         'jsonschema>=3.2.0',
-        'rfc3987>=1.3.8',
-        'validate_email>=1.3',
         'Jinja2>=2.10.1',
         'pathlib>=1.0.1',
         'importlib-resources>=1.0.2',
         'lxml>=4.4.1'
      ],
+     extras_require={
+        'async': ['aiohttp>=3.6'],  # harvester_adapters.ckan.async_api
+     },
      include_package_data=True,
      packages=setuptools.find_packages(exclude=("tests", "tests_with_ckan")),
      keywords=['harvester', 'CKAN'],
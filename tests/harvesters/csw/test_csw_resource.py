@@ -0,0 +1,72 @@
+import mimetypes
+from harvesters.csw.ckan.resource import CSWResource, classify_url, normalize_format_key
+
+
+def sequential_guess(url):
+    """ previous implementation: sequential scans """
+    url = url.lower().strip()
+    resource_types = {
+        'wms': ('service=wms', 'geoserver/wms', 'mapserver/wmsserver', 'com.esri.wms.esrimap', 'service/wms'),
+        'wfs': ('service=wfs', 'geoserver/wfs', 'mapserver/wfsserver', 'com.esri.wfs.esrimap'),
+        'wcs': ('service=wcs', 'geoserver/wcs', 'imageserver/wcsserver', 'mapserver/wcsserver'),
+        'sos': ('service=sos',),
+        'csw': ('service=csw',),
+        'kml': ('mapserver/generatekml',),
+        'arcims': ('com.esri.esrimap.esrimap',),
+        'arcgis_rest': ('arcgis/rest/services',),
+    }
+    for resource_type, parts in resource_types.items():
+        if any(part in url for part in parts):
+            return resource_type
+    for file_type in ['kml', 'kmz', 'gml']:
+        if url.endswith(file_type):
+            return file_type
+    resource_format, encoding = mimetypes.guess_type(url)
+    return resource_format
+
+
+URLS = [
+    'http://geonode.state.gov/geoserver/wms?layers=geonode%3ASyria&width=373&service=WMS&request=GetMap',
+    'https://services.arcgis.com/arcgis/rest/services/Roads/MapServer',
+    'https://services.arcgis.com/arcgis/rest/services/Roads/MapServer?service=WFS',
+    'http://example.com/mapserver/generatekml?x=1',
+    'http://example.com/servlet/com.esri.esrimap.esrimap?ServiceName=x',
+    'http://example.com/servlet/com.esri.wms.Esrimap?ServiceName=x',
+    'http://example.com/ows?SERVICE=CSW&request=GetCapabilities',
+    'http://example.com/ImageServer/WCSServer',
+    'http://example.com/data/file.kmz',
+    'http://example.com/data/file.gml',
+    'http://example.com/data/file.csv',
+    'http://example.com/data/file.zip',
+    'http://example.com/landing-page',
+]
+
+
+class TestCSWResourceFormat(object):
+
+    def test_guess_resource_format(self):
+        res = CSWResource(original_resource={})
+        for url in URLS:
+            assert res.guess_resource_format(url) == sequential_guess(url), url
+
+    def test_normalize_format_key(self):
+        key1 = normalize_format_key('http://Geo.gov/geoserver/wms?layers=a&bbox=1,2,3,4&service=WMS')
+        key2 = normalize_format_key('http://geo.gov/geoserver/wms?layers=b&bbox=5,6,7,8&service=WMS')
+        assert key1 == key2 == 'http://geo.gov/geoserver/wms?service=wms'
+        assert normalize_format_key('http://geo.gov/wms?layers=a') == 'http://geo.gov/wms'
+
+    def test_volatile_params_ignored(self):
+        # the format is guessed without the map request params
+        res = CSWResource(original_resource={})
+        assert res.guess_resource_format('http://geo.gov/data.csv?bbox=1,2,3,4') == 'text/csv'
+        assert res.guess_resource_format('http://geo.gov/export?format=kml&layers=a') == 'kml'
+        assert res.guess_resource_format('http://geo.gov/export?layers=roads.kml') is None
+
+    def test_cache(self):
+        res = CSWResource(original_resource={})
+        classify_url.cache_clear()
+        for i in range(100):
+            assert res.guess_resource_format(f'http://geo.gov/geoserver/wms?layers=layer{i}&service=WMS') == 'wms'
+        info = classify_url.cache_info()
+        assert info.misses == 1
+        assert info.hits == 99
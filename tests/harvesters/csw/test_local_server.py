@@ -0,0 +1,86 @@
+import pytest
+from harvesters.checkpoint import Checkpoint
+from harvesters.csw.harvester import CSWSource
+from harvesters.csw.local_server import LocalCSWServer
+from harvesters.shards import csw_shards
+
+
+@pytest.fixture
+def local_csw():
+    server = LocalCSWServer(synthesize=25, max_page_size=10)
+    server.start()
+    yield server
+    server.stop()
+
+
+class TestLocalCSWServer(object):
+
+    def test_fetch(self, local_csw):
+        csw = CSWSource(url=local_csw.url)
+        csw.fetch()
+        assert csw.csw_info['identification']['title'] == 'Local CSW stand-in'
+        assert local_csw.requests['GetCapabilities'] == 1
+
+    def test_get_records_paging(self, local_csw):
+        csw = CSWSource(url=local_csw.url)
+        csw.fetch()
+
+        # the server caps the page at 10 records
+        records = list(csw.get_records(page=10))
+        assert len(records) == 25
+        assert csw.csw_info['total_records'] == 25
+        assert local_csw.requests['GetRecords'] == 3
+
+        first = records[0]
+        assert first['identifier'] == 'local-csw-record-0000000'
+        assert first['iso_values']['title'] == 'Synthetic dataset 0'
+
+    def test_get_records_resume(self, local_csw, tmp_path):
+        checkpoint_path = str(tmp_path / 'checkpoint.json')
+        csw = CSWSource(url=local_csw.url)
+        csw.fetch()
+
+        records = []
+        for record in csw.get_records(page=10, checkpoint=Checkpoint(path=checkpoint_path)):
+            if len(records) == 15:
+                break  # crash at the second page
+            records.append(record)
+        assert local_csw.requests['GetRecords'] == 2
+
+        # the first page is not fetched again
+        csw = CSWSource(url=local_csw.url)
+        csw.fetch()
+        records = list(csw.get_records(page=10, checkpoint=Checkpoint(path=checkpoint_path)))
+        assert [r['identifier'] for r in records][0] == 'local-csw-record-0000010'
+        assert len(records) == 15
+        assert local_csw.requests['GetRecords'] == 4
+
+    def test_get_records_shards(self, local_csw):
+        csw = CSWSource(url=local_csw.url)
+        csw.fetch()
+        shards = csw_shards('local', csw.get_matches(), size=7)
+        assert [(s['start'], s['end']) for s in shards] == [(1, 8), (8, 15), (15, 22), (22, 26)]
+
+        identifiers = []
+        for shard in shards:
+            records = list(csw.get_records(page=10, start=shard['start'], end=shard['end']))
+            assert len(records) == shard['end'] - shard['start']
+            identifiers += [r['identifier'] for r in records]
+        assert len(set(identifiers)) == 25
+
+    def test_get_record(self, local_csw):
+        csw = CSWSource(url=local_csw.url)
+        csw.fetch()
+        csw.csw_info['records'] = {}
+
+        record = csw.get_record(identifier='local-csw-record-0000003')
+        assert record['identifier'] == 'local-csw-record-0000003'
+        assert local_csw.requests['GetRecordById'] == 1
+
+    def test_records_folder(self, tmp_path):
+        identifier, xml = LocalCSWServer(synthesize=1).records[0]
+        (tmp_path / 'record.xml').write_text(xml)
+        (tmp_path / 'not-a-record.txt').write_text('ignore me')
+
+        server = LocalCSWServer(records_folder=str(tmp_path))
+        assert [idf for idf, _ in server.records] == [identifier]
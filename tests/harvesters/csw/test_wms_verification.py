@@ -0,0 +1,115 @@
+import time
+from harvesters.csw.ckan.resource import CSWResource
+from harvesters.csw.wms_verification import WMSVerifier, normalize_capabilities_url
+
+
+class FakeWMSVerifier(WMSVerifier):
+    """ do not hit the network, count the probes """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.probed = []
+
+    def probe(self, url):
+        self.probed.append(url)
+        return 'geoserver' in url
+
+
+def wms_locator(url):
+    return {'type': 'resource_locator', 'data': {'url': url, 'name': 'layer'}}
+
+
+class TestWMSVerifier(object):
+
+    def test_normalize_capabilities_url(self):
+        url = 'HTTP://Geonode.State.gov/geoserver/wms/?layers=a&request=GetMap'
+        assert normalize_capabilities_url(url) == 'http://geonode.state.gov/geoserver/wms'
+
+    def test_verify_many_dedupes(self):
+        verifier = FakeWMSVerifier()
+        urls = [f'http://geonode.state.gov/geoserver/wms?layers=layer{i}' for i in range(50)]
+        urls.append('http://other.gov/service/wms?service=WMS')
+
+        results = verifier.verify_many(urls)
+        assert len(results) == 51
+        assert results[urls[0]] is True
+        assert results['http://other.gov/service/wms?service=WMS'] is False
+        assert sorted(verifier.probed) == ['http://geonode.state.gov/geoserver/wms',
+                                           'http://other.gov/service/wms']
+
+        verifier.verify(urls[3])  # cached
+        assert len(verifier.probed) == 2
+
+    def test_ttl_and_disk_cache(self, tmp_path):
+        cache_path = str(tmp_path / 'wms-cache.json')
+        verifier = FakeWMSVerifier(cache_path=cache_path)
+        verifier.verify_many(['http://geonode.state.gov/geoserver/wms?layers=a'])
+
+        # a new run reuses the results
+        next_run = FakeWMSVerifier(cache_path=cache_path)
+        assert next_run.verify('http://geonode.state.gov/geoserver/wms?layers=b')
+        assert next_run.probed == []
+
+        # expired
+        expired = FakeWMSVerifier(cache_path=cache_path, ttl=0)
+        time.sleep(0.01)
+        assert expired.verify('http://geonode.state.gov/geoserver/wms?layers=b')
+        assert len(expired.probed) == 1
+
+    def test_resource_verification(self):
+        verifier = FakeWMSVerifier()
+        CSWResource.wms_verifier = verifier
+        try:
+            res = CSWResource(original_resource=wms_locator('http://geonode.state.gov/geoserver/wms?layers=a'))
+            resource = res.transform_to_ckan_resource()
+            assert resource['format'] == 'wms'
+            assert resource['verified']
+
+            # deferred: no network during the transformation
+            CSWResource.defer_wms_verification = True
+            res = CSWResource(original_resource=wms_locator('http://geo.gov/geoserver/wms?layers=b'))
+            resource = res.transform_to_ckan_resource()
+            assert 'verified' not in resource
+            assert verifier.probed == ['http://geonode.state.gov/geoserver/wms']
+
+            verifier.verify_pending()
+            verifier.apply([resource])
+            assert resource['verified']
+        finally:
+            CSWResource.wms_verifier = None
+            CSWResource.defer_wms_verification = False
+
+    def test_failed_probes_are_not_cached_for_long(self, tmp_path):
+        cache_path = str(tmp_path / 'wms-cache.json')
+
+        class FlakyVerifier(FakeWMSVerifier):
+            def probe(self, url):
+                self.probed.append(url)
+                return None  # timeout or 5xx
+
+        verifier = FlakyVerifier(cache_path=cache_path)
+        url = 'http://geonode.state.gov/geoserver/wms?layers=a'
+        assert verifier.verify_many([url]) == {url: False}
+        assert verifier.verify(url) is False  # short negative cache in the same run
+        assert len(verifier.probed) == 1
+
+        # next night the server is back
+        next_run = FakeWMSVerifier(cache_path=cache_path, failure_ttl=0)
+        time.sleep(0.01)
+        assert next_run.verify(url) is True
+        assert len(next_run.probed) == 1
+
+    def test_probe_without_answer(self, monkeypatch):
+        import requests
+
+        class Response:
+            status_code = 503
+            text = 'Service Unavailable'
+
+        monkeypatch.setattr(requests, 'get', lambda url, timeout: Response())
+        assert WMSVerifier().probe('http://geonode.state.gov/geoserver/wms') is None
+
+        def timeout(url, timeout):
+            raise requests.exceptions.Timeout('slow')
+        monkeypatch.setattr(requests, 'get', timeout)
+        assert WMSVerifier().probe('http://geonode.state.gov/geoserver/wms') is None
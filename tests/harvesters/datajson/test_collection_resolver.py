@@ -0,0 +1,61 @@
+from harvesters.datajson.collection_resolver import CollectionResolver
+from harvesters.datajson.harvester import DataJSON
+
+
+class FakeCKAN:
+    def __init__(self, existing):
+        self.existing = existing
+        self.lookups = []
+        self.written = []
+
+    def show_packages_by_identifier(self, identifiers, field='extras_identifier'):
+        self.lookups.append(list(identifiers))
+        return {i: {'id': self.existing[i]} for i in identifiers if i in self.existing}
+
+    def write(self, datasets):
+        self.written.append([d['identifier'] for d in datasets])
+        return [{'success': True, 'result': {'id': 'pkg-' + d['identifier'], 'name': d['identifier']}}
+                for d in datasets]
+
+
+def datasets_from(catalog):
+    dj = DataJSON()
+    dj.read_dict_data_json(data_json_dict={'dataset': catalog})
+    dj.post_fetch()
+    return dj.datasets
+
+
+def test_parents_first():
+    datasets = datasets_from([
+        {'identifier': 'grandchild', 'isPartOf': 'child'},
+        {'identifier': 'child', 'isPartOf': 'root'},
+        {'identifier': 'root'},
+        {'identifier': 'other', 'isPartOf': 'old-parent'},  # parent already in CKAN, not at the source
+        {'identifier': 'lost', 'isPartOf': 'missing'},
+    ])
+    ckan = FakeCKAN(existing={'old-parent': 'pkg-old-parent', 'root': 'pkg-root'})
+    resolver = CollectionResolver(ckan)
+    responses = resolver.write(datasets, write=ckan.write)
+
+    assert ckan.written == [['root', 'other', 'lost'], ['child'], ['grandchild']]
+    assert len(ckan.lookups) == 1  # all the parents at once
+    assert sorted(ckan.lookups[0]) == ['child', 'missing', 'old-parent', 'root']
+    values = {d['identifier']: d.get('collection_pkg_id') for d in datasets}
+    assert values == {'grandchild': 'pkg-child', 'child': 'pkg-root', 'root': None,
+                      'other': 'pkg-old-parent', 'lost': ''}
+    assert [r['result']['name'] for r in responses] == [d['identifier'] for d in datasets]
+    assert datasets[1]['is_collection'] and datasets[2]['is_collection']
+
+
+def test_cycles():
+    datasets = [{'identifier': 'a', 'isPartOf': 'b'}, {'identifier': 'b', 'isPartOf': 'a'},
+                {'identifier': 'c', 'isPartOf': 'c'}]
+    resolver = CollectionResolver()
+    levels = resolver.order(datasets)
+    assert [[d['identifier'] for d in level] for level in levels] == [['a', 'c'], ['b']]
+    assert resolver.cycles == ['a', 'c']
+
+    ckan = FakeCKAN(existing={})
+    resolver.write(datasets, write=ckan.write)
+    assert datasets[1]['collection_pkg_id'] == 'pkg-a'
+    assert datasets[0]['collection_pkg_id'] == ''
@@ -1,3 +1,4 @@
+import logging
 import pytest
 from harvesters.datajson.ckan.dataset import DataJSONSchema1_1
 
@@ -108,6 +109,7 @@ class TestDataJSONDataset(object):
                          'mimetype': 'text/html'}]
 
     def test_transform_to_ckan_dataset(self, test_datajson_dataset, caplog):
+      caplog.set_level(logging.DEBUG, logger='harvesters.logs')
       djs = DataJSONSchema1_1(original_dataset=test_datajson_dataset)
       result = djs.transform_to_ckan_dataset()
 
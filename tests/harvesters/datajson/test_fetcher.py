@@ -0,0 +1,154 @@
+import asyncio
+import json
+import os
+
+from harvesters.datajson.fetcher import DataJSONBatchFetcher
+from harvesters.datajson.harvester import DataJSON
+
+
+class FakeContent:
+    def __init__(self, body):
+        self.body = body
+
+    async def iter_chunked(self, size):
+        for start in range(0, len(self.body), size):
+            await asyncio.sleep(0)
+            yield self.body[start:start + size]
+
+
+class FakeResponse:
+    def __init__(self, status, body=b'', headers=None):
+        self.status = status
+        self.content = FakeContent(body)
+        self.headers = headers or {}
+
+
+class FakeServer:
+    """ aiohttp.ClientSession stand-in with data.json files by URL """
+
+    def __init__(self, files, etags=False):
+        self.files = files
+        self.etags = etags
+        self.running = {}
+        self.max_running = {}
+        self.requests = []
+
+    def get(self, url, headers):
+        return FakeGet(self, url, headers)
+
+    async def close(self):
+        pass
+
+
+class FakeGet:
+    def __init__(self, server, url, headers):
+        self.server = server
+        self.url = url
+        self.headers = headers
+
+    async def __aenter__(self):
+        server = self.server
+        host = self.url.split('/')[2]
+        server.requests.append(self.url)
+        server.running[host] = server.running.get(host, 0) + 1
+        server.max_running[host] = max(server.max_running.get(host, 0), server.running[host])
+        await asyncio.sleep(0.01)
+        server.running[host] -= 1
+
+        body = server.files.get(self.url)
+        if body is None:
+            return FakeResponse(404)
+        if isinstance(body, Exception):
+            raise body
+        etag = '"{}"'.format(hash(body))
+        if server.etags and self.headers.get('If-None-Match') == etag:
+            return FakeResponse(304)
+        return FakeResponse(200, body, headers={'ETag': etag} if server.etags else {})
+
+    async def __aexit__(self, *args):
+        return False
+
+
+def data_json(title):
+    return json.dumps({'dataset': [{'title': title}]}).encode('utf-8')
+
+
+def test_changed_and_unchanged(tmpdir):
+    files = {f'http://host{h}.gov/{n}/data.json': data_json(f'{h}-{n}') for h in range(2) for n in range(4)}
+    files['http://host0.gov/missing/data.json'] = None
+    files['http://host1.gov/slow/data.json'] = asyncio.TimeoutError()
+    server = FakeServer(files)
+
+    fetcher = DataJSONBatchFetcher(cache_folder=str(tmpdir), per_host=2, chunk_size=8)
+    fetcher.get_session = lambda: server
+    sources = list(files.keys())
+    results = fetcher.fetch(sources)
+
+    assert [r.url for r in results] == sources
+    statuses = {r.url: r.status for r in results}
+    assert statuses['http://host0.gov/missing/data.json'] == 'error'
+    assert statuses['http://host1.gov/slow/data.json'] == 'error'
+    assert 'TimeoutError' in results[-1].error
+    assert [r.status for r in results[:8]] == ['changed'] * 8
+    assert max(server.max_running.values()) == 2
+
+    first = results[0]
+    assert first.bytes == len(files[first.url])
+    dj = DataJSON()
+    dj.read_local_data_json(first.path)
+    assert json.loads(dj.raw_data_json)['dataset'][0]['title'] == '0-0'
+
+    # next run: one source changed
+    files['http://host0.gov/1/data.json'] = data_json('new title')
+    fetcher = DataJSONBatchFetcher(cache_folder=str(tmpdir), per_host=2)
+    fetcher.get_session = lambda: server
+    results = fetcher.fetch(sources[:8])
+    assert [r.status for r in results] == ['unchanged', 'changed'] + ['unchanged'] * 6
+    assert not any(name.endswith('.tmp') for name in os.listdir(str(tmpdir)))
+
+
+def test_conditional_requests(tmpdir):
+    files = {'http://a.gov/data.json': data_json('a')}
+    server = FakeServer(files, etags=True)
+    fetcher = DataJSONBatchFetcher(cache_folder=str(tmpdir))
+    fetcher.get_session = lambda: server
+
+    sources = [{'name': 'source-a', 'url': 'http://a.gov/data.json'}]
+    assert fetcher.fetch(sources)[0].status == 'changed'
+    result = fetcher.fetch(sources)[0]
+    assert (result.status, result.http_status, result.bytes) == ('unchanged', 304, len(files['http://a.gov/data.json']))
+    assert result.path == fetcher.cache_path('http://a.gov/data.json', 'source-a')
+    assert os.path.basename(result.path).startswith('source-a-')
+
+
+def test_cache_file_removed(tmpdir):
+    files = {'http://a.gov/data.json': data_json('a')}
+    server = FakeServer(files, etags=True)
+    fetcher = DataJSONBatchFetcher(cache_folder=str(tmpdir))
+    fetcher.get_session = lambda: server
+
+    result = fetcher.fetch(['http://a.gov/data.json'])[0]
+    os.remove(result.path)  # cache cleared, index kept
+
+    result = fetcher.fetch(['http://a.gov/data.json'])[0]
+    assert (result.status, result.http_status) == ('unchanged', 200)
+    assert result.bytes == len(files['http://a.gov/data.json'])
+    assert open(result.path, 'rb').read() == files['http://a.gov/data.json']
+
+
+def test_same_name_and_repeated_urls(tmpdir):
+    files = {'http://a.gov/data.json': data_json('a'), 'http://b.gov/data.json': data_json('b')}
+    server = FakeServer(files)
+    fetcher = DataJSONBatchFetcher(cache_folder=str(tmpdir))
+    fetcher.get_session = lambda: server
+
+    sources = [{'name': 'Agency', 'url': 'http://a.gov/data.json'},
+               {'name': 'agency', 'url': 'http://b.gov/data.json'},
+               'http://a.gov/data.json']
+    results = fetcher.fetch(sources)
+
+    assert sorted(server.requests) == ['http://a.gov/data.json', 'http://b.gov/data.json']
+    assert [r.url for r in results] == ['http://a.gov/data.json', 'http://b.gov/data.json', 'http://a.gov/data.json']
+    assert results[0].path != results[1].path
+    assert open(results[0].path, 'rb').read() == files['http://a.gov/data.json']
+    assert open(results[1].path, 'rb').read() == files['http://b.gov/data.json']
@@ -0,0 +1,66 @@
+import copy
+import pytest
+from harvesters.datajson.precheck import get_precheck, get_validator
+
+SCHEMAS = ['federal', 'federal-v1.1', 'non-federal', 'non-federal-v1.1']
+
+
+def test_precheck_cached():
+    assert get_precheck('federal-v1.1') is get_precheck('federal-v1.1')
+    assert get_validator('federal-v1.1', 'dataset') is get_validator('federal-v1.1', 'dataset')
+    assert get_precheck('unknown-schema') is None
+
+
+def test_precheck_errors(test_datajson_dataset):
+    precheck = get_precheck('federal-v1.1')
+    dataset = copy.deepcopy(test_datajson_dataset)
+    dataset['accessLevel'] = 'public'
+    assert precheck.errors(dataset) == []
+
+    del dataset['identifier']
+    dataset['title'] = ''
+    dataset['keyword'] = [1]
+    assert precheck.errors(dataset) == ["'identifier' is a required property"]
+    assert precheck.errors(dataset, all_errors=True) == ["'identifier' is a required property",
+                                                         "1 is not valid under any of the given schemas",
+                                                         "'' is too short"]
+
+
+@pytest.mark.parametrize('validator_schema', SCHEMAS)
+def test_precheck_rejects_only_invalid(test_datajson_dataset, validator_schema):
+    """ a dataset rejected by the precheck must be invalid for the full schema """
+    precheck = get_precheck(validator_schema)
+    validator = get_validator(validator_schema, 'dataset')
+
+    variants = []
+    for key in list(test_datajson_dataset.keys()):
+        for value in [None, '', [], {}, 1, ['x'], [1], 'x']:
+            dataset = copy.deepcopy(test_datajson_dataset)
+            dataset[key] = value
+            variants.append(dataset)
+        dataset = copy.deepcopy(test_datajson_dataset)
+        del dataset[key]
+        variants.append(dataset)
+
+    for dataset in variants:
+        if precheck.errors(dataset) != []:
+            assert not validator.is_valid(dataset)
+
+
+def test_all_errors_runs_full_schema(test_datajson_dataset):
+    from harvesters.datajson.harvester import DataJSONDataset
+
+    dataset = copy.deepcopy(test_datajson_dataset)
+    dataset['accessLevel'] = 'public'
+    del dataset['identifier']  # precheck error
+    dataset['modified'] = 'yesterday'  # just the full schema knows the pattern
+
+    ds = DataJSONDataset(dataset=dataset)
+    assert not ds.validate(validator_schema='non-federal-v1.1')
+    assert len(ds.errors) == 1 and "'identifier' is a required property" in ds.errors[0]
+
+    ds = DataJSONDataset(dataset=dataset)
+    assert not ds.validate(validator_schema='non-federal-v1.1', all_errors=True)
+    errors = ', '.join(ds.errors)
+    assert "'identifier' is a required property" in errors
+    assert "'yesterday'" in errors and 'modified' in errors
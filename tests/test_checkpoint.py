@@ -0,0 +1,87 @@
+import json
+import os
+
+from harvesters import config
+from harvesters.checkpoint import Checkpoint, content_hash
+from harvesters.datajson.harvester import DataJSON
+from harvesters.metrics import metrics
+
+
+def make_data_json(total):
+    return {'dataset': [{'identifier': f'id-{n}', 'title': f'Dataset {n}'} for n in range(total)]}
+
+
+def test_checkpoint_save_load(tmpdir):
+    path = str(tmpdir.join('checkpoint.json'))
+    checkpoint = Checkpoint(path=path, save_every=2)
+    assert not checkpoint.check_source('hash-1')
+    checkpoint.set_position('csw_startposition', 11)
+    checkpoint.record_write('id-1', 'created')
+    assert not Checkpoint(path=path).is_written('id-1')  # not saved yet
+    checkpoint.record_write('id-2', 'error')
+
+    assert os.listdir(str(tmpdir)) == ['checkpoint.json']  # no temp files left
+    checkpoint = Checkpoint(path=path)
+    assert checkpoint.check_source('hash-1')
+    assert checkpoint.get_position('csw_startposition') == 11
+    assert checkpoint.is_written('id-1')
+    assert not checkpoint.is_written('id-2')
+    assert checkpoint.write_outcome('id-2') == 'error'
+
+    # a new source starts from scratch
+    assert not checkpoint.check_source('hash-2')
+    assert checkpoint.get_position('csw_startposition') is None
+    assert json.load(open(path))['writes'] == {}
+
+    checkpoint.clear()
+    assert not os.path.isfile(path)
+
+
+def test_writes_saved_in_batches(tmpdir):
+    metrics.reset()
+    checkpoint = Checkpoint(path=str(tmpdir.join('checkpoint.json')))
+    for n in range(250):
+        checkpoint.record_write(f'id-{n}', 'created')
+    assert metrics.get_counter('checkpoint_saves') == 2
+    checkpoint.save()
+    assert Checkpoint(path=str(tmpdir.join('checkpoint.json'))).is_written('id-249')
+
+
+def test_default_path(tmpdir):
+    with config.source_config(SOURCE_NAME='My Source', DATA_FOLDER_PATH=str(tmpdir)):
+        checkpoint = Checkpoint()
+    assert checkpoint.path == str(tmpdir.join('my-source', 'checkpoint.json'))
+
+
+def test_resume_datasets(tmpdir):
+    path = str(tmpdir.join('checkpoint.json'))
+    data_json = make_data_json(10)
+
+    dj = DataJSON()
+    dj.read_dict_data_json(data_json)
+    dj.post_fetch()
+    done = []
+    for dataset in dj.iter_datasets(checkpoint=Checkpoint(path=path, save_every=3)):
+        if dataset['identifier'] == 'id-7':
+            break  # crash while processing id-7
+        done.append(dataset['identifier'])
+    assert len(done) == 7
+
+    # resume from the last saved position (6 completed datasets)
+    dj = DataJSON()
+    dj.read_dict_data_json(data_json)
+    dj.post_fetch()
+    resumed = [dataset['identifier'] for dataset in dj.iter_datasets(checkpoint=Checkpoint(path=path))]
+    assert resumed == ['id-6', 'id-7', 'id-8', 'id-9']
+
+    # the source changed: start again
+    dj = DataJSON()
+    dj.read_dict_data_json(make_data_json(3))
+    dj.post_fetch()
+    resumed = [dataset['identifier'] for dataset in dj.iter_datasets(checkpoint=Checkpoint(path=path))]
+    assert resumed == ['id-0', 'id-1', 'id-2']
+
+
+def test_content_hash():
+    assert content_hash(b'abc') == content_hash('abc')
+    assert content_hash({'a': 1, 'b': 2}) == content_hash({'b': 2, 'a': 1})
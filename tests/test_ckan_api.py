@@ -0,0 +1,374 @@
+import json
+import pytest
+import re
+import threading
+from harvester_adapters.ckan.api import CKANPortalAPI, record_type, solr_quote
+from harvesters.checkpoint import Checkpoint
+
+
+class FakeResponse:
+    def __init__(self, result, status_code=200):
+        self.status_code = status_code
+        self.content = json.dumps({'success': True, 'result': result}).encode('utf-8')
+
+
+class FakeCKAN:
+    """ answer package_search requests with fq=field:("a" OR "b") """
+
+    def __init__(self, packages):
+        self.packages = packages
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def request(self, action, method, url, **kwargs):
+        params = kwargs.get('data') or kwargs.get('params')
+        with self.lock:
+            self.calls.append(params)
+        field, values = params['fq'].split(':(', 1)
+        values = [v.replace('\\"', '"') for v in re.findall(r'"((?:[^"\\]|\\.)*)"', values)]
+
+        def value(pkg):
+            if field == 'name':
+                return pkg['name']
+            return [e['value'] for e in pkg['extras'] if e['key'] == 'identifier'][0]
+
+        found = [pkg for pkg in self.packages if value(pkg) in values]
+        start = params['start']
+        page = found[start:start + params['rows']]
+        return FakeResponse({'count': len(found), 'results': page})
+
+
+def build_package(n):
+    return {'id': f'id-{n}', 'name': f'dataset-{n}',
+            'extras': [{'key': 'identifier', 'value': f'ID "{n}"'}]}
+
+
+def test_solr_quote():
+    assert solr_quote('abc') == '"abc"'
+    assert solr_quote('a"b\\c') == '"a\\"b\\\\c"'
+
+
+def test_build_bulk_queries():
+    api = CKANPortalAPI(base_url='http://ckan.local')
+    identifiers = [f'identifier-{n}' for n in range(25)]
+
+    queries = api.build_bulk_queries(identifiers, max_fq_length=200, max_values=10)
+
+    assert [v for _, values in queries for v in values] == identifiers
+    for fq, values in queries:
+        assert len(fq) <= 200
+        assert len(values) <= 10
+        assert fq.startswith('extras_identifier:("identifier-')
+        assert fq.count(' OR ') == len(values) - 1
+
+
+def test_show_packages_by_identifier():
+    packages = [build_package(n) for n in range(100)]
+    fake = FakeCKAN(packages)
+    api = CKANPortalAPI(base_url='http://ckan.local')
+    api.request = fake.request
+
+    identifiers = [f'ID "{n}"' for n in range(0, 100, 2)] + ['not-in-ckan']
+    result = api.show_packages_by_identifier(identifiers, max_values=20)
+
+    assert len(fake.calls) == 3
+    assert len(result) == 50
+    assert result['ID "10"']['name'] == 'dataset-10'
+    assert 'not-in-ckan' not in result
+
+
+def test_show_packages_by_name():
+    fake = FakeCKAN([build_package(n) for n in range(10)])
+    api = CKANPortalAPI(base_url='http://ckan.local')
+    api.request = fake.request
+
+    result = api.show_packages_by_identifier(['dataset-1', 'dataset-2', 'dataset-1'], field='name')
+
+    assert len(fake.calls) == 1
+    assert sorted(result.keys()) == ['dataset-1', 'dataset-2']
+
+
+def test_search_packages_with_fields():
+    pages = [[{'id': 'id-1', 'name': 'dataset-1', 'metadata_modified': '2019-10-01T00:00:00',
+               'extras_identifier': 'ID-1'}],  # "fl" style result
+             [dict(build_package(2), metadata_modified='2019-10-02T00:00:00')],  # CKAN ignored "fl"
+             []]
+    calls = []
+
+    def request(action, method, url, **kwargs):
+        calls.append(kwargs['data'])
+        return FakeResponse({'count': 2, 'results': pages[len(calls) - 1]})
+
+    api = CKANPortalAPI(base_url='http://ckan.local')
+    api.request = request
+    fields = ['name', 'metadata_modified', 'extras_identifier']
+    records = [r for page in api.search_packages(fields=fields) for r in page]
+
+    assert calls[0]['fl'] == ['name', 'metadata_modified', 'extras_identifier', 'id']
+    assert [r.name for r in records] == ['dataset-1', 'dataset-2']
+    assert [r.identifier for r in records] == ['ID-1', 'ID "2"']
+    assert records[1]._fields == ('name', 'metadata_modified', 'identifier')
+
+
+def test_solr_timestamp():
+    from harvester_adapters.ckan.api import solr_timestamp
+    assert solr_timestamp('2019-10-01T12:34:56.123456') == '2019-10-01T12:34:56.123Z'
+    assert solr_timestamp('2019-10-01T12:34:56') == '2019-10-01T12:34:56Z'
+    assert solr_timestamp('2019-10-01T12:34:56.1Z') == '2019-10-01T12:34:56.1Z'
+
+
+class FakeSolrCKAN:
+    """ package_search sorted by (metadata_modified, id) with the keyset filter """
+
+    def __init__(self, packages):
+        self.packages = packages
+        self.calls = []
+
+    def request(self, action, method, url, **kwargs):
+        params = kwargs['data']
+        self.calls.append(params)
+        assert params['sort'] == 'metadata_modified asc, id asc'
+        assert params['start'] == 0
+
+        def key(pkg):
+            return pkg['metadata_modified'][:23], pkg['id']
+
+        found = sorted(self.packages, key=key)
+        match = re.search(r'metadata_modified:\{(\S+)Z TO \*\] OR .* id:\{"(.+)" TO \*\]', params.get('fq', ''))
+        if match is not None:
+            last = (match.group(1), match.group(2))
+            found = [pkg for pkg in found if key(pkg) > last]
+        return FakeResponse({'count': len(found), 'results': found[:params['rows']]})
+
+
+def test_keyset_pagination():
+    # 10 packages, several with the same metadata_modified
+    packages = [{'id': f'id-{n:02d}', 'name': f'dataset-{n}',
+                 'metadata_modified': '2019-10-0{}T00:00:00.000{}'.format(n // 4 + 1, n % 2)}
+                for n in range(10)]
+    fake = FakeSolrCKAN(packages)
+    api = CKANPortalAPI(base_url='http://ckan.local')
+    api.request = fake.request
+
+    names = []
+    for page in api.search_packages(rows=3, pagination='keyset', search_params={'fq': '+organization:test'}):
+        names += [package['name'] for package in page]
+        if len(names) == 3:
+            # a package already returned is updated during the scan
+            packages[0]['metadata_modified'] = '2019-12-01T00:00:00'
+
+    assert sorted(names) == sorted(f'dataset-{n}' for n in range(10))
+    assert len(names) == 10
+    assert fake.calls[1]['fq'].startswith('+organization:test +(metadata_modified:{')
+
+
+def test_unknown_pagination():
+    api = CKANPortalAPI(base_url='http://ckan.local')
+    with pytest.raises(ValueError):
+        list(api.search_packages(pagination='deep'))
+
+
+def test_upsert_packages():
+    existing = [dict(build_package(n), extras=[{'key': 'identifier', 'value': f'ID "{n}"'},
+                                                {'key': 'source_hash', 'value': 'hash-1'}])
+                for n in range(2)]
+    fake = FakeCKAN(existing)
+    actions = []
+
+    def request(action, method, url, **kwargs):
+        actions.append(action)
+        if action == 'package_search':
+            return fake.request(action, method, url, **kwargs)
+        package = json.loads(kwargs['data'])
+        return FakeResponse(package)
+
+    api = CKANPortalAPI(base_url='http://ckan.local', api_key='xxx')
+    api.request = request
+
+    def new_package(n, source_hash):
+        return {'name': f'dataset-{n}', 'extras': [{'key': 'identifier', 'value': f'ID "{n}"'},
+                                                    {'key': 'source_hash', 'value': source_hash}]}
+
+    packages = [new_package(0, 'hash-1'), new_package(1, 'hash-2'), new_package(2, 'hash-1')]
+    results = api.upsert_packages(packages)
+
+    assert [r['upsert'] for r in results] == ['skipped', 'updated', 'created']
+    assert results[1]['result']['id'] == 'id-1'
+    assert sorted(actions) == ['package_create', 'package_search', 'package_update']
+
+
+def test_upsert_packages_resume(tmpdir):
+    checkpoint = Checkpoint(path=str(tmpdir.join('checkpoint.json')))
+    checkpoint.record_write('ID "0"', 'created', package_id='id-0')
+    checkpoint.record_write('ID "1"', 'error')
+    fake = FakeCKAN([])
+    created = []
+
+    def request(action, method, url, **kwargs):
+        if action == 'package_search':
+            return fake.request(action, method, url, **kwargs)
+        package = json.loads(kwargs['data'])
+        created.append(package['name'])
+        package['id'] = package['name'].replace('dataset', 'id')
+        return FakeResponse(package)
+
+    api = CKANPortalAPI(base_url='http://ckan.local', api_key='xxx')
+    api.request = request
+
+    packages = [{'name': f'dataset-{n}', 'extras': [{'key': 'identifier', 'value': f'ID "{n}"'}]}
+                for n in range(3)]
+    results = api.upsert_packages(packages, checkpoint=checkpoint)
+
+    assert [r['upsert'] for r in results] == ['resumed', 'created', 'created']
+    assert results[0]['result'] == {'id': 'id-0'}  # resumed packages keep their id
+    assert sorted(created) == ['dataset-1', 'dataset-2']
+    checkpoint = Checkpoint(path=str(tmpdir.join('checkpoint.json')))
+    assert all(checkpoint.is_written(f'ID "{n}"') for n in range(3))
+    assert checkpoint.package_id('ID "2"') == 'id-2'
+
+
+def test_upsert_with_records():
+    api = CKANPortalAPI(base_url='http://ckan.local', api_key='xxx')
+    api.request = lambda action, method, url, **kwargs: FakeResponse(json.loads(kwargs['data']))
+    record = record_type(('id', 'extras_source_hash'))('id-9', 'old-hash')
+
+    package = {'name': 'dataset-9', 'extras': [{'key': 'source_hash', 'value': 'new-hash'}]}
+    res = api.upsert_package(package, existing=record)
+
+    assert res['upsert'] == 'updated'
+    assert res['result']['id'] == 'id-9'
+    assert 'id' not in package
+
+
+def test_update_package_diff():
+    calls = []
+
+    def request(action, method, url, **kwargs):
+        calls.append((action, json.loads(kwargs['data'])))
+        return FakeResponse({'id': 'pkg-1'})
+
+    api = CKANPortalAPI(base_url='http://ckan.local', api_key='xxx')
+    api.request = request
+    existing = {'id': 'pkg-1', 'name': 'dataset-1', 'title': 'Old', 'extras': [], 'resources': []}
+
+    res = api.update_package_diff({'name': 'dataset-1', 'title': 'Old', 'resources': []}, existing=existing)
+    assert not res['diff'].has_changes
+    assert calls == []
+
+    res = api.upsert_package({'name': 'dataset-1', 'title': 'New', 'resources': []}, existing=existing)
+    assert res['upsert'] == 'updated'
+    assert calls == [('package_patch', {'id': 'pkg-1', 'title': 'New'})]
+
+
+class FakeHarvestCKAN:
+    """ harvest sources and organizations in memory """
+
+    def __init__(self, harvest_sources):
+        self.harvest_sources = harvest_sources
+        self.organizations = {}
+        self.actions = []
+        self.lock = threading.Lock()
+
+    def request(self, action, method, url, **kwargs):
+        data = kwargs.get('data') or kwargs.get('params')
+        if isinstance(data, str):
+            data = json.loads(data)
+        with self.lock:
+            self.actions.append(action)
+            if action == 'package_search':
+                active = [hs for hs in self.harvest_sources if hs.get('state') != 'deleted']
+                start = data['start']
+                return FakeResponse({'count': len(active), 'sort': '', 'facets': {},
+                                     'results': active[start:start + data['rows']]})
+            if action == 'package_delete':
+                for hs in self.harvest_sources:
+                    if hs['id'] == data['id']:
+                        hs['state'] = 'deleted'
+                return FakeResponse(None)
+            if action == 'bulk_update_delete':
+                for hs in self.harvest_sources:
+                    if hs['id'] in data['datasets']:
+                        hs['state'] = 'deleted'
+                return FakeResponse(None)
+            if action == 'organization_show':
+                if data['id'] not in self.organizations:
+                    response = FakeResponse(None, status_code=404)
+                    response.content = json.dumps({'success': False}).encode('utf-8')
+                    return response
+                return FakeResponse(self.organizations[data['id']])
+            if action == 'organization_create':
+                self.organizations[data['name']] = data
+                return FakeResponse(data)
+            if action == 'package_create':
+                self.harvest_sources.append(dict(data, id=f'new-{len(self.harvest_sources)}'))
+                return FakeResponse(data)
+
+
+def build_harvest_source(n, organization='org-1'):
+    return {'id': f'hs-{n}', 'name': f'harvest-source-{n}', 'title': f'Harvest source {n}',
+            'url': f'http://example.com/{n}/data.json', 'notes': '', 'frequency': 'MANUAL',
+            'owner_org': organization,
+            'organization': {'id': organization, 'name': organization, 'title': organization,
+                             'created': '2019-01-01', 'revision_id': 'r1'}}
+
+
+def test_delete_all_harvest_sources():
+    fake = FakeHarvestCKAN([build_harvest_source(n) for n in range(7)])
+    api = CKANPortalAPI(base_url='http://ckan.local', api_key='xxx')
+    api.request = fake.request
+
+    deleted = api.delete_all_harvest_sources()
+
+    # pages are read before deleting, so no page is skipped
+    assert sorted(deleted) == sorted(f'harvest-source-{n}' for n in range(7))
+    assert all(hs['state'] == 'deleted' for hs in fake.harvest_sources)
+
+
+def test_bulk_delete_harvest_sources():
+    sources = [build_harvest_source(n, organization=f'org-{n % 2}') for n in range(6)]
+    fake = FakeHarvestCKAN(sources)
+    api = CKANPortalAPI(base_url='http://ckan.local', api_key='xxx')
+    api.request = fake.request
+
+    deleted = api.delete_harvest_sources(sources, use_bulk=True)
+
+    assert len(deleted) == 6
+    assert fake.actions.count('bulk_update_delete') == 2
+
+
+def test_import_harvest_sources(monkeypatch):
+    external = FakeHarvestCKAN([build_harvest_source(n, organization=f'org-{n % 3}') for n in range(9)])
+    local = FakeHarvestCKAN([])
+    monkeypatch.setattr(CKANPortalAPI, 'request', lambda self, *args, **kwargs: external.request(*args, **kwargs))
+    api = CKANPortalAPI(base_url='http://ckan.local', api_key='xxx')
+    api.request = local.request
+
+    total = api.import_harvest_sources(catalog_url='http://external.ckan', delete_local_harvest_sources=False)
+
+    assert total == 9
+    assert sorted(local.organizations.keys()) == ['org-0', 'org-1', 'org-2']
+    assert local.actions.count('organization_create') == 3
+    assert local.actions.count('package_create') == 9
+    # the external catalog is not modified
+    assert 'id' in external.harvest_sources[0]['organization']
+
+
+def test_update_package_diff_without_resource_ids():
+    calls = []
+
+    def request(action, method, url, **kwargs):
+        calls.append((action, json.loads(kwargs['data'])))
+        return FakeResponse({'id': 'pkg-1'})
+
+    api = CKANPortalAPI(base_url='http://ckan.local', api_key='xxx')
+    api.request = request
+    existing = {'id': 'pkg-1', 'name': 'dataset-1', 'extras': [],
+                'resources': [{'id': 'r1', 'url': 'http://example.com/1.csv', 'name': 'One', 'format': 'CSV',
+                               'position': 0, 'created': '2019-01-01'}]}
+    # transformed packages have no CKAN resource ids
+    new = {'name': 'dataset-1', 'resources': [{'url': 'http://example.com/1.csv', 'name': 'One', 'format': 'CSV'}]}
+
+    res = api.update_package_diff(new, existing=existing)
+    assert not res['diff'].has_changes
+    assert calls == []
+    assert 'id' not in new['resources'][0]
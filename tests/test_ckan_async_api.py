@@ -0,0 +1,140 @@
+import asyncio
+import json
+
+import pytest
+
+from harvester_adapters.ckan.async_api import AsyncCKANPortalAPI, SyncCKANPortalAPI
+
+
+class FakeResponse:
+    def __init__(self, status, body):
+        self.status = status
+        self.body = json.dumps(body).encode('utf-8')
+
+    async def read(self):
+        return self.body
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        return False
+
+
+class FakeSession:
+    """ aiohttp.ClientSession stand-in. Counts the requests running at the same time """
+
+    def __init__(self, packages=(), existing=()):
+        self.packages = list(packages)
+        self.existing = set(existing)
+        self.running = 0
+        self.max_running = 0
+        self.calls = []
+        self.closed = False
+
+    def request(self, method, url, **kwargs):
+        return FakeRequest(self, method, url, kwargs)
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeRequest:
+    def __init__(self, session, method, url, kwargs):
+        self.session = session
+        self.method = method
+        self.url = url
+        self.kwargs = kwargs
+
+    async def __aenter__(self):
+        session = self.session
+        session.running += 1
+        session.max_running = max(session.max_running, session.running)
+        await asyncio.sleep(0.01)
+        session.running -= 1
+        action = self.url.split('/')[-1]
+        session.calls.append(action)
+
+        if action == 'package_search':
+            params = self.kwargs.get('data') or self.kwargs.get('params')
+            start, rows = int(params['start']), int(params['rows'])
+            result = {'count': len(session.packages), 'results': session.packages[start:start + rows]}
+            return FakeResponse(200, {'success': True, 'result': result})
+        if action == 'package_show':
+            name = self.kwargs['params']['id']
+            if name not in session.existing:
+                return FakeResponse(404, {'success': False, 'error': {'message': 'Not found'}})
+            return FakeResponse(200, {'success': True, 'result': {'name': name}})
+        if action == 'package_create':
+            package = json.loads(self.kwargs['data'])
+            if package['name'] in session.existing:
+                return FakeResponse(409, {'success': False, 'error': {'name': ['That URL is already in use.']}})
+            session.existing.add(package['name'])
+            return FakeResponse(200, {'success': True, 'result': package})
+        if action == 'package_delete':
+            session.existing.discard(self.kwargs['data']['id'])
+            return FakeResponse(200, {'success': True, 'result': None})
+        if action == 'organization_show':
+            return FakeResponse(200, {'success': True, 'result': {'id': 'org-1', 'name': self.kwargs['data']['id']}})
+        return FakeResponse(500, {'success': False})
+
+    async def __aexit__(self, *args):
+        return False
+
+
+def fake_api(session, **kwargs):
+    api = SyncCKANPortalAPI(base_url='http://ckan.local', api_key='xxx', **kwargs)
+    api.aio.get_session = lambda: session
+    api.aio.session = session
+    return api
+
+
+def test_search_packages():
+    session = FakeSession(packages=[{'name': f'dataset-{n}'} for n in range(95)])
+    api = fake_api(session, limits={'read': 3})
+    packages = api.search_packages(rows=10)
+    assert [p['name'] for p in packages] == [f'dataset-{n}' for n in range(95)]
+    assert session.calls.count('package_search') == 10
+    assert session.max_running == 3  # limited by the "read" semaphore
+    api.close()
+    assert session.closed
+
+
+def test_create_and_errors():
+    session = FakeSession(existing=['dataset-0'])
+    api = fake_api(session, limits={'write': 2})
+
+    results = api.gather([api.aio.create_package({'name': f'dataset-{n}'}) for n in range(1, 7)])
+    assert [r['result']['name'] for r in results] == [f'dataset-{n}' for n in range(1, 7)]
+    assert session.max_running == 2
+
+    # same semantics as CKANPortalAPI
+    with pytest.raises(Exception, match='DUPLICATED CKAN package'):
+        api.create_package({'name': 'dataset-0'})
+    assert api.create_package({'name': 'dataset-0'}, on_duplicated='SKIP')['result'] == {'name': 'dataset-0'}
+    assert api.create_package({'name': 'dataset-0'}, on_duplicated='DELETE')['success']
+    assert 'package_delete' in session.calls
+
+    with pytest.raises(Exception, match='Status code: 404'):
+        api.show_package('missing')
+    with pytest.raises(Exception, match='Status code: 500'):
+        api.update_package({'name': 'dataset-1'})
+
+
+def test_cached_organization():
+    session = FakeSession()
+    api = fake_api(session)
+    assert api.show_organization('my-org')['result']['id'] == 'org-1'
+    assert api.show_organization('org-1')['result']['name'] == 'my-org'
+    assert session.calls == ['organization_show']
+
+
+def test_missing_aiohttp():
+    try:
+        import aiohttp  # noqa
+        pytest.skip('aiohttp is installed')
+    except ImportError:
+        pass
+    api = AsyncCKANPortalAPI(base_url='http://ckan.local')
+    with pytest.raises(ImportError, match='ckan-harvesters\\[async\\]'):
+        api.get_session()
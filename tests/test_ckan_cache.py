@@ -0,0 +1,67 @@
+import json
+import time
+from harvester_adapters.ckan.api import CKANPortalAPI
+from harvester_adapters.ckan.cache import TTLCache
+
+
+class FakeResponse:
+    def __init__(self, result, status_code=200):
+        self.status_code = status_code
+        self.content = json.dumps({'success': status_code < 400, 'result': result}).encode('utf-8')
+
+
+def test_ttl_cache(tmpdir):
+    path = str(tmpdir.join('ckan-cache.json'))
+    cache = TTLCache(ttl=60, path=path)
+    cache.set('user', 'u1', {'name': 'user 1'})
+    cache.set('user', 'u2', {'name': 'user 2'})
+    assert cache.get('user', 'u1') == {'name': 'user 1'}
+    assert cache.get('organization', 'u1') is None
+
+    cache.invalidate('user', 'u1')
+    assert cache.get('user', 'u1') is None
+    cache.save()
+
+    # reused by the next run
+    cache = TTLCache(ttl=60, path=path)
+    assert cache.get('user', 'u2') == {'name': 'user 2'}
+
+    # expired
+    cache.data['user']['u2']['stored'] = time.time() - 120
+    assert cache.get('user', 'u2') is None
+
+
+def test_cached_organizations_and_users():
+    calls = []
+    organizations = {'org-1': {'id': 'id-org-1', 'name': 'org-1'}}
+
+    def request(action, method, url, **kwargs):
+        calls.append(action)
+        if action == 'organization_show':
+            org = organizations.get(kwargs['data']['id'])
+            return FakeResponse(org, status_code=200 if org else 404)
+        if action == 'organization_create':
+            org = json.loads(kwargs['data'])
+            org['id'] = 'id-' + org['name']
+            organizations[org['name']] = org
+            return FakeResponse(org)
+        return FakeResponse({'id': 'user'})
+
+    api = CKANPortalAPI(base_url='http://ckan.local', api_key='xxx')
+    api.request = request
+
+    for _ in range(3):
+        assert api.create_organization({'name': 'org-1'})['result']['id'] == 'id-org-1'
+    assert api.show_organization('id-org-1')['success']
+    assert calls == ['organization_show']
+
+    # not found is not cached, the created organization is
+    for _ in range(3):
+        assert api.create_organization({'name': 'org-2'})['result']['id'] == 'id-org-2'
+    assert calls == ['organization_show', 'organization_show', 'organization_create']
+
+    for _ in range(2):
+        api.get_user_info('user-1')
+        api.get_admin_users('id-org-1')
+    assert calls.count('user_show') == 1
+    assert calls.count('member_list') == 1
@@ -219,4 +219,32 @@ def test_unknown_validator_schema():
     dj.read_dict_data_json(data_json_dict=test_original_datajson_datasets)
 
     with pytest.raises(Exception):
-        valid = dj.validate(validator_schema='bad validator schema')
\ No newline at end of file
+        valid = dj.validate(validator_schema='bad validator schema')
+
+def test_envelope_validation():
+    # validate just the catalog headers, datasets one by one
+    data_json = dict(test_original_datajson_datasets)
+    data_json['dataset'] = test_original_datajson_datasets['dataset'] + [{'title': 'No identifier'}, 'not a dataset']
+    dj = DataJSON()
+    dj.read_dict_data_json(data_json_dict=data_json)
+    assert dj.validate(validator_schema='non-federal-v1.1', mode='envelope')
+
+    results = list(dj.validate_datasets(validator_schema='non-federal-v1.1'))
+    assert [errors for dataset, errors in results[:2]] == [[], []]
+    assert results[2][1] == ["Error validating dataset: 'description' is a required property"]
+    assert 'is not of type' in results[3][1][0]
+
+
+def test_envelope_validation_errors():
+    dj = DataJSON()
+    dj.read_dict_data_json(data_json_dict={'conformsTo': 'https://project-open-data.cio.gov/v1.1/schema',
+                                           'dataset': {}})
+    assert not dj.validate(validator_schema='non-federal-v1.1', mode='envelope')
+    assert 'Error validating catalog:' in ', '.join(dj.errors)
+
+
+def test_unknown_validation_mode():
+    dj = DataJSON()
+    dj.read_dict_data_json(data_json_dict=test_original_datajson_datasets)
+    with pytest.raises(ValueError):
+        dj.validate(validator_schema='non-federal-v1.1', mode='envelop')
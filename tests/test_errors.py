@@ -0,0 +1,91 @@
+import json
+
+import pytest
+
+from harvesters.csw.ckan.dataset import CSWDataset
+from harvesters.datajson.harvester import DataJSON
+from harvesters.errors import ErrorLog, byte_offset, excerpt_at, truncate
+
+
+def test_truncate():
+    assert truncate(None) is None
+    assert truncate('short') == 'short'
+    assert truncate('x' * 1000, max_length=10) == 'xxxxxxxxxx... [1000 chars]'
+    assert truncate(b'\xc3\xb1and\xc3\xba') == 'ñandú'
+    assert truncate({'a': 1}) == "{'a': 1}"
+
+
+def test_excerpt_at():
+    data = 'a' * 100 + 'ERROR' + 'b' * 100
+    excerpt = excerpt_at(data, offset=100, max_length=20)
+    assert excerpt == 'a' * 10 + 'ERROR' + 'b' * 5
+
+
+def test_error_budget(tmpdir):
+    path = tmpdir.join('errors.jsonl')
+    log = ErrorLog(max_errors=2, max_length=10, path=str(path))
+    first = log.add('json_parse', 'validate', 'Bad JSON', identifier='http://a.gov/data.json',
+                    excerpt='{"dataset": [' + 'x' * 1000, offset=12)
+    log.add('http_error', 'fetch', 'HTTP 500')
+    assert log.add('http_error', 'fetch', 'HTTP 500') is None
+    assert len(log) == 2
+    assert log.dropped == 1
+    assert log.exhausted
+
+    assert first.excerpt == '{"dataset"... [1013 chars]'
+    assert str(first) == 'Bad JSON (offset 12). Data: {"dataset"... [1013 chars]'
+
+    lines = path.read().splitlines()
+    assert len(lines) == 2
+    record = json.loads(lines[0])
+    assert record['code'] == 'json_parse'
+    assert record['stage'] == 'validate'
+    assert record['identifier'] == 'http://a.gov/data.json'
+    assert record['offset'] == 12
+
+
+def test_json_parse_error_is_bounded():
+    dj = DataJSON()
+    dj.raw_data_json = ('{"dataset": [' + '{"title": "ok"}, ' * 100000 + '{bad}]}').encode('utf8')
+    assert not dj.validate(validator_schema='non-federal-v1.1')
+    assert len(dj.errors) == 1
+    assert 'ERROR parsing JSON' in dj.errors[0]
+    assert '{bad}' in dj.errors[0]
+    assert len(dj.errors[0]) < 1000
+
+    record = dj.error_log.records[0]
+    assert record.code == 'json_parse'
+    assert record.offset == len('{"dataset": [' + '{"title": "ok"}, ' * 100000) + 1
+
+
+def test_json_parse_error_non_ascii():
+    dj = DataJSON()
+    prefix = '{"dataset": [' + '{"title": "ñandú"}, ' * 1000
+    dj.raw_data_json = (prefix + '{bad}]}').encode('utf8')
+    assert not dj.validate(validator_schema='non-federal-v1.1')
+
+    record = dj.error_log.records[0]
+    assert record.offset == len(prefix.encode('utf8')) + 1  # bytes, not chars
+    assert '{bad}' in record.excerpt
+    assert byte_offset('ñandú', 2) == 3
+
+
+def test_catalog_error_without_schema():
+    dj = DataJSON()
+    dj.data_json = {'dataset': 'not a list', 'conformsTo': 'https://project-open-data.cio.gov/v1.1/schema'}
+    assert not dj.validate(validator_schema='non-federal-v1.1', mode='envelope')
+    assert 'Error validating catalog:' in dj.errors[0]
+    assert '$schema' not in dj.errors[0]
+    assert dj.error_log.records[0].code == 'invalid_catalog'
+
+
+def test_csw_dataset_error_without_record():
+    record = {'identifier': 'rec-1', 'content': '<gmd:MD_Metadata>' + 'x' * 100000, 'iso_values': {'title': 'T'}}
+    ds = CSWDataset(original_dataset=record)
+    ds.ckan_owner_org_id = 'org-1'
+    ds.required = ['title', 'owner_org', 'not_there']
+    with pytest.raises(Exception) as e:
+        ds.transform_to_ckan_dataset()
+    assert 'rec-1' in str(e.value) and '"not_there" is a required field' in str(e.value)
+    assert 'MD_Metadata' not in str(e.value)
+    assert len(str(e.value)) < 1000
@@ -0,0 +1,58 @@
+""" Short-lived workers import the harvesters on every start. Keep it cheap """
+import os
+import subprocess
+import sys
+
+import pytest
+
+ENTRY_MODULES = ['harvesters.datajson.harvester',
+                 'harvesters.csw.harvester',
+                 'harvesters.csw.wms_verification',
+                 'harvester_adapters.ckan.api']
+
+# loaded on first use, never at import time
+HEAVY_MODULES = ['jsonschema', 'requests', 'datapackage', 'owslib', 'lxml',
+                 'rfc3987', 'validate_email', 'urllib.request']
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# opt-in wall clock check (noisy on shared CI), e.g. IMPORT_TIME_BUDGET=0.15
+# (seconds for each entry module, it was ~0.25s with eager imports)
+IMPORT_BUDGET = os.environ.get('IMPORT_TIME_BUDGET')
+
+
+def run_python(*args):
+    res = subprocess.run([sys.executable] + list(args), stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                         universal_newlines=True, cwd=ROOT, check=True)
+    return res
+
+
+def test_no_heavy_imports():
+    code = 'import sys\nimport {}\nprint(",".join(sorted(sys.modules)))'.format(', '.join(ENTRY_MODULES))
+    modules = run_python('-c', code).stdout.strip().split(',')
+    loaded = [name for name in HEAVY_MODULES if name in modules]
+    assert loaded == []
+
+
+def test_no_log_file_at_import(tmpdir):
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    subprocess.run([sys.executable, '-c', 'import {}'.format(', '.join(ENTRY_MODULES))],
+                   cwd=str(tmpdir), env=env, check=True)
+    assert tmpdir.listdir() == []
+
+
+@pytest.mark.skipif(IMPORT_BUDGET is None, reason='set IMPORT_TIME_BUDGET to check the import time')
+@pytest.mark.parametrize('module', ENTRY_MODULES)
+def test_import_time_budget(module):
+    run_python('-c', f'import {module}')  # warm up .pyc files
+    stderr = run_python('-X', 'importtime', '-c', f'import {module}').stderr
+    # import time: self [us] | cumulative | imported package
+    for line in stderr.splitlines():
+        parts = line.split('|')
+        if len(parts) == 3 and parts[2].strip() == module:
+            cumulative = int(parts[1].strip()) / 1000000
+            break
+    else:
+        raise AssertionError(f'{module} not found at -X importtime output')
+
+    assert cumulative < float(IMPORT_BUDGET)
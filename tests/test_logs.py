@@ -0,0 +1,38 @@
+import logging
+from harvesters.logs import logger, configure_logging, stop_logging, PER_DATASET
+
+
+def test_no_handlers_at_import():
+    assert logger.handlers == []
+
+
+def test_configure_logging(tmp_path):
+    log_file = tmp_path / 'harvest.log'
+    configure_logging(log_file=str(log_file), console_level=logging.WARNING, file_level=logging.INFO)
+    assert logger.level == logging.INFO
+    assert not logger.isEnabledFor(logging.DEBUG)
+
+    logger.info('dataset %s', 'A1')
+    logger.debug('never formatted %s', 'B2')
+    stop_logging()
+
+    content = log_file.read_text()
+    assert 'dataset A1' in content
+    assert 'B2' not in content
+    assert logger.handlers == []
+
+
+def test_sample_per_dataset_messages(tmp_path):
+    log_file = tmp_path / 'harvest.log'
+    configure_logging(log_file=str(log_file), console_level=logging.ERROR, sample_every=10)
+
+    for i in range(100):
+        logger.info('per dataset %s', i, extra=PER_DATASET)
+    logger.info('run summary')
+    logger.warning('bad dataset', extra=PER_DATASET)
+    stop_logging()
+
+    lines = log_file.read_text().splitlines()
+    assert len([line for line in lines if 'per dataset' in line]) == 10
+    assert 'run summary' in lines[-2]
+    assert 'bad dataset' in lines[-1]
@@ -0,0 +1,60 @@
+import json
+import pytest
+from harvesters.metrics import Metrics
+
+
+def test_counters_and_gauges():
+    m = Metrics()
+    m.inc('fetch_bytes', 100, source_type='datajson')
+    m.inc('fetch_bytes', 50, source_type='datajson')
+    m.set_gauge('queue_depth', 3, queue='transform')
+
+    assert m.get_counter('fetch_bytes', source_type='datajson') == 150
+    assert m.get_counter('fetch_bytes', source_type='csw') == 0
+
+    summary = m.summary()
+    assert summary['gauges'] == [{'name': 'queue_depth', 'labels': {'queue': 'transform'}, 'value': 3}]
+
+
+def test_timer_labels():
+    m = Metrics()
+    with m.timer('ckan_api_seconds', action='package_show') as labels:
+        labels['status'] = 200
+
+    with pytest.raises(ValueError):
+        with m.timer('ckan_api_seconds', action='package_show'):
+            raise ValueError('fail')
+
+    assert m.get_histogram('ckan_api_seconds', action='package_show', status=200).count == 1
+    assert m.get_histogram('ckan_api_seconds', action='package_show', status='error').count == 1
+
+
+def test_timed_decorator():
+    m = Metrics()
+
+    @m.timed('transform_seconds', source_type='datajson')
+    def transform(value):
+        return value * 2
+
+    assert transform(2) == 4
+    assert transform(3) == 6
+    hist = m.get_histogram('transform_seconds', source_type='datajson')
+    assert hist.count == 2
+    assert hist.as_dict()['buckets']['120'] == 2
+
+
+def test_exports(tmp_path):
+    m = Metrics()
+    m.inc('ckan_api_requests', action='package_create', status=409)
+    m.observe('validate_seconds', 0.2, scope='dataset')
+
+    json_path = tmp_path / 'metrics.json'
+    m.save_json(str(json_path))
+    summary = json.loads(json_path.read_text())
+    assert summary['histograms'][0]['value']['count'] == 1
+
+    prom = m.as_prometheus()
+    assert '# TYPE harvester_ckan_api_requests counter' in prom
+    assert 'harvester_ckan_api_requests{action="package_create",status="409"} 1' in prom
+    assert 'harvester_validate_seconds_bucket{scope="dataset",le="0.5"} 1' in prom
+    assert 'harvester_validate_seconds_count{scope="dataset"} 1' in prom
@@ -0,0 +1,75 @@
+import threading
+from harvester_adapters.ckan.api import CKANPortalAPI
+from harvester_adapters.ckan.names import NameAllocator
+from harvesters.datajson.ckan.dataset import DataJSONSchema1_1
+
+
+def test_allocate_unique_names():
+    allocator = NameAllocator(names=['annual-report', 'annual-report-1'])
+
+    assert allocator.allocate('annual-report') == 'annual-report-2'
+    assert allocator.allocate('annual-report') == 'annual-report-3'
+    assert allocator.allocate('budget') == 'budget'
+    assert allocator.allocate('budget') == 'budget-1'
+
+
+def test_stable_names_by_identifier(tmpdir):
+    path = str(tmpdir.join('names.json'))
+    allocator = NameAllocator(path=path)
+    assert allocator.allocate('annual-report', identifier='ID-1') == 'annual-report'
+    assert allocator.allocate('annual-report', identifier='ID-2') == 'annual-report-1'
+    assert allocator.allocate('annual-report-new-title', identifier='ID-1') == 'annual-report'
+    allocator.save()
+
+    # next run, reversed order
+    allocator = NameAllocator(path=path)
+    assert allocator.allocate('annual-report', identifier='ID-2') == 'annual-report-1'
+    assert allocator.allocate('annual-report', identifier='ID-1') == 'annual-report'
+    assert allocator.allocate('annual-report', identifier='ID-3') == 'annual-report-2'
+
+
+def test_max_length():
+    allocator = NameAllocator(max_length=10)
+    assert allocator.allocate('a' * 20) == 'a' * 10
+    assert allocator.allocate('a' * 20) == 'a' * 8 + '-1'
+
+
+def test_thread_safe():
+    allocator = NameAllocator()
+    names = []
+
+    def allocate():
+        for _ in range(200):
+            names.append(allocator.allocate('dataset'))
+
+    threads = [threading.Thread(target=allocate) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(set(names)) == 800
+
+
+def test_from_ckan():
+    class FakeAPI:
+        base_url = 'http://ckan.local'
+
+        def search_packages(self, search_params, fields, pagination):
+            yield [('annual-report', 'ID-1'), ('annual-report-1', None)]
+
+    allocator = NameAllocator.from_ckan(FakeAPI())
+    assert allocator.allocate('annual-report', identifier='ID-1') == 'annual-report'
+    assert allocator.allocate('annual-report', identifier='ID-9') == 'annual-report-2'
+
+
+def test_adapter_and_api_names(monkeypatch):
+    allocator = NameAllocator(names=['annual-report'])
+    monkeypatch.setattr(DataJSONSchema1_1, 'name_allocator', allocator)
+    djs = DataJSONSchema1_1(original_dataset={'identifier': 'ID-1', 'title': 'Annual Report'})
+    assert djs.generate_name(title='Annual Report') == 'annual-report-1'
+    assert djs.generate_name(title='Annual Report') == 'annual-report-1'
+
+    api = CKANPortalAPI(base_url='http://ckan.local')
+    api.name_allocator = allocator
+    assert api.generate_name(title='Annual Report') == 'annual-report-2'
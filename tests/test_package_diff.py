@@ -0,0 +1,93 @@
+from harvester_adapters.ckan.package_diff import diff_package
+
+
+def existing_package():
+    return {'id': 'pkg-1', 'name': 'dataset-1', 'title': 'Dataset 1', 'notes': 'Notes',
+            'metadata_modified': '2019-10-01T00:00:00', 'maintainer': None,
+            'tags': [{'name': 'a', 'id': 't1'}, {'name': 'b', 'id': 't2'}],
+            'extras': [{'key': 'modified', 'value': '2019-01-01'},
+                       {'key': 'source_datajson_identifier', 'value': 'True'},
+                       {'key': 'harvest_object_id', 'value': 'ho-1'}],
+            'resources': [{'id': 'r1', 'url': 'http://example.com/1.csv', 'format': 'CSV', 'position': 0},
+                          {'id': 'r2', 'url': 'http://example.com/2.csv', 'format': 'CSV', 'position': 1}]}
+
+
+def transformed_package():
+    return {'name': 'dataset-1', 'title': 'Dataset 1', 'notes': 'Notes', 'maintainer': '',
+            'tag_string': 'b,a',
+            'extras': [{'key': 'modified', 'value': '2019-01-01'},
+                       {'key': 'source_datajson_identifier', 'value': True}],
+            'resources': [{'id': 'r1', 'url': 'http://example.com/1.csv', 'format': 'CSV'},
+                          {'id': 'r2', 'url': 'http://example.com/2.csv', 'format': 'CSV'}]}
+
+
+def test_no_changes():
+    diff = diff_package(new_package=transformed_package(), old_package=existing_package())
+    assert not diff.has_changes
+    assert diff.as_patch() == {'id': 'pkg-1'}
+
+
+def test_changed_fields_and_extras():
+    new = transformed_package()
+    new['title'] = 'New title'
+    new['tag_string'] = 'a,c'
+    new['extras'][0]['value'] = '2019-10-01'
+
+    diff = diff_package(new_package=new, old_package=existing_package())
+
+    patch = diff.as_patch()
+    assert sorted(patch.keys()) == ['extras', 'id', 'tag_string', 'title']
+    assert patch['title'] == 'New title'
+    # extras created at CKAN side are kept
+    assert [e['key'] for e in patch['extras']] == ['modified', 'source_datajson_identifier', 'harvest_object_id']
+
+
+def test_changed_resources():
+    new = transformed_package()
+    new['resources'][1]['format'] = 'JSON'
+    new['resources'].append({'url': 'http://example.com/3.csv', 'format': 'CSV'})
+
+    diff = diff_package(new_package=new, old_package=existing_package())
+
+    assert diff.changed_keys() == ['resources']
+    assert diff.as_patch()['resources'] == new['resources']
+    revise = diff.as_revise()
+    assert revise['match'] == {'id': 'pkg-1'}
+    assert revise['update'] == {}
+    assert revise['update__resources__r2'] == {'format': 'JSON'}
+    assert revise['update__resources__extend'] == [{'url': 'http://example.com/3.csv', 'format': 'CSV'}]
+
+
+def test_removed_resources():
+    new = transformed_package()
+    new['resources'] = new['resources'][:1]
+
+    diff = diff_package(new_package=new, old_package=existing_package())
+
+    assert diff.removed_resources == ['r2']
+    assert diff.as_revise()['update']['resources'] == new['resources']
+
+
+def test_resources_without_ids():
+    new = transformed_package()
+    for res in new['resources']:
+        del res['id']
+    diff = diff_package(new_package=new, old_package=existing_package())
+    assert not diff.has_changes
+
+    new['resources'][0]['format'] = 'ZIP'
+    new['resources'].reverse()
+    diff = diff_package(new_package=new, old_package=existing_package())
+    assert diff.changed_resources == {'r1': {'format': 'ZIP'}}
+    assert diff.removed_resources == [] and diff.added_resources == []
+    assert [res['id'] for res in diff.as_patch()['resources']] == ['r2', 'r1']
+
+
+def test_removed_extras():
+    new = transformed_package()
+    new['extras'] = new['extras'][:1]  # the source dropped an extra
+
+    diff = diff_package(new_package=new, old_package=existing_package())
+    assert diff.changed_keys() == ['extras']
+    assert diff.as_patch()['extras'] == [{'key': 'modified', 'value': '2019-01-01'},
+                                         {'key': 'harvest_object_id', 'value': 'ho-1'}]
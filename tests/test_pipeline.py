@@ -0,0 +1,123 @@
+import copy
+import threading
+import time
+
+from harvesters.datajson.harvester import DataJSON, DataJSONDataset
+from harvesters.metrics import metrics
+from harvesters.pipeline import Deduplicator, Pipeline
+
+
+def test_stages():
+    pipeline = Pipeline(source=range(10))
+    pipeline.add_stage('double', lambda n: n * 2)
+    pipeline.add_stage('odd-drop', lambda n: None if n % 4 == 0 else n)
+    pipeline.add_stage('split', lambda n: [n, n + 1], many=True)
+    assert list(pipeline.run()) == [2, 3, 6, 7, 10, 11, 14, 15, 18, 19]
+
+    stats = pipeline.stats()
+    assert stats['double'] == {'processed': 10, 'dropped': 0, 'errors': 0, 'queued': 0}
+    assert stats['odd-drop']['dropped'] == 5
+    assert stats['split']['processed'] == 5
+
+
+def test_backpressure():
+    produced = []
+    consumed = []
+    max_in_flight = []
+
+    def source():
+        for n in range(300):
+            produced.append(n)
+            yield n
+
+    def slow_write(n):
+        time.sleep(0.001)
+        consumed.append(n)
+        max_in_flight.append(len(produced) - len(consumed))
+        return n
+
+    pipeline = Pipeline(source=source(), queue_size=2)
+    pipeline.add_stage('transform', lambda n: n)
+    pipeline.add_stage('write', slow_write)
+    assert pipeline.process() == 300
+    # 3 queues of 2 items, plus the items in the hands of the source and each stage
+    assert max(max_in_flight) <= 9
+
+
+def test_concurrency_and_errors():
+    lock = threading.Lock()
+    running = [0]
+    max_running = [0]
+    errors = []
+
+    def fetch(n):
+        with lock:
+            running[0] += 1
+            max_running[0] = max(max_running[0], running[0])
+        time.sleep(0.02)
+        with lock:
+            running[0] -= 1
+        if n == 3:
+            raise Exception('HTTP 500')
+        return n
+
+    metrics.reset()
+    pipeline = Pipeline(source=range(12), on_error=lambda stage, item, e: errors.append((stage, item, str(e))))
+    pipeline.add_stage('fetch', fetch, workers=4)
+    results = list(pipeline.run())
+
+    assert sorted(results) == [n for n in range(12) if n != 3]
+    assert max_running[0] == 4
+    assert errors == [('fetch', 3, 'HTTP 500')]
+    assert pipeline.stats()['fetch']['errors'] == 1
+    assert metrics.get_counter('pipeline_items', stage='fetch', status='ok') == 11
+    assert metrics.get_histogram('pipeline_stage_seconds', stage='fetch').count == 12
+
+
+def test_early_stop():
+    pipeline = Pipeline(source=iter(range(100000)), queue_size=5)
+    pipeline.add_stage('transform', lambda n: n, workers=2)
+    results = []
+    for n in pipeline.run():
+        results.append(n)
+        if len(results) == 3:
+            break
+    assert len(results) == 3
+    assert not any(thread.is_alive() for thread in pipeline.threads)
+
+
+def test_datajson_pipeline(test_datajson_dataset):
+    catalogs = []
+    for c in range(3):
+        datasets = []
+        for n in range(5):
+            dataset = copy.deepcopy(test_datajson_dataset)
+            dataset['identifier'] = f'dataset-{n}'  # the same identifiers at each catalog
+            dataset['accessLevel'] = 'public'
+            datasets.append(dataset)
+        del datasets[4]['description']  # invalid
+        catalogs.append({'dataset': datasets})
+
+    def fetch(data_json):
+        dj = DataJSON()
+        dj.read_dict_data_json(data_json)
+        dj.post_fetch()
+        return dj
+
+    def validate(dataset):
+        return dataset if DataJSONDataset(dataset).validate(validator_schema='non-federal-v1.1') else None
+
+    written = []
+    dedup = Deduplicator(field='identifier')
+    pipeline = Pipeline(source=catalogs, queue_size=4)
+    pipeline.add_stage('fetch', fetch, workers=2)
+    pipeline.add_stage('parse', lambda dj: dj.iter_datasets(), many=True)
+    pipeline.add_stage('dedup', dedup)
+    pipeline.add_stage('validate', validate, workers=2)
+    pipeline.add_stage('transform', lambda dataset: {'name': dataset['identifier']}, workers=2)
+    pipeline.add_stage('write', lambda package: written.append(package['name']) or package)
+    pipeline.process()
+
+    assert sorted(written) == ['dataset-0', 'dataset-1', 'dataset-2', 'dataset-3']
+    assert len(dedup.duplicates) == 10
+    assert pipeline.stats()['validate']['dropped'] == 1
@@ -0,0 +1,60 @@
+from harvester_adapters.ckan.resource_merge import merge_resources, normalize_resource_url
+
+
+def test_normalize_resource_url():
+    assert normalize_resource_url(' HTTP://Example.COM/data/ ') == 'http://example.com/data'
+    assert normalize_resource_url('http://example.com/data?year=2019') == 'http://example.com/data?year=2019'
+    assert normalize_resource_url(None) is None
+
+
+def test_merge_by_url():
+    existing = [{'id': '1', 'url': 'http://example.com/a.csv', 'name': 'A', 'format': 'CSV', 'created': '2019-01-01'},
+                {'id': '2', 'url': 'http://example.com/b.csv', 'name': 'B', 'format': 'CSV'},
+                {'id': '3', 'url': 'http://example.com/old.csv', 'name': 'Old', 'format': 'CSV'}]
+    new = [{'url': 'http://EXAMPLE.com/a.csv', 'name': 'A', 'format': 'CSV'},
+           {'url': 'http://example.com/b.csv', 'name': 'B updated', 'format': 'CSV'},
+           {'url': 'http://example.com/c.csv', 'name': 'C', 'format': 'CSV'}]
+
+    merged, report = merge_resources(existing_resources=existing, new_resources=new)
+
+    assert [r.get('id') for r in merged] == ['1', '2', None]
+    assert merged[0]['created'] == '2019-01-01'
+    assert report.as_dict() == {'added': 1, 'kept': 2, 'unchanged': 0, 'removed': 1}
+    assert report.removed[0]['id'] == '3'
+    assert report.has_changes
+
+
+def test_merge_by_name_and_format():
+    existing = [{'id': '1', 'url': 'http://example.com/2018/data.csv', 'name': 'Data', 'format': 'CSV'},
+                {'id': '2', 'url': 'http://example.com/2018/data.json', 'name': 'Data', 'format': 'JSON'}]
+    new = [{'url': 'http://example.com/2019/data.json', 'name': 'Data', 'format': 'JSON'},
+           {'url': 'http://example.com/2019/data.csv', 'name': 'Data', 'format': 'CSV'}]
+
+    merged, report = merge_resources(existing_resources=existing, new_resources=new)
+
+    assert [r['id'] for r in merged] == ['2', '1']
+    assert report.removed == []
+
+
+def test_duplicated_urls_are_matched_once():
+    existing = [{'id': '1', 'url': 'http://example.com/data'},
+                {'id': '2', 'url': 'http://example.com/data'}]
+    new = [{'url': 'http://example.com/data'},
+           {'url': 'http://example.com/data'},
+           {'url': 'http://example.com/data'}]
+
+    merged, report = merge_resources(existing_resources=existing, new_resources=new)
+
+    assert [r.get('id') for r in merged] == ['1', '2', None]
+    assert len(report.added) == 1
+
+
+def test_unchanged():
+    existing = [{'id': '1', 'url': 'http://example.com/a.csv', 'name': 'A', 'format': 'CSV', 'position': 0}]
+    new = [{'url': 'http://example.com/a.csv', 'name': 'A', 'format': 'CSV'}]
+
+    merged, report = merge_resources(existing_resources=existing, new_resources=new)
+
+    assert merged == [{'url': 'http://example.com/a.csv', 'name': 'A', 'format': 'CSV', 'id': '1', 'position': 0}]
+    assert report.as_dict() == {'added': 0, 'kept': 1, 'unchanged': 1, 'removed': 0}
+    assert not report.has_changes
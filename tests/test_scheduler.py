@@ -0,0 +1,111 @@
+import threading
+import time
+
+import pytest
+
+from harvesters import config
+from harvesters.scheduler import HarvestScheduler
+
+
+def make_sources(hosts=3, per_host=4):
+    return [{'name': f'source-{h}-{n}', 'title': f'Source {h} {n}',
+             'url': f'http://host{h}.gov/{n}/data.json', 'frequency': 'WEEKLY'}
+            for h in range(hosts) for n in range(per_host)]
+
+
+class Tracker:
+    """ run_source that counts the sources running at the same time """
+
+    def __init__(self, sleep=0.02):
+        self.sleep = sleep
+        self.lock = threading.Lock()
+        self.running = 0
+        self.max_running = 0
+        self.running_hosts = {}
+        self.max_running_hosts = {}
+        self.order = []
+
+    def __call__(self, source):
+        host = source['url'].split('/')[2]
+        with self.lock:
+            self.order.append(source['name'])
+            self.running += 1
+            self.running_hosts[host] = self.running_hosts.get(host, 0) + 1
+            self.max_running = max(self.max_running, self.running)
+            self.max_running_hosts[host] = max(self.max_running_hosts.get(host, 0), self.running_hosts[host])
+        time.sleep(self.sleep)
+        with self.lock:
+            self.running -= 1
+            self.running_hosts[host] -= 1
+        return {'datasets': 10}
+
+
+def test_limits():
+    tracker = Tracker()
+    scheduler = HarvestScheduler(run_source=tracker, max_workers=4, per_host=2)
+    scheduler.add_sources(make_sources(hosts=3, per_host=4))
+    results = scheduler.run()
+
+    assert len(results) == 12
+    assert all(result['status'] == 'ok' for result in results.values())
+    assert tracker.max_running <= 4
+    assert max(tracker.max_running_hosts.values()) <= 2
+
+
+def test_priority(tmpdir):
+    path = str(tmpdir.join('history.json'))
+    scheduler = HarvestScheduler(run_source=lambda source: {'datasets': 1}, history_path=path)
+    scheduler.history = {'weekly-long': {'duration': 300}, 'weekly-short': {'duration': 3},
+                         'weekly-big': {'duration': 3, 'datasets': 5000}}
+    scheduler.add_sources([
+        {'name': 'manual', 'url': 'http://a.gov', 'frequency': 'MANUAL'},
+        {'name': 'weekly-short', 'url': 'http://a.gov', 'frequency': 'WEEKLY'},
+        {'name': 'weekly-big', 'url': 'http://a.gov', 'frequency': 'WEEKLY'},
+        {'name': 'weekly-long', 'url': 'http://a.gov', 'frequency': 'WEEKLY'},
+        {'name': 'daily', 'url': 'http://a.gov', 'frequency': 'DAILY'},
+    ])
+    names = [source['name'] for source in scheduler.ordered_sources()]
+    assert names == ['daily', 'weekly-long', 'weekly-big', 'weekly-short', 'manual']
+
+    scheduler.run()
+    scheduler.save_history()
+    history = HarvestScheduler(run_source=None, history_path=path).history
+    assert set(history.keys()) == set(names)
+    assert history['weekly-big']['datasets'] == 1
+
+
+def test_isolated_config_and_errors():
+    seen = {}
+
+    def run_source(source):
+        time.sleep(0.01)
+        if source['name'] == 'source-1-0':
+            raise Exception('Bad source')
+        seen[source['name']] = (config.get('SOURCE_URL'), config.get('DATA_FOLDER_PATH'))
+
+    scheduler = HarvestScheduler(run_source=run_source, max_workers=6)
+    scheduler.add_sources(make_sources(hosts=3, per_host=2))
+    results = scheduler.run()
+
+    assert results['source-1-0'] == {'status': 'error', 'duration': results['source-1-0']['duration'],
+                                     'error': 'Bad source'}
+    for source in make_sources(hosts=3, per_host=2):
+        if source['name'] != 'source-1-0':
+            assert seen[source['name']] == (source['url'], config.DATA_FOLDER_PATH)
+    # the module values are not changed
+    assert config.get('SOURCE_URL') == config.SOURCE_URL == ''
+
+
+def test_source_config(tmpdir):
+    with config.source_config(SOURCE_NAME='Dep of Agriculture', DATA_FOLDER_PATH=str(tmpdir)):
+        assert config.get('SOURCE_NAME') == 'Dep of Agriculture'
+        assert config.get('LIMIT_DATASETS') == config.LIMIT_DATASETS
+        assert config.get_base_path() == str(tmpdir.join('dep-of-agriculture'))
+    assert config.get('SOURCE_NAME') == ''
+
+
+def test_invalid_limits():
+    with pytest.raises(ValueError):
+        HarvestScheduler(run_source=lambda source: None, per_host=0)
+    with pytest.raises(ValueError):
+        HarvestScheduler(run_source=lambda source: None, max_workers=0)
@@ -0,0 +1,174 @@
+import threading
+
+import pytest
+
+from harvesters.shards import (CatalogChanged, ShardReconciler, ShardWorker, SQLiteShardQueue, check_catalog,
+                               datajson_shards, split_range)
+
+
+class FakeCKAN:
+    def __init__(self):
+        self.deleted = []
+        self.patched = []
+
+    def delete_package(self, ckan_package_id_or_name):
+        self.deleted.append(ckan_package_id_or_name)
+
+    def patch_package(self, ckan_package):
+        self.patched.append(ckan_package)
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return SQLiteShardQueue(str(tmp_path / 'shards.db'))
+
+
+def test_split_range():
+    assert split_range(0, 10, 4) == [(0, 4), (4, 8), (8, 10)]
+    assert split_range(0, 0, 4) == []
+    assert [(s['start'], s['end']) for s in datajson_shards('src', 5, size=5)] == [(0, 5)]
+
+
+def test_workers_share_the_queue(queue):
+    datasets = [{'identifier': f'id-{n}'} for n in range(95)]
+    queue.put(datajson_shards('src', total=len(datasets), size=10))
+    seen = []
+    lock = threading.Lock()
+
+    def process_shard(shard):
+        identifiers = [d['identifier'] for d in datasets[shard['start']:shard['end']]]
+        with lock:
+            seen.extend(identifiers)
+        return {'identifiers': identifiers}
+
+    workers = [ShardWorker(queue, process_shard, owner=f'node-{n}') for n in range(4)]
+    threads = [threading.Thread(target=worker.run, kwargs={'source': 'src'}) for worker in workers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(seen) == sorted(d['identifier'] for d in datasets)
+    assert queue.counts('src') == {'pending': 0, 'claimed': 0, 'done': 10, 'failed': 0}
+    assert len(ShardReconciler(queue, 'src').identifiers()) == 95
+
+
+def test_lease_and_failures(queue):
+    queue.put(datajson_shards('src', total=20, size=10))
+    shard = queue.claim('node-a', lease_seconds=-1)  # already expired
+    # another node takes it, the first one can't complete it
+    again = queue.claim('node-b')
+    assert again['id'] == shard['id'] and again['attempts'] == 2
+    assert not queue.complete(shard['id'], 'node-a', {})
+    assert queue.complete(shard['id'], 'node-b', {'identifiers': ['a']})
+
+    def broken(shard):
+        raise ValueError('bad shard')
+
+    assert ShardWorker(queue, broken, max_attempts=2).run(source='src') == 2
+    counts = queue.counts('src')
+    assert (counts['done'], counts['failed']) == (1, 1)
+    assert queue.shards('src', status='failed')[0]['error'] == 'bad shard'
+    assert not ShardReconciler(queue, 'src').is_complete()
+
+
+def test_reconcile(queue):
+    queue.put(datajson_shards('src', total=4, size=2, catalog_hash='hash-1'))
+    worker = ShardWorker(queue, lambda shard: None, owner='node')
+    results = [{'identifiers': ['parent', 'child-1'], 'written': {'parent': 'pkg-parent'}},
+               {'identifiers': ['child-2', 'new'], 'links': {'child-1': 'parent', 'child-2': 'parent'}}]
+    worker.process_shard = lambda shard: results[shard['start'] // 2]
+    worker.run()
+
+    existing = {
+        'parent': {'id': 'pkg-parent', 'extras': []},
+        'child-1': {'id': 'pkg-1', 'extras': [{'key': 'identifier', 'value': 'child-1'}]},
+        'child-2': {'id': 'pkg-2', 'extras': [{'key': 'collection_package_id', 'value': ''}]},
+        'old': {'id': 'pkg-old', 'extras': []},
+    }
+    ckan = FakeCKAN()
+    report = ShardReconciler(queue, 'src').apply(ckan, existing=existing)
+
+    assert report['deleted'] == ['old'] and ckan.deleted == ['pkg-old']
+    assert sorted(report['linked']) == ['child-1', 'child-2']
+    patched = {p['id']: p['extras'] for p in ckan.patched}
+    assert patched['pkg-1'] == [{'key': 'identifier', 'value': 'child-1'},
+                                {'key': 'collection_package_id', 'value': 'pkg-parent'}]
+    assert patched['pkg-2'] == [{'key': 'collection_package_id', 'value': 'pkg-parent'}]
+
+
+def test_reconcile_requires_all_shards(queue):
+    queue.put(datajson_shards('src', total=4, size=2))
+    ShardWorker(queue, lambda shard: {}).run(max_shards=1)
+    with pytest.raises(Exception):
+        ShardReconciler(queue, 'src').apply(FakeCKAN(), existing={})
+
+
+def test_lease_expired_at_last_attempt(queue):
+    queue.put(datajson_shards('src', total=20, size=10))
+    for owner in ('node-a', 'node-b'):
+        queue.claim(owner, lease_seconds=-1, max_attempts=1)  # both workers die
+    assert queue.claim('node-c', max_attempts=1) is None
+
+    assert queue.counts('src') == {'pending': 0, 'claimed': 0, 'done': 0, 'failed': 2}
+    assert [shard['error'] for shard in queue.shards('src')] == ['lease expired', 'lease expired']
+    with pytest.raises(Exception):
+        ShardReconciler(queue, 'src').apply(FakeCKAN(), existing={})
+
+
+def test_new_run_replaces_the_last_one(queue):
+    # first night: one shard fails for good
+    queue.put(datajson_shards('src', total=4, size=2, run='night-1'))
+    ShardWorker(queue, lambda shard: {'identifiers': ['old']}).run(max_shards=1)
+    ShardWorker(queue, lambda shard: 1 / 0, max_attempts=1).run()
+    assert queue.counts('src')['failed'] == 1
+
+    # second night
+    queue.put(datajson_shards('src', total=4, size=2, run='night-2'))
+    assert queue.current_run('src') == 'night-2'
+    assert queue.counts('src') == {'pending': 2, 'claimed': 0, 'done': 0, 'failed': 0}
+    ShardWorker(queue, lambda shard: {'identifiers': [f'id-{shard["start"]}']}).run()
+
+    reconciler = ShardReconciler(queue, 'src')
+    assert reconciler.is_complete()
+    assert reconciler.identifiers() == {'id-0', 'id-2'}
+
+    queue.clear('src')
+    assert queue.current_run('src') is None and queue.shards('src') == []
+
+
+def test_catalog_changed(queue):
+    queue.put(datajson_shards('src', total=4, size=2, catalog_hash='hash-1'))
+
+    def harvest_shard(shard):
+        check_catalog(shard, 'hash-1' if shard['start'] == 0 else 'hash-2')  # the second node sees a new file
+        return {'identifiers': ['a']}
+
+    ShardWorker(queue, harvest_shard).run()
+    failed = queue.shards('src', status='failed')
+    assert len(failed) == 1 and failed[0]['attempts'] == 1  # no retries
+    assert 'Catalog changed' in failed[0]['error']
+    with pytest.raises(CatalogChanged):
+        check_catalog(failed[0], 'hash-3')
+
+
+def test_deletions_need_one_catalog(queue):
+    existing = {'a': {'id': 'pkg-a', 'extras': []}, 'old': {'id': 'pkg-old', 'extras': []}}
+    # unknown catalog
+    queue.put(datajson_shards('src', total=2, size=1))
+    ShardWorker(queue, lambda shard: {'identifiers': ['a']}).run()
+    reconciler = ShardReconciler(queue, 'src')
+    with pytest.raises(Exception):
+        reconciler.apply(FakeCKAN(), existing=existing)
+    assert reconciler.apply(FakeCKAN(), existing=existing, delete=False)['deleted'] == []
+
+    # shards from two catalogs in the same run
+    queue.put(datajson_shards('src', total=2, size=1, catalog_hash='hash-1'))
+    ShardWorker(queue, lambda shard: {'identifiers': ['a']}).run(max_shards=1)
+    queue.put([dict(datajson_shards('src', total=2, size=1, run=queue.current_run('src'),
+                                    catalog_hash='hash-2')[1], start=5, end=6)])
+    ShardWorker(queue, lambda shard: {'identifiers': ['a']}).run()
+    ckan = FakeCKAN()
+    with pytest.raises(Exception):
+        reconciler.apply(ckan, existing=existing)
+    assert ckan.deleted == []